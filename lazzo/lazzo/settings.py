@@ -46,12 +46,18 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.middleware.UsuarioActualMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 MESSAGE_STORAGE = "django.contrib.messages.storage.session.SessionStorage"
 
+# Sesiones leídas desde la caché (django_session solo si no están en ella) y
+# escritas solo cuando cambian. Ver main/sesiones.py; para comparar con el
+# motor por defecto: python manage.py benchmark_sesiones
+SESSION_ENGINE = "main.sesiones"
+
 ROOT_URLCONF = 'lazzo.urls'
 
 TEMPLATES = [
@@ -65,6 +71,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'main.context_processors.carrito_context',
+                'main.context_processors.categorias_context',
             ],
         },
     },
@@ -90,6 +97,34 @@ DATABASES = {
     }
 }
 
+# Los pedidos archivados (manage.py archivar_pedidos) van a esta base. Para
+# sacarlos del servidor principal, agregar otra entrada en DATABASES (p. ej.
+# "archivo"), apuntar ARCHIVO_DB a ella y correr:
+#   python manage.py migrate main --database=archivo
+ARCHIVO_DB = 'default'
+DATABASE_ROUTERS = ['main.routers.RouterArchivo']
+
+# Caché compartida entre todos los workers. Los índices en memoria de
+# productos (main/sincronizacion.py), los carritos y las sesiones la usan
+# para enterarse de lo que cambió en otro proceso: con la LocMemCache cada
+# worker tendría su propia copia. En producción se indica con REDIS_URL
+# (p. ej. redis://127.0.0.1:6379/1; necesita el paquete ``redis``, ver
+# requirements.txt). Sin ella, para desarrollo con un solo proceso
+# (runserver), queda la caché en memoria.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -133,7 +168,41 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Cómo entrega los archivos de media la vista media_servir: None (los lee
+# Django, con Range y ETag), "x-sendfile" (Apache/lighttpd) o
+# "x-accel-redirect" (nginx, con una location internal en MEDIA_ACCEL_PREFIJO)
+MEDIA_ENVIO = None
+MEDIA_ACCEL_PREFIJO = '/protegido/media/'
+
+# Las subidas se guardan por su contenido (sha256): una imagen repetida ocupa
+# un solo archivo y sus URLs no cambian nunca. Ver main/almacenamiento.py
+STORAGES = {
+    "default": {"BACKEND": "main.almacenamiento.AlmacenamientoContenido"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Carrito de compras: "bd" (Carrito/ObjetoCarrito en MySQL) o "cache"
+# (write-back en la caché; requiere una caché compartida entre workers,
+# p. ej. Redis o Memcached, y correr periódicamente persistir_carritos)
+CARRITO_ALMACEN = 'bd'
+CARRITO_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Segundos que se guarda en caché el usuario logueado (request.usuario).
+# Guardar el perfil invalida la copia al instante; esto es solo el máximo.
+USUARIO_CACHE_TIMEOUT = 60
+
+# Procesos para generar las variantes de las imágenes subidas (en el worker
+# de procesar_tareas). None = uno por núcleo; 0 = sin pool, en el mismo proceso
+IMAGENES_PROCESOS = None
+
+# Minutos que se aparta el stock al agregar un producto al carrito. Las
+# reservas vencidas se liberan con: python manage.py liberar_reservas
+RESERVA_MINUTOS = 15
+
+# Pedidos con más de estos días se mueven al archivo con archivar_pedidos
+ARCHIVO_PEDIDOS_DIAS = 365
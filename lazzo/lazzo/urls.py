@@ -1,8 +1,7 @@
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from main import views
 from django.conf import settings
-from django.conf.urls.static import static
 
 
 urlpatterns = [
@@ -11,6 +10,7 @@ urlpatterns = [
     # Home
     path('', views.home, name="home"),
     path("buscar/", views.buscar, name="buscar"),
+    path("buscar/sugerencias/", views.buscar_sugerencias, name="buscar_sugerencias"),
     path("categoria/<str:tipo>/<str:categoria_slug>/", views.productos_por_categoria, name="categoria_list"),
     path(
             "categoria/<str:tipo>/<str:categoria_slug>/",
@@ -31,6 +31,7 @@ urlpatterns = [
     path("cart/add/<int:producto_id>/", views.carrito_agregar, name="cart_add"),
     path("cart/update/<int:objeto_id>/", views.carrito_actualizar, name="cart_update"),
     path("cart/delete/<int:objeto_id>/", views.carrito_eliminar, name="cart_delete"),
+    path("cart/api/", views.carrito_api, name="cart_api"),
 
     # Cuenta del usuario
     path("account/", views.mi_cuenta, name="mi_cuenta"),
@@ -61,7 +62,17 @@ urlpatterns = [
 
     # Perfil tienda/vendedor
     path("vendedor/<int:vendedor_id>/", views.vendedor_perfil, name="vendedor_perfil"),
+    path("vendedor/ventas/", views.panel_ventas, name="panel_ventas"),
+    path("vendedor/ventas/exportar/", views.exportar_ventas, name="exportar_ventas"),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Con DEBUG apagado también: en producción el servidor web puede atender
+# MEDIA_URL directo, o dejar que la vista solo mande las cabeceras y pase el
+# archivo con X-Sendfile / X-Accel-Redirect (settings.MEDIA_ENVIO)
+urlpatterns += [
+    re_path(
+        r"^%s(?P<ruta>.+)$" % settings.MEDIA_URL.lstrip("/"),
+        views.media_servir,
+        name="media",
+    ),
+]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lazzo.settings')
 
 application = get_wsgi_application()
+
+# Precarga de los índices en memoria (búsqueda, facetas, sugerencias)
+from main.signals import cargar_indices  # noqa: E402
+
+cargar_indices()
@@ -0,0 +1,236 @@
+# main/almacenamiento.py
+"""
+Storage de archivos subidos direccionado por contenido.
+
+Cada archivo se guarda con el sha256 de sus bytes como nombre, dentro de la
+carpeta que pide ``upload_to``:
+
+    products/cadena-y2k-20251128-054902.jpeg  ->  products/3f/3fa9…c1.jpeg
+
+Así la misma imagen subida dos veces ocupa un solo archivo, y como el nombre
+cambia si cambian los bytes, sus URLs son inmutables (se pueden cachear para
+siempre). ``ArchivoMedia`` cuenta cuántas veces se guardó cada archivo:
+``save`` suma una referencia y ``delete`` la resta; el archivo se borra del
+disco recién cuando llega a cero y la transacción se confirma.
+
+Al reemplazar o quitar la imagen de un producto o servicio, o la foto de un
+usuario, se suelta la anterior, y lo mismo al borrar la fila (signals.py).
+Los pedidos guardan la URL de la imagen del producto (``miniatura``): si
+alguno la usa, esa no se suelta.
+
+Los archivos subidos antes de este storage se migran con
+``manage.py deduplicar_media``; los que ninguna fila ni pedido usa se borran.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+TAMANO_TROZO = 1024 * 1024
+
+# <carpeta>/ab/abcdef….ext
+PATRON_NOMBRE = re.compile(r"^(?:.+/)?([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.\w+)?$")
+
+
+def huella(trozos):
+    """sha256 hexadecimal de un iterable de bytes, sin juntarlos en memoria."""
+    resumen = hashlib.sha256()
+    for trozo in trozos:
+        resumen.update(trozo)
+    return resumen.hexdigest()
+
+
+def huella_archivo(ruta):
+    with open(ruta, "rb") as archivo:
+        return huella(iter(lambda: archivo.read(TAMANO_TROZO), b""))
+
+
+def nombre_por_contenido(nombre, hash_contenido):
+    """Nombre direccionado por contenido para ``nombre`` (conserva carpeta y extensión)."""
+    carpeta = os.path.dirname(nombre)
+    extension = os.path.splitext(nombre)[1].lower()
+    ruta = f"{hash_contenido[:2]}/{hash_contenido}{extension}"
+    return f"{carpeta}/{ruta}" if carpeta else ruta
+
+
+def es_por_contenido(nombre):
+    return bool(PATRON_NOMBRE.match(nombre or ""))
+
+
+class AlmacenamientoContenido(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo sale del contenido en _save; si ya existe es
+        # el mismo archivo, no hay que buscarle otro
+        return name
+
+    def _save(self, name, content):
+        from .models import ArchivoMedia
+
+        hash_contenido = huella(content.chunks(TAMANO_TROZO))
+        content.seek(0)
+        nombre = nombre_por_contenido(name, hash_contenido)
+
+        with transaction.atomic():
+            # El bloqueo de la fila serializa dos subidas del mismo archivo
+            # y una subida contra el delete que lo deja en cero
+            registro, _ = ArchivoMedia.objects.select_for_update().get_or_create(
+                nombre=nombre,
+                defaults={"hash": hash_contenido, "tamano": content.size, "referencias": 0},
+            )
+            if not self.exists(nombre):
+                super()._save(nombre, content)
+            ArchivoMedia.objects.filter(pk=registro.pk).update(referencias=F("referencias") + 1)
+        return nombre
+
+    def delete(self, name):
+        from .models import ArchivoMedia
+
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        with transaction.atomic():
+            registro = ArchivoMedia.objects.select_for_update().filter(nombre=name).first()
+            if registro is None:
+                # Archivo sin registro (anterior a este storage)
+                transaction.on_commit(lambda: super(AlmacenamientoContenido, self).delete(name))
+                return
+            ArchivoMedia.objects.filter(pk=registro.pk).update(referencias=F("referencias") - 1)
+            if registro.referencias <= 1:
+                # Si la transacción se revierte el archivo sigue en uso: se
+                # borra recién al confirmar
+                transaction.on_commit(lambda: self._borrar_sin_referencias(name))
+
+    def _borrar_sin_referencias(self, name):
+        from .models import ArchivoMedia
+
+        with transaction.atomic():
+            # Entre medio pudo volver a subirse: _save bloquea la misma fila
+            registro = (
+                ArchivoMedia.objects.select_for_update()
+                .filter(nombre=name, referencias__lte=0).first()
+            )
+            if registro is None:
+                return
+            registro.delete()
+            super().delete(name)
+
+
+def en_pedidos(storage, nombre):
+    """True si algún pedido guarda la URL de ``nombre`` (ver ``_urls``)."""
+    url = storage.url(nombre)
+    return any(modelo.objects.filter(**{campo: url}).exists() for modelo, campo in _urls())
+
+
+# ---------- Migración de los archivos anteriores ----------
+
+def _recorrer(carpeta):
+    """Rutas de los archivos bajo ``carpeta``, de a una (sin listar todo el árbol)."""
+    with os.scandir(carpeta) as entradas:
+        for entrada in entradas:
+            if entrada.is_dir(follow_symlinks=False):
+                yield from _recorrer(entrada.path)
+            elif entrada.is_file(follow_symlinks=False):
+                yield entrada.path
+
+
+def pendientes(storage, omitir=()):
+    """
+    Nombres (relativos al storage) de los archivos que aún no están
+    guardados por contenido. ``omitir`` son carpetas de primer nivel a saltar.
+    """
+    raiz = storage.path("")
+    if not os.path.isdir(raiz):
+        return
+    for ruta in _recorrer(raiz):
+        nombre = os.path.relpath(ruta, raiz).replace(os.sep, "/")
+        if nombre.split("/", 1)[0] in omitir or es_por_contenido(nombre):
+            continue
+        yield nombre
+
+
+def _referencias():
+    """(modelo, campo, etiqueta de variantes) de los campos que guardan nombres de archivo."""
+    from .models import Producto, Servicio, Usuario
+
+    return ((Producto, "imagen", "producto"), (Servicio, "imagen", None), (Usuario, "foto", "usuario"))
+
+
+def _urls():
+    """(modelo, campo) de las copias de URLs de imágenes en los pedidos."""
+    from .models import DetallePedidoArchivado, Pedido, PedidoArchivado
+
+    return ((Pedido, "miniatura"), (PedidoArchivado, "miniatura"), (DetallePedidoArchivado, "imagen_producto"))
+
+
+def migrar(storage, nombre):
+    """
+    Pasa el archivo ``nombre`` a su nombre por contenido y actualiza las
+    filas que lo usan. Si ya había un archivo con el mismo contenido, la
+    copia se borra. Si nada lo usa (ninguna fila ni pedido) se borra también
+    el archivo por contenido. Se puede cortar en cualquier punto y volver a
+    correr: el original se borra recién al final.
+
+    Devuelve (nombre nuevo, era duplicado, tamaño, referencias, se borró).
+    """
+    from . import imagenes, usuarios
+    from .models import ArchivoMedia
+
+    ruta = storage.path(nombre)
+    hash_contenido = huella_archivo(ruta)
+    tamano = os.path.getsize(ruta)
+    destino = nombre_por_contenido(nombre, hash_contenido)
+    ruta_destino = storage.path(destino)
+
+    duplicado = os.path.exists(ruta_destino)
+    if not duplicado:
+        os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+        try:
+            os.link(ruta, ruta_destino)
+        except OSError:
+            temporal = f"{ruta_destino}.tmp"
+            with open(ruta, "rb") as origen, open(temporal, "wb") as copia:
+                for trozo in iter(lambda: origen.read(TAMANO_TROZO), b""):
+                    copia.write(trozo)
+            os.replace(temporal, ruta_destino)
+
+    cambiados = []
+    with transaction.atomic():
+        referencias = 0
+        for modelo, campo, etiqueta in _referencias():
+            ids = list(modelo.objects.filter(**{campo: nombre}).values_list("pk", flat=True))
+            if ids:
+                referencias += modelo.objects.filter(pk__in=ids).update(**{campo: destino})
+                cambiados.append((modelo, campo, etiqueta, ids))
+        registro, _ = ArchivoMedia.objects.select_for_update().get_or_create(
+            nombre=destino, defaults={"hash": hash_contenido, "tamano": tamano, "referencias": 0},
+        )
+        ArchivoMedia.objects.filter(pk=registro.pk).update(
+            referencias=F("referencias") + referencias
+        )
+
+    url_vieja, url_nueva = storage.url(nombre), storage.url(destino)
+    for modelo, campo in _urls():
+        modelo.objects.filter(**{campo: url_vieja}).update(**{campo: url_nueva})
+
+    for modelo, campo, etiqueta, ids in cambiados:
+        if etiqueta == "usuario":
+            for usuario_id in ids:
+                usuarios.invalidar(usuario_id)
+        if etiqueta:
+            # update() no emite post_save: las variantes del nombre viejo
+            # dejan de estar vigentes y se regeneran con el nuevo
+            for instancia in modelo.objects.filter(pk__in=ids).only("pk", campo, "variantes"):
+                imagenes.programar(instancia, etiqueta)
+
+    os.remove(ruta)
+
+    borrado = False
+    if not en_pedidos(storage, destino):
+        # Solo lo borra si sigue en cero referencias (lo chequea con la fila
+        # bloqueada)
+        storage._borrar_sin_referencias(destino)
+        borrado = not storage.exists(destino)
+    return destino, duplicado, tamano, referencias, borrado
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Registra los receptores de señales (índices en memoria, etc.)
+        from . import signals  # noqa: F401
+        # Registra las tareas en segundo plano (main/tareas.py)
+        from . import notificaciones  # noqa: F401
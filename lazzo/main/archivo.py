@@ -0,0 +1,124 @@
+# main/archivo.py
+"""
+Archivo de pedidos viejos.
+
+``archivar`` mueve los pedidos anteriores a una fecha (con sus líneas y
+pagos) de las tablas ``Pedido``/``DetallePedido``/``Pago`` a
+``PedidoArchivado``/``DetallePedidoArchivado``/``PagoArchivado``, de a
+``lote`` pedidos por transacción. Las tablas calientes quedan chicas y sus
+índices caben en memoria; el historial sigue visible porque las vistas de
+pedidos leen también del archivo (``pedido_archivado``).
+
+Las tablas de archivo pueden estar en otra base (``settings.ARCHIVO_DB``,
+ver main/routers.py). En cada lote se copia y se confirma primero en el
+archivo y recién después se borra de la base principal: si el proceso se
+corta entre las dos cosas, al volver a correrlo la copia ignora lo que ya
+estaba y termina de borrar. Es decir, se puede interrumpir y reanudar.
+"""
+from django.db import transaction
+
+from .models import (
+    DetallePedido, DetallePedidoArchivado, Pago, PagoArchivado, Pedido,
+    PedidoArchivado,
+)
+from .routers import alias_archivo
+
+CAMPOS_PEDIDO = (
+    "idPedido", "usuario_id", "fecha", "estado", "total", "direccion", "envio",
+    "cantidad_items", "producto_principal", "miniatura", "estado_pago",
+)
+CAMPOS_PAGO = ("idPago", "pedido_id", "monto", "metodo", "estado", "fecha")
+
+
+def _copiar(ids, alias):
+    """Copia al archivo los pedidos ``ids``. Devuelve (pedidos, detalles, pagos)."""
+    pedidos = [
+        PedidoArchivado(**valores)
+        for valores in Pedido.objects.filter(idPedido__in=ids).values(*CAMPOS_PEDIDO)
+    ]
+    detalles = [
+        DetallePedidoArchivado(
+            id=detalle.id,
+            pedido_id=detalle.pedido_id,
+            producto_id=detalle.producto_id,
+            nombre_producto=detalle.producto.nombre[:100],
+            imagen_producto=detalle.producto.imagen.url if detalle.producto.imagen else "",
+            cantidad=detalle.cantidad,
+            precio_unitario=detalle.precio_unitario,
+            subtotal=detalle.subtotal,
+        )
+        for detalle in (
+            DetallePedido.objects
+            .filter(pedido_id__in=ids)
+            .select_related("producto")
+            .only(
+                "pedido_id", "producto_id", "cantidad", "precio_unitario", "subtotal",
+                "producto__nombre", "producto__imagen",
+            )
+        )
+    ]
+    pagos = [
+        PagoArchivado(**valores)
+        for valores in Pago.objects.filter(pedido_id__in=ids).values(*CAMPOS_PAGO)
+    ]
+
+    # ignore_conflicts: lo que quedó copiado de una corrida interrumpida se salta
+    PedidoArchivado.objects.using(alias).bulk_create(pedidos, ignore_conflicts=True)
+    DetallePedidoArchivado.objects.using(alias).bulk_create(detalles, ignore_conflicts=True)
+    PagoArchivado.objects.using(alias).bulk_create(pagos, ignore_conflicts=True)
+    return len(pedidos), len(detalles), len(pagos)
+
+
+def archivar(antes_de, lote=500, max_lotes=None, progreso=None):
+    """
+    Mueve al archivo los pedidos con ``fecha`` anterior a ``antes_de``.
+
+    ``progreso(pedidos, detalles, pagos)`` se llama después de cada lote con
+    lo que se movió en él. Devuelve el total de pedidos movidos.
+    """
+    alias = alias_archivo()
+    movidos = lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        with transaction.atomic():
+            # Por id y no por fecha: los ids crecen con la fecha, así que los
+            # más viejos salen primero recorriendo la clave primaria
+            ids = list(
+                Pedido.objects
+                .select_for_update()
+                .filter(fecha__lt=antes_de)
+                .order_by("idPedido")
+                .values_list("idPedido", flat=True)[:lote]
+            )
+            if not ids:
+                break
+            # Con otra base de archivo, este bloque se confirma antes del
+            # borrado; con la misma base es un savepoint de la transacción
+            with transaction.atomic(using=alias):
+                copiados = _copiar(ids, alias)
+            # Las líneas y pagos caen en cascada
+            Pedido.objects.filter(idPedido__in=ids).delete()
+
+        movidos += len(ids)
+        lotes += 1
+        if progreso is not None:
+            progreso(*copiados)
+        if len(ids) < lote:
+            break
+    return movidos
+
+
+def tiene_archivados(usuario_id):
+    return PedidoArchivado.objects.filter(usuario_id=usuario_id).exists()
+
+
+def pedido_archivado(pedido_id, usuario_id):
+    """
+    Devuelve (pedido, items, pago) de un pedido archivado del usuario, o
+    ``None`` si no está en el archivo.
+    """
+    pedido = PedidoArchivado.objects.filter(idPedido=pedido_id, usuario_id=usuario_id).first()
+    if pedido is None:
+        return None
+    items = list(DetallePedidoArchivado.objects.filter(pedido_id=pedido_id).order_by("id"))
+    pago = PagoArchivado.objects.filter(pedido_id=pedido_id).order_by("idPago").first()
+    return pedido, items, pago
@@ -0,0 +1,141 @@
+# main/autocompletar.py
+"""
+Sugerencias para el buscador (typeahead) desde un arreglo ordenado en memoria.
+
+Por cada producto se guarda una entrada por cada palabra de su nombre,
+con el texto normalizado desde esa palabra hasta el final:
+
+    "Monster White" -> "monster white", "white"
+
+Así un prefijo se resuelve con ``bisect`` y encuentra tanto "mon" como
+"whi". Se construye al arrancar el worker (ver ``cargar_indices`` en
+``main/signals.py``) y se mantiene al día con ``main/sincronizacion.py``.
+"""
+import threading
+from bisect import bisect_left, insort
+
+from . import sincronizacion
+from .busqueda import normalizar, tokenizar
+from .facetas import CATEGORIAS_POR_TIPO
+from .models import Producto
+
+# Máximo de entradas que se revisan por consulta; acota el tiempo aunque
+# miles de productos compartan el prefijo.
+LIMITE_ESCANEO = 200
+
+
+class IndiceAutocompletar(sincronizacion.IndiceSincronizado):
+
+    CAMPOS = ("idProducto", "nombre")
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._entradas = []      # (clave, idProducto), ordenado
+        self._nombres = {}       # idProducto -> (nombre, claves)
+        self._categorias = sorted(
+            (normalizar(palabra), tipo, slug, label)
+            for tipo, categorias in CATEGORIAS_POR_TIPO.items()
+            for slug, label in categorias
+            for palabra in {*tokenizar(label), normalizar(slug)}
+        )
+
+    # ---------- Construcción / mantenimiento ----------
+
+    def reconstruir(self, productos=None):
+        estado = sincronizacion.estado(self.CANALES)
+        if productos is None:
+            productos = Producto.objects.only(*self.CAMPOS).iterator(chunk_size=2000)
+
+        with self._lock:
+            self._entradas = []
+            self._nombres = {}
+            for producto in productos:
+                claves = _claves(producto.nombre)
+                self._nombres[producto.idProducto] = (producto.nombre, claves)
+                self._entradas.extend((clave, producto.idProducto) for clave in claves)
+            self._entradas.sort()
+            self._estado = estado
+            self.cargado = True
+
+    def actualizar(self, producto):
+        with self._lock:
+            if not self.cargado:
+                return
+            self._quitar(producto.idProducto)
+            claves = _claves(producto.nombre)
+            self._nombres[producto.idProducto] = (producto.nombre, claves)
+            for clave in claves:
+                insort(self._entradas, (clave, producto.idProducto))
+
+    def eliminar(self, producto_id):
+        with self._lock:
+            if not self.cargado:
+                return
+            self._quitar(producto_id)
+
+    def _quitar(self, producto_id):
+        _, claves = self._nombres.pop(producto_id, (None, ()))
+        for clave in claves:
+            pos = bisect_left(self._entradas, (clave, producto_id))
+            if pos < len(self._entradas) and self._entradas[pos] == (clave, producto_id):
+                del self._entradas[pos]
+
+    # ---------- Consultas ----------
+
+    def sugerir(self, prefijo, k=8):
+        """
+        Devuelve (productos, categorias): hasta ``k`` pares (idProducto,
+        nombre) y hasta ``k`` categorías (tipo, slug, label) que empiezan
+        con ``prefijo``. Primero los nombres que empiezan con el prefijo,
+        después los que lo tienen al inicio de otra palabra.
+        """
+        prefijo = " ".join(tokenizar(prefijo))
+        if not prefijo:
+            return [], []
+
+        self.sincronizar()
+
+        with self._lock:
+            encontrados = {}
+            pos = bisect_left(self._entradas, (prefijo,))
+            fin = min(pos + LIMITE_ESCANEO, len(self._entradas))
+            while pos < fin:
+                clave, producto_id = self._entradas[pos]
+                if not clave.startswith(prefijo):
+                    break
+                nombre, claves = self._nombres[producto_id]
+                al_inicio = claves[0] == clave
+                rango = (not al_inicio, len(nombre), -producto_id)
+                if producto_id not in encontrados or rango < encontrados[producto_id][0]:
+                    encontrados[producto_id] = (rango, nombre)
+                pos += 1
+
+            productos = [
+                (producto_id, nombre)
+                for producto_id, (_, nombre) in sorted(
+                    encontrados.items(), key=lambda par: par[1][0]
+                )[:k]
+            ]
+
+        categorias = []
+        vistas = set()
+        pos = bisect_left(self._categorias, (prefijo,))
+        while pos < len(self._categorias) and len(categorias) < k:
+            palabra, tipo, slug, label = self._categorias[pos]
+            if not palabra.startswith(prefijo):
+                break
+            if (tipo, slug) not in vistas:
+                vistas.add((tipo, slug))
+                categorias.append((tipo, slug, label))
+            pos += 1
+
+        return productos, categorias
+
+
+def _claves(nombre):
+    palabras = tokenizar(nombre)
+    return tuple(" ".join(palabras[i:]) for i in range(len(palabras)))
+
+
+indice = IndiceAutocompletar()
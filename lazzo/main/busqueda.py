@@ -0,0 +1,286 @@
+# main/busqueda.py
+"""
+Índice invertido en memoria para la búsqueda de productos.
+
+Cada proceso (worker) mantiene su propia copia del índice. Se construye la
+primera vez que se consulta (o con ``reconstruir``) y luego se mantiene al
+día con los cambios que anotan todos los workers en la caché compartida
+(ver ``main/sincronizacion.py`` y ``main/signals.py``).
+
+Además del índice exacto hay un índice de trigramas sobre las palabras de
+``nombre`` y ``categoria`` para la búsqueda tolerante a errores
+("tecnolgia", "monstr"). Los candidatos salen del índice de trigramas del
+vocabulario, nunca de recorrer los productos uno por uno.
+"""
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+
+from . import sincronizacion
+from .models import CATEGORIAS_PRODUCTO, CATEGORIAS_SERVICIO, Producto
+
+# Peso de cada campo al calcular la puntuación de un término
+PESOS_CAMPOS = {
+    "nombre": 3.0,
+    "categoria": 2.0,
+    "descripcion": 1.0,
+}
+
+# Campos cuyas palabras entran al índice de trigramas (búsqueda difusa)
+CAMPOS_DIFUSOS = ("nombre", "categoria")
+
+# Similitud mínima (Jaccard de trigramas) para aceptar una palabra parecida
+UMBRAL_SIMILITUD = 0.3
+
+# Máximo de palabras del vocabulario que se aceptan por cada palabra buscada
+MAX_TERMINOS_DIFUSOS = 5
+
+_ETIQUETAS_CATEGORIA = dict(CATEGORIAS_PRODUCTO + CATEGORIAS_SERVICIO)
+
+_RE_TOKEN = re.compile(r"\w+")
+
+
+def normalizar(texto):
+    """Pasa a minúsculas y quita tildes: 'Tecnología' -> 'tecnologia'."""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    sin_tildes = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return sin_tildes.casefold()
+
+
+def tokenizar(texto):
+    return _RE_TOKEN.findall(normalizar(texto).replace("_", " "))
+
+
+def trigramas(termino):
+    """Trigramas con relleno: 'sol' -> {'  s', ' so', 'sol', 'ol '}."""
+    relleno = f"  {termino} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def _texto_campo(producto, campo):
+    texto = getattr(producto, campo, "") or ""
+    if campo == "categoria":
+        # El slug ("cuidado_personal") más su nombre legible ("Cuidado Personal")
+        etiqueta = _ETIQUETAS_CATEGORIA.get(texto, "")
+        if normalizar(etiqueta) != normalizar(texto):
+            texto = f"{texto} {etiqueta}"
+    return texto
+
+
+class IndiceBusqueda(sincronizacion.IndiceSincronizado):
+    """
+    término -> {idProducto: puntuación}
+
+    La puntuación de un término en un producto es la suma, por campo, de
+    (frecuencia del término en el campo) * (peso del campo).
+    """
+
+    CAMPOS = ("idProducto", "nombre", "descripcion", "categoria")
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)
+        self._terminos_por_producto = {}
+        self._vocabulario = []
+        # Búsqueda difusa: palabra -> nº de productos que la tienen en
+        # nombre/categoría, y trigrama -> palabras que lo contienen
+        self._difusos = Counter()
+        self._difusos_por_producto = {}
+        self._trigramas = defaultdict(set)
+
+    # ---------- Construcción / mantenimiento ----------
+
+    def reconstruir(self, productos=None):
+        """
+        Reconstruye el índice completo. ``productos`` puede ser cualquier
+        iterable de objetos con idProducto, nombre, descripcion y categoria;
+        por defecto se leen todos los productos de la base de datos.
+        """
+        # Antes de leer: un cambio que llegue mientras se carga se vuelve a
+        # aplicar en la próxima sincronización
+        estado = sincronizacion.estado(self.CANALES)
+        if productos is None:
+            productos = Producto.objects.only(*self.CAMPOS).iterator(chunk_size=2000)
+
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._terminos_por_producto = {}
+            self._difusos = Counter()
+            self._difusos_por_producto = {}
+            self._trigramas = defaultdict(set)
+            for producto in productos:
+                self._agregar(producto, vocabulario=False)
+            self._vocabulario = sorted(self._postings)
+            self._estado = estado
+            self.cargado = True
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "productos": len(self._terminos_por_producto),
+                "terminos": len(self._postings),
+                "trigramas": len(self._trigramas),
+            }
+
+    def actualizar(self, producto):
+        with self._lock:
+            if not self.cargado:
+                # Se construirá completo en la primera búsqueda
+                return
+            self._quitar(producto.idProducto)
+            self._agregar(producto)
+
+    def eliminar(self, producto_id):
+        with self._lock:
+            if not self.cargado:
+                return
+            self._quitar(producto_id)
+
+    def _agregar(self, producto, vocabulario=True):
+        puntuaciones = defaultdict(float)
+        difusos = set()
+        for campo, peso in PESOS_CAMPOS.items():
+            for termino in tokenizar(_texto_campo(producto, campo)):
+                puntuaciones[termino] += peso
+                if campo in CAMPOS_DIFUSOS:
+                    difusos.add(termino)
+
+        for termino, puntuacion in puntuaciones.items():
+            if vocabulario and termino not in self._postings:
+                insort(self._vocabulario, termino)
+            self._postings[termino][producto.idProducto] = puntuacion
+        self._terminos_por_producto[producto.idProducto] = tuple(puntuaciones)
+
+        for termino in difusos:
+            if not self._difusos[termino]:
+                for trigrama in trigramas(termino):
+                    self._trigramas[trigrama].add(termino)
+            self._difusos[termino] += 1
+        self._difusos_por_producto[producto.idProducto] = tuple(difusos)
+
+    def _quitar(self, producto_id):
+        for termino in self._terminos_por_producto.pop(producto_id, ()):
+            posting = self._postings.get(termino)
+            if posting is None:
+                continue
+            posting.pop(producto_id, None)
+            if not posting:
+                del self._postings[termino]
+                pos = bisect_left(self._vocabulario, termino)
+                if pos < len(self._vocabulario) and self._vocabulario[pos] == termino:
+                    del self._vocabulario[pos]
+
+        for termino in self._difusos_por_producto.pop(producto_id, ()):
+            self._difusos[termino] -= 1
+            if self._difusos[termino] > 0:
+                continue
+            del self._difusos[termino]
+            for trigrama in trigramas(termino):
+                contienen = self._trigramas.get(trigrama)
+                if contienen is None:
+                    continue
+                contienen.discard(termino)
+                if not contienen:
+                    del self._trigramas[trigrama]
+
+    # ---------- Consulta ----------
+
+    def _terminos_con_prefijo(self, prefijo):
+        terminos = []
+        pos = bisect_left(self._vocabulario, prefijo)
+        while pos < len(self._vocabulario) and self._vocabulario[pos].startswith(prefijo):
+            terminos.append(self._vocabulario[pos])
+            pos += 1
+        return terminos
+
+    def buscar(self, consulta):
+        """
+        Devuelve una lista de (idProducto, puntuación) ordenada de mayor a
+        menor relevancia. Todos los términos de la consulta deben aparecer;
+        el último se trata como prefijo ("monst" encuentra "monster").
+        """
+        terminos = tokenizar(consulta)
+        if not terminos:
+            return []
+
+        self.sincronizar()
+
+        with self._lock:
+            acumulado = None
+            for i, termino in enumerate(terminos):
+                if i == len(terminos) - 1:
+                    candidatos = self._terminos_con_prefijo(termino)
+                else:
+                    candidatos = [termino] if termino in self._postings else []
+
+                puntos = defaultdict(float)
+                for candidato in candidatos:
+                    for producto_id, puntuacion in self._postings[candidato].items():
+                        puntos[producto_id] += puntuacion
+
+                if acumulado is None:
+                    acumulado = puntos
+                else:
+                    acumulado = {
+                        producto_id: acumulado[producto_id] + puntuacion
+                        for producto_id, puntuacion in puntos.items()
+                        if producto_id in acumulado
+                    }
+
+                if not acumulado:
+                    return []
+
+        # Empate de puntuación: primero los más recientes
+        return sorted(acumulado.items(), key=lambda par: (-par[1], -par[0]))
+
+    def _terminos_parecidos(self, termino):
+        """
+        Palabras del vocabulario (nombre/categoría) parecidas a ``termino``,
+        como lista de (palabra, similitud) de mayor a menor similitud.
+        """
+        propios = trigramas(termino)
+        compartidos = Counter()
+        for trigrama in propios:
+            for candidato in self._trigramas.get(trigrama, ()):
+                compartidos[candidato] += 1
+
+        parecidos = []
+        for candidato, comunes in compartidos.items():
+            # Jaccard: |A ∩ B| / |A ∪ B|; una palabra de n letras tiene n + 1
+            # trigramas con relleno
+            similitud = comunes / (len(propios) + len(candidato) + 1 - comunes)
+            if similitud >= UMBRAL_SIMILITUD:
+                parecidos.append((candidato, similitud))
+
+        parecidos.sort(key=lambda par: (-par[1], par[0]))
+        return parecidos[:MAX_TERMINOS_DIFUSOS]
+
+    def buscar_difuso(self, consulta):
+        """
+        Búsqueda tolerante a errores de tipeo. Cada palabra de la consulta se
+        cambia por las palabras más parecidas del vocabulario y se suman las
+        puntuaciones ponderadas por la similitud. Devuelve lo mismo que
+        ``buscar``.
+        """
+        terminos = tokenizar(consulta)
+        if not terminos:
+            return []
+
+        self.sincronizar()
+
+        puntos = defaultdict(float)
+        with self._lock:
+            for termino in terminos:
+                for parecido, similitud in self._terminos_parecidos(termino):
+                    for producto_id, puntuacion in self._postings[parecido].items():
+                        puntos[producto_id] += similitud * puntuacion
+
+        return sorted(puntos.items(), key=lambda par: (-par[1], -par[0]))
+
+
+indice = IndiceBusqueda()
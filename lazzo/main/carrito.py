@@ -0,0 +1,603 @@
+# main/carrito.py
+"""
+Carrito de compras: cálculo de totales y almacenamiento.
+
+Hay dos formas de guardar el carrito, elegidas con ``CARRITO_ALMACEN`` en
+settings:
+
+  - "bd" (por defecto): ``Carrito`` / ``ObjetoCarrito`` en la base de datos.
+  - "cache": el carrito vive en la caché de Django y solo se escribe en la
+    base de datos con ``manage.py persistir_carritos`` (o cuando se
+    convierte en pedido). Ideal para ventas flash: cada clic es una
+    escritura en caché, no varias en MySQL.
+
+Las vistas usan siempre ``almacen()`` y no necesitan saber cuál está activo.
+Agregar o cambiar cantidades reserva el stock (ver ``reservas.py``): una
+línea nunca queda con más unidades de las que se pudieron apartar.
+En ambos casos las líneas tienen ``idObjeto``, ``producto``, ``cantidad`` y
+``subtotal`` (en el modo caché, ``idObjeto`` es el id del producto).
+
+Cada cambio en un carrito sube su ``version()``. El mini-carrito del header
+(``vista_previa``) se guarda en caché bajo esa versión, así que no cuesta
+consultas mientras el carrito no cambie.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from . import imagenes, reservas
+from .models import Carrito, ObjetoCarrito, Producto
+
+# Costo fijo de envío (si el carrito no está vacío)
+COSTO_ENVIO = 2990
+
+# Ítems que se muestran en el mini-carrito del header
+MAX_ITEMS_PREVIEW = 3
+
+# Vida del mini-carrito en caché (acota cuánto tarda en verse un cambio de
+# precio, que no sube la versión del carrito)
+TIMEOUT_VISTA_PREVIA = 60 * 5
+
+# Segundos que una escritura del carrito en caché espera a otra del mismo
+# usuario (lo que dura su bloqueo: pasado eso, el bloqueo venció)
+ESPERA_ESCRITURA = 10
+
+
+class ResumenCarrito:
+    """Líneas del carrito (con su producto) y totales ya calculados."""
+
+    def __init__(self, objetos, total, carrito=None):
+        self.objetos = objetos
+        self.total = total
+        self.carrito = carrito
+
+    @property
+    def cantidad(self):
+        return sum(obj.cantidad for obj in self.objetos)
+
+    @property
+    def envio(self):
+        return COSTO_ENVIO if self.total > 0 else 0
+
+    @property
+    def total_con_envio(self):
+        return self.total + self.envio
+
+    def __bool__(self):
+        return bool(self.objetos)
+
+
+class CarritoOcupado(Exception):
+    """Otro request lleva demasiado rato modificando el mismo carrito."""
+
+
+def _vista_previa(cantidad, total, items):
+    return {
+        "carrito_cantidad": cantidad,
+        "carrito_items_preview": items,
+        "carrito_total_preview": total,
+    }
+
+
+def recalcular(carrito):
+    """
+    Recalcula subtotales y total con una sola consulta (líneas + precio
+    actual del producto). Persiste solo lo que cambió.
+    """
+    objetos = list(
+        carrito.objetos
+        .select_related("producto")
+        .annotate(subtotal_actual=F("cantidad") * F("producto__precio"))
+        .order_by("idObjeto")
+    )
+
+    cambiados = []
+    total = 0
+    for obj in objetos:
+        if obj.subtotal != obj.subtotal_actual:
+            obj.subtotal = obj.subtotal_actual
+            cambiados.append(obj)
+        total += obj.subtotal
+
+    if cambiados:
+        ObjetoCarrito.objects.bulk_update(cambiados, ["subtotal"])
+
+    if carrito.total != total:
+        carrito.total = total
+        carrito.save(update_fields=["total"])
+        invalidar(carrito.usuario_id)
+    elif cambiados:
+        invalidar(carrito.usuario_id)
+
+    return ResumenCarrito(objetos, total, carrito)
+
+
+# ---------- Almacenamiento en base de datos ----------
+
+class AlmacenCarritoBD:
+    """
+    Agregar, cambiar o quitar una línea solo ajusta ``Carrito.total`` con la
+    diferencia de esa línea (``UPDATE ... SET total = total + x``). Los
+    cambios de precio de las demás líneas se corrigen con ``recalcular`` al
+    pedir el ``resumen``.
+    """
+
+    def _carrito(self, usuario_id):
+        carrito, _ = Carrito.objects.get_or_create(usuario_id=usuario_id)
+        return carrito
+
+    def _ajustar_total(self, usuario_id, diferencia):
+        if diferencia:
+            Carrito.objects.filter(usuario_id=usuario_id).update(total=F("total") + diferencia)
+        invalidar(usuario_id)
+
+    def resumen(self, usuario_id):
+        return recalcular(self._carrito(usuario_id))
+
+    def obtener_linea(self, usuario_id, objeto_id):
+        return (
+            ObjetoCarrito.objects
+            .select_related("producto")
+            .filter(carrito__usuario_id=usuario_id, idObjeto=objeto_id)
+            .first()
+        )
+
+    def agregar(self, usuario_id, producto, cantidad=1):
+        """
+        Suma ``cantidad`` unidades de ``producto`` (sin pasar de lo que se
+        pudo reservar). Devuelve la línea, o None si no se pudo sumar nada.
+        """
+        carrito = self._carrito(usuario_id)
+        objeto = carrito.objetos.filter(producto=producto).first()
+        actual = objeto.cantidad if objeto else 0
+
+        cantidad = reservas.reservar(usuario_id, producto, actual + cantidad)
+        if cantidad <= actual:
+            return None
+
+        anterior = objeto.subtotal if objeto else 0
+        if objeto:
+            objeto.cantidad = cantidad
+            objeto.subtotal = cantidad * producto.precio
+            objeto.save(update_fields=["cantidad", "subtotal"])
+        else:
+            objeto = ObjetoCarrito.objects.create(
+                producto=producto,
+                cantidad=cantidad,
+                subtotal=cantidad * producto.precio,
+            )
+            carrito.objetos.add(objeto)
+
+        self._ajustar_total(usuario_id, objeto.subtotal - anterior)
+        return objeto
+
+    def cambiar_cantidad(self, usuario_id, objeto, cantidad):
+        """
+        Deja la línea en ``cantidad`` (o en lo que se pudo reservar).
+        Devuelve la línea, o None si no quedó nada disponible y se quitó.
+        """
+        cantidad = reservas.reservar(usuario_id, objeto.producto, cantidad)
+        if not cantidad:
+            self.quitar(usuario_id, objeto)
+            return None
+
+        anterior = objeto.subtotal
+        objeto.cantidad = cantidad
+        objeto.subtotal = cantidad * objeto.producto.precio
+        objeto.save(update_fields=["cantidad", "subtotal"])
+        self._ajustar_total(usuario_id, objeto.subtotal - anterior)
+        return objeto
+
+    def quitar(self, usuario_id, objeto):
+        # delete() también borra su fila de la tabla intermedia
+        objeto.delete()
+        reservas.liberar(usuario_id, [objeto.producto_id])
+        self._ajustar_total(usuario_id, -objeto.subtotal)
+
+    def vaciar(self, usuario_id):
+        # Borra las líneas (y sus filas en la tabla intermedia) de una vez
+        ObjetoCarrito.objects.filter(carrito__usuario_id=usuario_id).delete()
+        Carrito.objects.filter(usuario_id=usuario_id).update(total=0)
+        reservas.liberar(usuario_id)
+        invalidar(usuario_id)
+
+    def vista_previa(self, usuario_id):
+        """Datos del mini-carrito del header, leídos de la BD."""
+        carrito = Carrito.objects.filter(usuario_id=usuario_id).first()
+        if not carrito:
+            return _vista_previa(0, 0, [])
+
+        objetos = list(carrito.objetos.select_related("producto"))
+        items = []
+        for obj in objetos[:MAX_ITEMS_PREVIEW]:
+            producto = obj.producto
+            items.append({
+                "nombre": producto.nombre,
+                "cantidad": obj.cantidad,
+                "subtotal": obj.subtotal,
+                "imagen": imagenes.url_miniatura(producto.imagen, producto.variantes),
+            })
+
+        return _vista_previa(sum(obj.cantidad for obj in objetos), carrito.total, items)
+
+    def persistir(self, usuario_id=None):
+        # Ya está en la base de datos
+        return 0
+
+
+# ---------- Almacenamiento en caché (write-back) ----------
+
+class LineaCarrito:
+    """Línea de un carrito en caché; imita a ObjetoCarrito en las plantillas."""
+
+    def __init__(self, producto, cantidad):
+        self.idObjeto = producto.idProducto
+        self.producto = producto
+        self.producto_id = producto.idProducto
+        self.cantidad = cantidad
+        self.subtotal = cantidad * producto.precio
+
+
+class AlmacenCarritoCache:
+    """
+    En caché se guarda, por usuario, un dict ``{producto_id: línea}`` donde
+    cada línea tiene la cantidad y una copia del nombre, precio e imagen
+    (para el mini-carrito sin ir a la BD).
+
+    Cada escritura anota al usuario en una entrada nueva ``cambio:<n>``,
+    con ``n`` sacado de ``CLAVE_ULTIMO`` con ``incr`` (atómico): dos
+    workers nunca pisan la anotación del otro. ``persistir`` recorre las
+    entradas desde ``CLAVE_HECHO`` hasta el último número que vio y las
+    borra; lo que cambie mientras tanto queda con un número mayor para la
+    próxima pasada.
+
+    Leer, cambiar y volver a guardar las líneas de un usuario se hace con
+    ``_bloqueo``: dos clics simultáneos no se pisan (lo que perdería una
+    línea con su reserva tomada). Es otro bloqueo que el de ``carrito_api``,
+    que llama a estos métodos teniendo el suyo.
+    """
+
+    CLAVE_ULTIMO = "carrito:cambios:ultimo"
+    CLAVE_HECHO = "carrito:cambios:hecho"
+    # Primera entrada que faltaba en la pasada anterior (ver persistir)
+    CLAVE_HUECO = "carrito:cambios:hueco"
+
+    # Entradas que se leen por get_many
+    LOTE = 1000
+
+    def __init__(self):
+        self.timeout = getattr(settings, "CARRITO_CACHE_TIMEOUT", 60 * 60 * 24 * 30)
+
+    def _clave(self, usuario_id):
+        return f"carrito:{usuario_id}"
+
+    def _clave_cambio(self, numero):
+        return f"carrito:cambio:{numero}"
+
+    @contextmanager
+    def _bloqueo(self, usuario_id, obligatorio=True):
+        """
+        Entrega si se obtuvo; sin obtenerlo lanza ``CarritoOcupado``, salvo
+        que no sea ``obligatorio``.
+        """
+        with bloqueo(f"lineas:{usuario_id}", esperar=ESPERA_ESCRITURA) as obtenido:
+            if not obtenido and obligatorio:
+                raise CarritoOcupado(usuario_id)
+            yield obtenido
+
+    def _leer(self, usuario_id):
+        lineas = cache.get(self._clave(usuario_id))
+        if lineas is None:
+            # Primera vez (o la caché se vació): partimos de lo que haya en la BD
+            lineas = {
+                obj.producto_id: _copia_linea(obj.producto, obj.cantidad)
+                for obj in (
+                    ObjetoCarrito.objects
+                    .select_related("producto")
+                    .filter(carrito__usuario_id=usuario_id)
+                    .order_by("idObjeto")
+                )
+            }
+            cache.set(self._clave(usuario_id), lineas, self.timeout)
+        return lineas
+
+    def _escribir(self, usuario_id, lineas):
+        cache.set(self._clave(usuario_id), lineas, self.timeout)
+        invalidar(usuario_id)
+        # Después de guardar las líneas: quien vea la entrada lee el carrito
+        # con este cambio
+        numero = _incrementar(self.CLAVE_ULTIMO)
+        cache.set(self._clave_cambio(numero), usuario_id, self.timeout)
+
+    def resumen(self, usuario_id):
+        lineas = self._leer(usuario_id)
+        productos = Producto.objects.in_bulk(list(lineas))
+
+        objetos = []
+        eliminados = set()
+        cambiados = {}
+        for producto_id, datos in lineas.items():
+            producto = productos.get(producto_id)
+            if producto is None:
+                # El producto fue eliminado
+                eliminados.add(producto_id)
+                continue
+            if datos["precio"] != producto.precio:
+                cambiados[producto_id] = producto
+            objetos.append(LineaCarrito(producto, datos["cantidad"]))
+
+        if eliminados or cambiados:
+            with self._bloqueo(usuario_id, obligatorio=False) as obtenido:
+                if not obtenido:
+                    # Solo es limpieza: la hará el próximo resumen
+                    return ResumenCarrito(objetos, sum(obj.subtotal for obj in objetos))
+                # Releídas: entre medio pudo cambiar otra línea
+                lineas = self._leer(usuario_id)
+                for producto_id in eliminados:
+                    lineas.pop(producto_id, None)
+                for producto_id, producto in cambiados.items():
+                    if producto_id in lineas:
+                        lineas[producto_id] = _copia_linea(producto, lineas[producto_id]["cantidad"])
+                self._escribir(usuario_id, lineas)
+
+        return ResumenCarrito(objetos, sum(obj.subtotal for obj in objetos))
+
+    def obtener_linea(self, usuario_id, objeto_id):
+        datos = self._leer(usuario_id).get(objeto_id)
+        if datos is None:
+            return None
+        producto = Producto.objects.filter(idProducto=objeto_id).first()
+        if producto is None:
+            return None
+        return LineaCarrito(producto, datos["cantidad"])
+
+    def agregar(self, usuario_id, producto, cantidad=1):
+        with self._bloqueo(usuario_id):
+            lineas = self._leer(usuario_id)
+            actual = lineas.get(producto.idProducto, {}).get("cantidad", 0)
+
+            nueva = reservas.reservar(usuario_id, producto, actual + cantidad)
+            if nueva <= actual:
+                return None
+
+            lineas[producto.idProducto] = _copia_linea(producto, nueva)
+            self._escribir(usuario_id, lineas)
+        return LineaCarrito(producto, nueva)
+
+    def cambiar_cantidad(self, usuario_id, objeto, cantidad):
+        with self._bloqueo(usuario_id):
+            cantidad = reservas.reservar(usuario_id, objeto.producto, cantidad)
+            lineas = self._leer(usuario_id)
+            if not cantidad:
+                self._quitar(usuario_id, lineas, objeto.producto_id)
+                return None
+
+            lineas[objeto.producto_id] = _copia_linea(objeto.producto, cantidad)
+            self._escribir(usuario_id, lineas)
+        objeto.cantidad = cantidad
+        objeto.subtotal = cantidad * objeto.producto.precio
+        return objeto
+
+    def quitar(self, usuario_id, objeto):
+        with self._bloqueo(usuario_id):
+            self._quitar(usuario_id, self._leer(usuario_id), objeto.producto_id)
+
+    def _quitar(self, usuario_id, lineas, producto_id):
+        lineas.pop(producto_id, None)
+        self._escribir(usuario_id, lineas)
+        reservas.liberar(usuario_id, [producto_id])
+
+    def vaciar(self, usuario_id):
+        # Tras un pedido el carrito se vacía igual: lo que otro agregue
+        # entre medio se pierde, pero su reserva vence sola
+        with self._bloqueo(usuario_id, obligatorio=False):
+            self._escribir(usuario_id, {})
+            reservas.liberar(usuario_id)
+
+    def vista_previa(self, usuario_id):
+        lineas = self._leer(usuario_id)
+        items = [
+            {
+                "nombre": datos["nombre"],
+                "cantidad": datos["cantidad"],
+                "subtotal": datos["cantidad"] * datos["precio"],
+                "imagen": datos["imagen"],
+            }
+            for datos in list(lineas.values())[:MAX_ITEMS_PREVIEW]
+        ]
+        return _vista_previa(
+            sum(datos["cantidad"] for datos in lineas.values()),
+            sum(datos["cantidad"] * datos["precio"] for datos in lineas.values()),
+            items,
+        )
+
+    def persistir(self, usuario_id=None):
+        """
+        Escribe en ``Carrito``/``ObjetoCarrito`` los carritos en caché con
+        cambios pendientes (o solo el de ``usuario_id``). Devuelve cuántos
+        carritos se escribieron.
+        """
+        if usuario_id is not None:
+            lineas = cache.get(self._clave(usuario_id))
+            if lineas is None:
+                return 0
+            # Su entrada queda; la próxima pasada lo vuelve a escribir igual
+            _volcar_a_bd(usuario_id, lineas)
+            return 1
+
+        with bloqueo("persistir", timeout=60 * 60) as obtenido:
+            if not obtenido:
+                # Otra pasada en curso
+                return 0
+            return self._persistir_pendientes()
+
+    def _persistir_pendientes(self):
+        hecho = cache.get(self.CLAVE_HECHO, 0)
+        ultimo = cache.get(self.CLAVE_ULTIMO, 0)
+        if ultimo < hecho:
+            # El contador se perdió (desalojo) y volvió a empezar
+            hecho = 0
+
+        # Una entrada que falta puede ser de un _escribir que ya sacó su
+        # número pero aún no la guardó: se vuelve a mirar en la próxima
+        # pasada. Si sigue faltando se da por perdida (expiró).
+        hueco_anterior = cache.get(self.CLAVE_HUECO)
+        hueco = None
+        persistidos = set()
+        for desde in range(hecho + 1, ultimo + 1, self.LOTE):
+            numeros = range(desde, min(desde + self.LOTE, ultimo + 1))
+            claves = [self._clave_cambio(numero) for numero in numeros]
+            cambios = cache.get_many(claves)
+            for numero, clave in zip(numeros, claves):
+                if clave not in cambios and hueco is None and numero != hueco_anterior:
+                    hueco = numero
+
+            for pendiente in set(cambios.values()) - persistidos:
+                lineas = cache.get(self._clave(pendiente))
+                if lineas is not None:
+                    _volcar_a_bd(pendiente, lineas)
+                persistidos.add(pendiente)
+
+            cache.delete_many([
+                clave for numero, clave in zip(numeros, claves)
+                if clave in cambios and (hueco is None or numero < hueco)
+            ])
+
+        if hueco is None:
+            cache.set(self.CLAVE_HECHO, ultimo, None)
+            cache.delete(self.CLAVE_HUECO)
+        else:
+            cache.set(self.CLAVE_HECHO, hueco - 1, None)
+            cache.set(self.CLAVE_HUECO, hueco, None)
+        return len(persistidos)
+
+
+def _copia_linea(producto, cantidad):
+    return {
+        "cantidad": cantidad,
+        "precio": producto.precio,
+        "nombre": producto.nombre,
+        "imagen": imagenes.url_miniatura(producto.imagen, producto.variantes),
+    }
+
+
+@transaction.atomic
+def _volcar_a_bd(usuario_id, lineas):
+    carrito, _ = Carrito.objects.get_or_create(usuario_id=usuario_id)
+    ObjetoCarrito.objects.filter(carrito=carrito).delete()
+
+    existentes = set(
+        Producto.objects.filter(idProducto__in=list(lineas)).values_list("idProducto", flat=True)
+    )
+    # create() uno por uno: en MySQL bulk_create no devuelve las PK y las
+    # necesitamos para la tabla intermedia. Esto corre fuera de las vistas.
+    objetos = [
+        ObjetoCarrito.objects.create(
+            producto_id=producto_id,
+            cantidad=datos["cantidad"],
+            subtotal=datos["cantidad"] * datos["precio"],
+        )
+        for producto_id, datos in lineas.items()
+        if producto_id in existentes
+    ]
+    carrito.objetos.add(*objetos)
+
+    carrito.total = sum(obj.subtotal for obj in objetos)
+    carrito.save(update_fields=["total"])
+
+
+# ---------- Versión del carrito y mini-carrito en caché ----------
+
+def _clave_version(usuario_id):
+    return f"carrito:version:{usuario_id}"
+
+
+def _version_inicial():
+    # Si la clave se perdió (desalojo de la caché) no se puede volver a
+    # empezar en 1: podría coincidir con un mini-carrito viejo aún guardado.
+    return time.time_ns() // 1000
+
+
+def version(usuario_id):
+    """Número que cambia cada vez que cambia el carrito del usuario."""
+    return cache.get_or_set(_clave_version(usuario_id), _version_inicial, None)
+
+
+def _incrementar(clave):
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 0, None)
+        return cache.incr(clave)
+
+
+def invalidar(usuario_id):
+    """Marca el carrito como modificado; devuelve la nueva versión."""
+    try:
+        return cache.incr(_clave_version(usuario_id))
+    except ValueError:
+        nueva = _version_inicial()
+        cache.set(_clave_version(usuario_id), nueva, None)
+        return nueva
+
+
+def vista_previa(usuario_id):
+    """
+    Datos del mini-carrito (ver context_processors). Con la caché caliente
+    no hace ninguna consulta.
+    """
+    clave = f"carrito:vista_previa:{usuario_id}:{version(usuario_id)}"
+    datos = cache.get(clave)
+    if datos is None:
+        datos = almacen().vista_previa(usuario_id)
+        cache.set(clave, datos, TIMEOUT_VISTA_PREVIA)
+    return datos
+
+
+@contextmanager
+def bloqueo(usuario_id, timeout=10, esperar=0):
+    """
+    Bloqueo corto por usuario (``cache.add`` es atómico). Entrega False si
+    otro request está modificando el mismo carrito y no lo soltó dentro de
+    ``esperar`` segundos.
+    """
+    clave = f"carrito:bloqueo:{usuario_id}"
+    # Cada dueño guarda su ficha: al salir solo borra el bloqueo si sigue
+    # siendo suyo (si venció, ya puede tenerlo otro)
+    ficha = uuid.uuid4().hex
+    limite = time.monotonic() + esperar
+    obtenido = cache.add(clave, ficha, timeout)
+    while not obtenido and time.monotonic() < limite:
+        time.sleep(0.02)
+        obtenido = cache.add(clave, ficha, timeout)
+    try:
+        yield obtenido
+    finally:
+        if obtenido and cache.get(clave) == ficha:
+            cache.delete(clave)
+
+
+# ---------- Selección del almacenamiento ----------
+
+ALMACENES = {
+    "bd": "main.carrito.AlmacenCarritoBD",
+    "cache": "main.carrito.AlmacenCarritoCache",
+}
+
+_almacen = None
+
+
+def almacen():
+    """Almacenamiento de carritos configurado en ``CARRITO_ALMACEN``."""
+    global _almacen
+    nombre = getattr(settings, "CARRITO_ALMACEN", "bd")
+    ruta = ALMACENES.get(nombre, nombre)
+    if _almacen is None or _almacen[0] != ruta:
+        _almacen = (ruta, import_string(ruta)())
+    return _almacen[1]
@@ -1,53 +1,26 @@
 # main/context_processors.py
-from .models import Usuario, Carrito
+from . import carrito as motor_carrito
+from .facetas import indice as indice_facetas
 
 def carrito_context(request):
-    carrito_cantidad = 0
-    carrito_items_preview = []
-    carrito_total_preview = 0
-
     usuario_id = request.session.get("usuario_id")
     if not usuario_id:
         return {
-            "carrito_cantidad": carrito_cantidad,
-            "carrito_items_preview": carrito_items_preview,
-            "carrito_total_preview": carrito_total_preview,
-        }
-
-    try:
-        usuario = Usuario.objects.get(idUsuario=usuario_id)
-    except Usuario.DoesNotExist:
-        return {
-            "carrito_cantidad": carrito_cantidad,
-            "carrito_items_preview": carrito_items_preview,
-            "carrito_total_preview": carrito_total_preview,
+            "carrito_cantidad": 0,
+            "carrito_items_preview": [],
+            "carrito_total_preview": 0,
         }
 
-    carrito = Carrito.objects.filter(usuario=usuario).first()
-    if not carrito:
-        return {
-            "carrito_cantidad": carrito_cantidad,
-            "carrito_items_preview": carrito_items_preview,
-            "carrito_total_preview": carrito_total_preview,
-        }
+    # Una sola vez por request aunque se rendericen varias plantillas
+    if getattr(request, "_carrito_preview", None) is None:
+        request._carrito_preview = motor_carrito.vista_previa(usuario_id)
+    return request._carrito_preview
 
-    objetos = carrito.objetos.select_related("producto")
-    carrito_cantidad = sum(obj.cantidad for obj in objetos)
-    carrito_total_preview = carrito.total
 
-    # Mostramos máximo 3 ítems en el mini-carrito
-    for obj in objetos[:3]:
-        producto = obj.producto
-        imagen_url = producto.imagen.url if producto.imagen else None
-        carrito_items_preview.append({
-            "nombre": producto.nombre,
-            "cantidad": obj.cantidad,
-            "subtotal": obj.subtotal,
-            "imagen": imagen_url,
-        })
+def categorias_context(request):
+    """Categorías del menú principal con su cantidad de productos."""
+    menu = {"producto": [], "servicio": []}
+    for categoria in indice_facetas.conteos_por_categoria():
+        menu[categoria["tipo"]].append(categoria)
 
-    return {
-        "carrito_cantidad": carrito_cantidad,
-        "carrito_items_preview": carrito_items_preview,
-        "carrito_total_preview": carrito_total_preview,
-    }
+    return {"menu_categorias": menu}
@@ -0,0 +1,157 @@
+# main/exportacion.py
+"""
+Exportación de las ventas de un vendedor en CSV o NDJSON.
+
+Las filas salen de un generador que recorre la base por bloques (ver
+``_bloques``), así que la memoria no crece con el tamaño de la exportación:
+sirve igual para la vista (``StreamingHttpResponse``) que para el comando
+``exportar_ventas``.
+
+Incluye las ventas archivadas (main/archivo.py) de los productos que el
+vendedor todavía tiene publicados; las de productos borrados no se pueden
+atribuir a nadie, porque el archivo no guarda el vendedor.
+"""
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import DetallePedido, DetallePedidoArchivado, PedidoArchivado, Producto
+
+COLUMNAS = (
+    "pedido", "fecha", "estado", "producto_id", "producto",
+    "cantidad", "precio_unitario", "subtotal",
+)
+
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Filas que se traen de la base por viaje
+TAMANO_BLOQUE = 2000
+
+# Bytes que se juntan antes de entregar un trozo de la respuesta (con gzip,
+# cada trozo se comprime y se envía por separado)
+TAMANO_TROZO = 64 * 1024
+
+
+def rango_fechas(desde=None, hasta=None):
+    """
+    Convierte "AAAA-MM-DD" (ambos inclusive, opcionales) en el rango
+    ``[desde, hasta)`` de datetimes. ``ValueError`` si una fecha no es válida.
+    """
+    def inicio_del_dia(dia):
+        return timezone.make_aware(datetime.combine(dia, time.min))
+
+    inicio = inicio_del_dia(date.fromisoformat(desde)) if desde else None
+    fin = inicio_del_dia(date.fromisoformat(hasta) + timedelta(days=1)) if hasta else None
+    return inicio, fin
+
+
+def _bloques(queryset, *campos):
+    """
+    Recorre ``queryset`` en bloques de ``TAMANO_BLOQUE`` filas (tuplas con
+    ``campos``) paginando por ``id``. Cada bloque es una consulta corta sobre
+    la clave primaria; a diferencia de ``iterator()``, que con mysqlclient
+    igual trae el resultado completo al cliente, la memoria no depende del
+    total.
+    """
+    ultimo = None
+    while True:
+        consulta = queryset.order_by("id")
+        if ultimo is not None:
+            consulta = consulta.filter(id__gt=ultimo)
+        bloque = list(consulta.values_list("id", *campos)[:TAMANO_BLOQUE])
+        if not bloque:
+            return
+        ultimo = bloque[-1][0]
+        yield [fila[1:] for fila in bloque]
+        if len(bloque) < TAMANO_BLOQUE:
+            return
+
+
+def _filas_archivo(vendedor_id, desde, hasta):
+    productos = list(
+        Producto.objects.filter(vendedor_id=vendedor_id).values_list("idProducto", flat=True)
+    )
+    if not productos:
+        return
+    bloques = _bloques(
+        DetallePedidoArchivado.objects.filter(producto_id__in=productos),
+        "pedido_id", "producto_id", "nombre_producto", "cantidad", "precio_unitario", "subtotal",
+    )
+    for bloque in bloques:
+        # Sin claves foráneas no hay JOIN (el archivo puede estar en otra
+        # base): los pedidos se buscan por bloque de líneas
+        pedidos = PedidoArchivado.objects.filter(idPedido__in={d[0] for d in bloque})
+        if desde:
+            pedidos = pedidos.filter(fecha__gte=desde)
+        if hasta:
+            pedidos = pedidos.filter(fecha__lt=hasta)
+        datos = {p[0]: p[1:] for p in pedidos.values_list("idPedido", "fecha", "estado")}
+        for pedido_id, producto_id, nombre, cantidad, precio, subtotal in bloque:
+            if pedido_id in datos:
+                fecha, estado = datos[pedido_id]
+                yield (pedido_id, fecha, estado, producto_id, nombre, cantidad, precio, subtotal)
+
+
+def filas(vendedor_id, desde=None, hasta=None):
+    """
+    Genera una tupla (en el orden de ``COLUMNAS``) por línea vendida por
+    ``vendedor_id``, con ``desde <= fecha < hasta`` si se indican. Primero las
+    archivadas y después las recientes, cada grupo en orden de venta.
+    """
+    yield from _filas_archivo(vendedor_id, desde, hasta)
+
+    detalles = DetallePedido.objects.filter(producto__vendedor_id=vendedor_id)
+    if desde:
+        detalles = detalles.filter(pedido__fecha__gte=desde)
+    if hasta:
+        detalles = detalles.filter(pedido__fecha__lt=hasta)
+    for bloque in _bloques(
+        detalles,
+        "pedido_id", "pedido__fecha", "pedido__estado", "producto_id", "producto__nombre",
+        "cantidad", "precio_unitario", "subtotal",
+    ):
+        yield from bloque
+
+
+class _Eco:
+    """Archivo falso para csv.writer: devuelve lo escrito en vez de guardarlo."""
+
+    def write(self, valor):
+        return valor
+
+
+def como_csv(filas_):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS)
+    for fila in filas_:
+        yield escritor.writerow(fila)
+
+
+def como_ndjson(filas_):
+    for fila in filas_:
+        yield json.dumps(dict(zip(COLUMNAS, fila)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def serializar(filas_, formato):
+    """
+    Genera la exportación en ``formato`` ("csv" o "ndjson") como trozos de
+    bytes de unos ``TAMANO_TROZO``.
+    """
+    lineas = como_ndjson(filas_) if formato == "ndjson" else como_csv(filas_)
+    trozo = []
+    largo = 0
+    for linea in lineas:
+        trozo.append(linea)
+        largo += len(linea)
+        if largo >= TAMANO_TROZO:
+            yield "".join(trozo).encode()
+            trozo = []
+            largo = 0
+    if trozo:
+        yield "".join(trozo).encode()
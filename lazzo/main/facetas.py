@@ -0,0 +1,174 @@
+# main/facetas.py
+"""
+Conteos por categoría e histogramas de precio precalculados en memoria.
+
+Por cada (tipo, categoría) se guardan las listas ordenadas de precios de
+todos los productos y de los que tienen stock. Con eso cualquier combinación
+de categoría + rango de precio + "solo con stock" se responde con dos
+``bisect`` por categoría, sin ``GROUP BY`` en la base de datos.
+
+Igual que el índice de búsqueda, cada worker tiene su copia y se mantiene
+al día con ``main/sincronizacion.py``. "Con stock" es ``Producto.disponible``
+(lo mismo que filtra el catálogo con ``stock > reservado``); las reservas
+cambian ``reservado`` con ``update()`` y por eso lo anotan ellas mismas, en
+el canal de reservas que solo escucha este índice (ver ``main/reservas.py``).
+"""
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+from . import sincronizacion
+from .models import CATEGORIAS_PRODUCTO, CATEGORIAS_SERVICIO, Producto
+
+CATEGORIAS_POR_TIPO = {
+    "producto": CATEGORIAS_PRODUCTO,
+    "servicio": CATEGORIAS_SERVICIO,
+}
+
+# Límites de los tramos del histograma de precios (el último queda abierto)
+RANGOS_PRECIO = [0, 5000, 10000, 20000, 50000, 100000]
+
+
+class IndiceFacetas(sincronizacion.IndiceSincronizado):
+
+    CAMPOS = ("idProducto", "tipo", "categoria", "precio", "stock", "reservado")
+    # "Con stock" depende de ``reservado``: también escucha las reservas
+    CANALES = (sincronizacion.CANAL_PRODUCTOS, sincronizacion.CANAL_RESERVAS)
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._productos = {}
+        self._precios = {}
+        self._precios_stock = {}
+
+    # ---------- Construcción / mantenimiento ----------
+
+    def reconstruir(self, productos=None):
+        estado = sincronizacion.estado(self.CANALES)
+        if productos is None:
+            productos = Producto.objects.only(*self.CAMPOS).iterator(chunk_size=2000)
+
+        with self._lock:
+            self._productos = {}
+            self._precios = {}
+            self._precios_stock = {}
+            for producto in productos:
+                self._productos[producto.idProducto] = self._entrada(producto)
+            for clave, precio, en_stock in self._productos.values():
+                self._precios.setdefault(clave, []).append(precio)
+                if en_stock:
+                    self._precios_stock.setdefault(clave, []).append(precio)
+            for precios in (*self._precios.values(), *self._precios_stock.values()):
+                precios.sort()
+            self._estado = estado
+            self.cargado = True
+
+    def actualizar(self, producto):
+        with self._lock:
+            if not self.cargado:
+                return
+            self._quitar(producto.idProducto)
+            entrada = self._entrada(producto)
+            self._productos[producto.idProducto] = entrada
+            clave, precio, en_stock = entrada
+            insort(self._precios.setdefault(clave, []), precio)
+            if en_stock:
+                insort(self._precios_stock.setdefault(clave, []), precio)
+
+    def eliminar(self, producto_id):
+        with self._lock:
+            if not self.cargado:
+                return
+            self._quitar(producto_id)
+
+    @staticmethod
+    def _entrada(producto):
+        return (producto.tipo, producto.categoria), producto.precio, producto.disponible > 0
+
+    def _quitar(self, producto_id):
+        entrada = self._productos.pop(producto_id, None)
+        if entrada is None:
+            return
+        clave, precio, en_stock = entrada
+        _quitar_precio(self._precios.get(clave), precio)
+        if en_stock:
+            _quitar_precio(self._precios_stock.get(clave), precio)
+
+    # ---------- Consultas ----------
+
+    def _claves(self, tipo=None, categoria=None):
+        for (tipo_clave, categoria_clave) in list(self._precios):
+            if tipo and tipo_clave != tipo:
+                continue
+            if categoria and categoria_clave != categoria:
+                continue
+            yield (tipo_clave, categoria_clave)
+
+    def contar(self, tipo=None, categoria=None, min_precio=None, max_precio=None,
+               solo_stock=False):
+        """Cantidad de productos que cumplen todos los filtros dados."""
+        self.sincronizar()
+        total = 0
+        with self._lock:
+            fuente = self._precios_stock if solo_stock else self._precios
+            for clave in self._claves(tipo, categoria):
+                total += _contar_rango(fuente.get(clave, ()), min_precio, max_precio)
+        return total
+
+    def conteos_por_categoria(self, min_precio=None, max_precio=None, solo_stock=False):
+        """
+        Lista de categorías (en el orden de CATEGORIAS_PRODUCTO /
+        CATEGORIAS_SERVICIO) con la cantidad de productos de cada una.
+        """
+        self.sincronizar()
+        resultado = []
+        with self._lock:
+            fuente = self._precios_stock if solo_stock else self._precios
+            for tipo, categorias in CATEGORIAS_POR_TIPO.items():
+                for slug, label in categorias:
+                    resultado.append({
+                        "tipo": tipo,
+                        "slug": slug,
+                        "label": label,
+                        "cantidad": _contar_rango(
+                            fuente.get((tipo, slug), ()), min_precio, max_precio
+                        ),
+                    })
+        return resultado
+
+    def histograma(self, tipo=None, categoria=None, solo_stock=False):
+        """
+        Cantidad de productos por tramo de RANGOS_PRECIO. ``hasta`` es
+        inclusivo (None en el último tramo).
+        """
+        self.sincronizar()
+        limites = [limite - 1 for limite in RANGOS_PRECIO[1:]] + [None]
+        tramos = [
+            {"desde": desde, "hasta": hasta, "cantidad": 0}
+            for desde, hasta in zip(RANGOS_PRECIO, limites)
+        ]
+        with self._lock:
+            fuente = self._precios_stock if solo_stock else self._precios
+            for clave in self._claves(tipo, categoria):
+                precios = fuente.get(clave, ())
+                for tramo in tramos:
+                    tramo["cantidad"] += _contar_rango(precios, tramo["desde"], tramo["hasta"])
+        return tramos
+
+
+def _contar_rango(precios, minimo=None, maximo=None):
+    """Cantidad de precios en [minimo, maximo] (extremos opcionales)."""
+    inicio = bisect_left(precios, minimo) if minimo is not None else 0
+    fin = bisect_right(precios, maximo) if maximo is not None else len(precios)
+    return max(fin - inicio, 0)
+
+
+def _quitar_precio(precios, precio):
+    if not precios:
+        return
+    pos = bisect_left(precios, precio)
+    if pos < len(precios) and precios[pos] == precio:
+        del precios[pos]
+
+
+indice = IndiceFacetas()
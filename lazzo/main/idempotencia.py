@@ -0,0 +1,169 @@
+# main/idempotencia.py
+"""
+Claves de idempotencia para los POST que crean pedidos.
+
+El cliente manda una clave única por intento de compra: el formulario de
+checkout la trae en un campo oculto (``CAMPO``) y los clientes de la API en
+la cabecera ``Idempotency-Key``. La primera respuesta se guarda en
+``ClaveIdempotencia``; si llega otra vez la misma clave (doble clic,
+reintento de un proxy) dentro de ``VENTANA`` se devuelve la respuesta
+guardada sin tocar carrito, stock ni pedidos.
+
+Mientras el primer request corre, la clave está tomada hasta ``vence``
+(``ARRIENDO``): un repetido recibe al tiro un 409 con ``Retry-After``, sin
+dejar al worker esperando. Si el primero se cayó sin terminar, pasado
+``vence`` el siguiente intento retoma la clave y corre la vista.
+
+Las claves viejas se borran con ``manage.py limpiar_idempotencia``.
+"""
+import hashlib
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+CAMPO = "clave_idempotencia"
+CABECERA = "HTTP_IDEMPOTENCY_KEY"
+
+VENTANA = timedelta(hours=24)
+
+# Cuánto tiene un request la clave mientras corre la vista; más que el
+# timeout de los workers, para no retomar una que todavía se está procesando
+ARRIENDO = timedelta(seconds=60)
+
+# Segundos que se sugieren al cliente (Retry-After) si la clave está tomada
+REINTENTAR_EN = 2
+
+# Cabeceras de la respuesta que se guardan para repetirla
+CABECERAS_GUARDADAS = ("Content-Type", "Location")
+
+
+def nueva_clave():
+    return uuid.uuid4().hex
+
+
+def _huella(request):
+    return hashlib.sha256(request.body).hexdigest()
+
+
+def _respuesta_guardada(registro, request):
+    respuesta = HttpResponse(bytes(registro.contenido), status=registro.codigo)
+    for nombre, valor in registro.cabeceras.items():
+        respuesta[nombre] = valor
+    respuesta["Idempotent-Replayed"] = "true"
+    if respuesta.status_code in (301, 302, 303):
+        messages.warning(request, "Esta compra ya se había enviado; este es su resultado.")
+    return respuesta
+
+
+def _retomar(registro):
+    """
+    Toma una clave en curso cuyo arriendo venció. El ``UPDATE`` condicional
+    asegura que de varios reintentos solo uno la retome.
+    """
+    nuevo_vence = timezone.now() + ARRIENDO
+    retomada = ClaveIdempotencia.objects.filter(
+        id=registro.id, completada=False, vence=registro.vence,
+    ).update(vence=nuevo_vence)
+    if not retomada:
+        return None
+    registro.vence = nuevo_vence
+    return registro
+
+
+def _en_curso():
+    respuesta = HttpResponse(
+        "Tu compra se está procesando, vuelve a intentarlo en unos segundos.", status=409,
+    )
+    respuesta["Retry-After"] = str(REINTENTAR_EN)
+    return respuesta
+
+
+def idempotente(vista):
+    """
+    Decorador para vistas POST que crean pedidos. Sin clave (o sin sesión)
+    la vista corre normalmente.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        usuario_id = request.session.get("usuario_id")
+        if request.method != "POST" or not usuario_id:
+            return vista(request, *args, **kwargs)
+
+        # El cuerpo se lee antes que request.POST (en multipart después ya
+        # no se puede)
+        huella = _huella(request)
+        clave = request.META.get(CABECERA) or request.POST.get(CAMPO)
+        if not clave:
+            return vista(request, *args, **kwargs)
+        clave = clave[:64]
+        try:
+            with transaction.atomic():
+                registro = ClaveIdempotencia.objects.create(
+                    usuario_id=usuario_id, clave=clave, ruta=request.path[:100], huella=huella,
+                    vence=timezone.now() + ARRIENDO,
+                )
+        except IntegrityError:
+            existente = ClaveIdempotencia.objects.get(usuario_id=usuario_id, clave=clave)
+            if existente.creada < timezone.now() - VENTANA:
+                # Venció: se trata como una clave nueva
+                existente.delete()
+                return envoltura(request, *args, **kwargs)
+            if existente.huella != huella or existente.ruta != request.path[:100]:
+                return HttpResponse(
+                    "La clave de idempotencia ya se usó con otros datos.", status=422
+                )
+            if existente.completada:
+                return _respuesta_guardada(existente, request)
+            if existente.vence and existente.vence > timezone.now():
+                return _en_curso()
+            registro = _retomar(existente)
+            if registro is None:
+                # Otro reintento la retomó primero
+                return _en_curso()
+
+        try:
+            respuesta = vista(request, *args, **kwargs)
+        except Exception:
+            registro.delete()
+            raise
+
+        if respuesta.status_code >= 500 or getattr(respuesta, "streaming", False):
+            # Los errores del servidor se pueden reintentar
+            registro.delete()
+            return respuesta
+
+        registro.completada = True
+        registro.vence = None
+        registro.codigo = respuesta.status_code
+        registro.cabeceras = {
+            nombre: respuesta[nombre]
+            for nombre in CABECERAS_GUARDADAS
+            if respuesta.has_header(nombre)
+        }
+        registro.contenido = respuesta.content
+        registro.save(update_fields=["completada", "vence", "codigo", "cabeceras", "contenido"])
+        return respuesta
+
+    return envoltura
+
+
+def limpiar(ventana=VENTANA, lote=5000):
+    """Borra en lotes las claves más viejas que ``ventana``. Devuelve cuántas."""
+    limite = timezone.now() - ventana
+    borradas = 0
+    while True:
+        ids = list(
+            ClaveIdempotencia.objects
+            .filter(creada__lt=limite)
+            .values_list("id", flat=True)[:lote]
+        )
+        if not ids:
+            return borradas
+        borradas += ClaveIdempotencia.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,319 @@
+# main/imagenes.py
+"""
+Variantes redimensionadas de las imágenes subidas (``Producto.imagen`` y
+``Usuario.foto``).
+
+Al guardar un producto o usuario con una imagen nueva se encola la tarea
+``imagenes.variantes`` (ver signals.py). El worker de ``procesar_tareas``
+genera una copia por cada ancho de ``ANCHOS`` en WebP y JPEG, en paralelo en
+un pool de procesos (redimensionar y codificar es trabajo de CPU), y guarda
+los nombres en el campo ``variantes`` del modelo:
+
+    {"origen": "products/3f/3fa9….jpeg",
+     "200": {"webp": "variantes/9c/9c04….webp", "jpeg": "variantes/51/51e7….jpg"},
+     "400": {...}, "800": {...}}
+
+(el storage guarda cada archivo por su sha256, ver almacenamiento.py).
+
+Las fotos de perfil son avatares: se recortan al cuadrado en los lados de
+``AVATAR_LADOS`` y el dict lleva ``"tipo": "avatar"``. Si la foto es un GIF
+animado, la WebP es animada (con menos cuadros o calidad si pasa de
+``AVATAR_BYTES_MAXIMOS``) y la JPEG es el primer cuadro, para navegadores sin
+WebP.
+
+Las plantillas las usan con ``{% imagen_responsive %}`` y ``{% avatar %}``
+(templatetags/imagenes.py). Mientras no existan, se muestra la imagen original.
+"""
+import base64
+import hashlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, ImageSequence
+
+from . import usuarios
+from .tareas import tarea
+
+ANCHOS = (200, 400, 800)
+
+# Los avatares se muestran a 72-90 px: 1x y 2x
+AVATAR_LADOS = (96, 192)
+AVATAR_BYTES_MAXIMOS = 48 * 1024
+
+# formato -> (formato de Pillow, extensión, opciones de guardado)
+FORMATOS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+CARPETA = "variantes"
+
+# Lado máximo de la miniatura que va en línea en el HTML (``Producto.imagen_previa``)
+LADO_PREVIA = 16
+
+_pool = None
+
+
+def _modelo(etiqueta):
+    from .models import Producto, Usuario
+
+    return {"producto": (Producto, "imagen"), "usuario": (Usuario, "foto")}[etiqueta]
+
+
+def _tipo(etiqueta):
+    return "avatar" if etiqueta == "usuario" else None
+
+
+def _redimensionar(contenido, ancho):
+    """
+    Devuelve {formato: bytes} de la imagen a ``ancho`` px. Corre en un
+    proceso del pool, así que solo recibe y devuelve bytes.
+    """
+    with Image.open(io.BytesIO(contenido)) as original:
+        imagen = ImageOps.exif_transpose(original)
+        if imagen.width > ancho:
+            alto = max(round(imagen.height * ancho / imagen.width), 1)
+            imagen = imagen.resize((ancho, alto), Image.Resampling.LANCZOS)
+
+        codificadas = {}
+        for formato, (formato_pil, _, opciones) in FORMATOS.items():
+            copia = imagen
+            if formato_pil == "JPEG" and copia.mode not in ("RGB", "L"):
+                copia = copia.convert("RGB")
+            elif copia.mode not in ("RGB", "RGBA", "L", "LA"):
+                copia = copia.convert("RGBA")
+            salida = io.BytesIO()
+            copia.save(salida, formato_pil, **opciones)
+            codificadas[formato] = salida.getvalue()
+        return codificadas
+
+
+def _cuadrado(imagen, lado):
+    return ImageOps.fit(imagen, (lado, lado), Image.Resampling.LANCZOS)
+
+
+def _jpeg(imagen):
+    if imagen.mode in ("RGBA", "LA", "P"):
+        # Lo transparente queda blanco (convert("RGB") lo deja negro)
+        imagen = imagen.convert("RGBA")
+        fondo = Image.new("RGB", imagen.size, (255, 255, 255))
+        fondo.paste(imagen, mask=imagen.getchannel("A"))
+        imagen = fondo
+    elif imagen.mode not in ("RGB", "L"):
+        imagen = imagen.convert("RGB")
+    formato_pil, _, opciones = FORMATOS["jpeg"]
+    salida = io.BytesIO()
+    imagen.save(salida, formato_pil, **opciones)
+    return salida.getvalue()
+
+
+def _webp_animada(cuadros, duraciones, bucle):
+    """
+    WebP animada de ``cuadros``. Si pasa de ``AVATAR_BYTES_MAXIMOS`` baja la
+    calidad y después se queda con uno de cada dos (o cuatro) cuadros,
+    alargando su duración para que la animación dure lo mismo.
+    """
+    for paso in (1, 2, 4):
+        elegidos = cuadros[::paso]
+        tiempos = [sum(duraciones[i:i + paso]) for i in range(0, len(cuadros), paso)]
+        for calidad in (70, 50):
+            salida = io.BytesIO()
+            elegidos[0].save(
+                salida, "WEBP", save_all=True, append_images=elegidos[1:],
+                duration=tiempos, loop=bucle, quality=calidad, method=4,
+            )
+            if salida.tell() <= AVATAR_BYTES_MAXIMOS:
+                return salida.getvalue()
+    # La más chica que se pudo
+    return salida.getvalue()
+
+
+def _avatar(contenido, lado):
+    """{formato: bytes} del avatar cuadrado de ``lado`` px. Corre en el pool."""
+    with Image.open(io.BytesIO(contenido)) as original:
+        if getattr(original, "is_animated", False):
+            cuadros, duraciones = [], []
+            for cuadro in ImageSequence.Iterator(original):
+                duraciones.append(cuadro.info.get("duration") or 100)
+                cuadros.append(_cuadrado(cuadro.convert("RGBA"), lado))
+            return {
+                "webp": _webp_animada(cuadros, duraciones, original.info.get("loop", 0)),
+                "jpeg": _jpeg(cuadros[0]),
+            }
+
+        imagen = _cuadrado(ImageOps.exif_transpose(original), lado)
+        if imagen.mode not in ("RGB", "RGBA", "L", "LA"):
+            imagen = imagen.convert("RGBA")
+        formato_pil, _, opciones = FORMATOS["webp"]
+        salida = io.BytesIO()
+        imagen.save(salida, formato_pil, **opciones)
+        return {"webp": salida.getvalue(), "jpeg": _jpeg(imagen)}
+
+
+def _procesar(funcion, contenido, medidas):
+    procesos = getattr(settings, "IMAGENES_PROCESOS", None)
+    if procesos == 0:
+        # Sin pool (tests, servidores de un solo núcleo)
+        return [funcion(contenido, medida) for medida in medidas]
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=procesos)
+    return list(_pool.map(funcion, [contenido] * len(medidas), medidas))
+
+
+def _generar(nombre, funcion, medidas, medida_original, **extra):
+    with default_storage.open(nombre, "rb") as archivo:
+        contenido = archivo.read()
+    with Image.open(io.BytesIO(contenido)) as imagen:
+        original = medida_original(ImageOps.exif_transpose(imagen))
+
+    # Nunca se agranda: una imagen chica queda con una sola variante de su medida
+    medidas = sorted({min(medida, original) for medida in medidas})
+    base = os.path.splitext(os.path.basename(nombre))[0]
+
+    variantes = {"origen": nombre, **extra}
+    for medida, codificadas in zip(medidas, _procesar(funcion, contenido, medidas)):
+        variantes[str(medida)] = {
+            formato: default_storage.save(
+                f"{CARPETA}/{base}-{medida}.{FORMATOS[formato][1]}", ContentFile(datos)
+            )
+            for formato, datos in codificadas.items()
+        }
+    return variantes
+
+
+def generar(nombre):
+    """Genera las variantes de ``nombre`` (en el storage) y devuelve su dict."""
+    return _generar(nombre, _redimensionar, ANCHOS, lambda imagen: imagen.width)
+
+
+def generar_avatar(nombre):
+    """Como ``generar``, pero cuadradas en ``AVATAR_LADOS`` (y animadas si el GIF lo es)."""
+    return _generar(nombre, _avatar, AVATAR_LADOS, lambda imagen: min(imagen.size), tipo="avatar")
+
+
+def borrar(variantes):
+    """Borra del storage los archivos de ``variantes`` (no el original)."""
+    for _, archivos in anchos(variantes):
+        for nombre in archivos.values():
+            default_storage.delete(nombre)
+
+
+def anchos(variantes):
+    """[(ancho, {formato: nombre}), ...] de menor a mayor."""
+    return sorted(
+        (int(ancho), archivos)
+        for ancho, archivos in (variantes or {}).items()
+        if ancho.isdigit()
+    )
+
+
+def vigentes(archivo, variantes, tipo=None):
+    """True si ``variantes`` corresponden a la imagen actual ``archivo`` (y son del ``tipo``)."""
+    return (
+        bool(archivo) and bool(variantes)
+        and variantes.get("origen") == archivo.name
+        and variantes.get("tipo") == tipo
+    )
+
+
+def medir(archivo):
+    """
+    (ancho, alto, previa) de la imagen en ``archivo`` (un archivo abierto).
+    El ancho y alto son los que se ven (con la rotación EXIF aplicada) y la
+    previa es una WebP de ``LADO_PREVIA`` px como data URI (~150 bytes).
+    """
+    with Image.open(archivo) as original:
+        ancho, alto = original.size
+        if original.getexif().get(0x0112) in (5, 6, 7, 8):
+            # Rotada 90°: el navegador la muestra con los lados cambiados
+            ancho, alto = alto, ancho
+        # draft() decodifica las JPEG ya achicadas: no se arma la imagen entera
+        original.draft("RGB", (LADO_PREVIA * 4, LADO_PREVIA * 4))
+        imagen = ImageOps.exif_transpose(original)
+        transparente = imagen.mode in ("RGBA", "LA", "PA") or "transparency" in imagen.info
+        imagen = imagen.convert("RGBA" if transparente else "RGB")
+        imagen.thumbnail((LADO_PREVIA, LADO_PREVIA))
+        salida = io.BytesIO()
+        imagen.save(salida, "WEBP", quality=40)
+    return ancho, alto, "data:image/webp;base64," + base64.b64encode(salida.getvalue()).decode()
+
+
+def preparar_producto(producto):
+    """
+    Antes de guardar: si la imagen es una subida nueva, calcula sus medidas
+    y su previa; si se quitó, las borra.
+    """
+    imagen = producto.imagen
+    if not imagen:
+        producto.imagen_ancho = producto.imagen_alto = None
+        producto.imagen_previa = ""
+        return
+    if imagen._committed:
+        return
+    archivo = imagen.file
+    archivo.seek(0)
+    try:
+        producto.imagen_ancho, producto.imagen_alto, producto.imagen_previa = medir(archivo)
+    finally:
+        archivo.seek(0)
+
+
+def url_miniatura(archivo, variantes, formato="jpeg"):
+    """URL de la variante más chica (o del original si todavía no hay)."""
+    if not archivo:
+        return None
+    if vigentes(archivo, variantes):
+        _, archivos = anchos(variantes)[0]
+        return default_storage.url(archivos[formato])
+    return archivo.url
+
+
+@tarea("imagenes.variantes", max_intentos=3)
+def generar_variantes(modelo, pk, archivo):
+    clase, campo = _modelo(modelo)
+    anteriores = clase.objects.filter(pk=pk).values_list("variantes", flat=True).first()
+    if anteriores is None:
+        return
+
+    variantes = generar_avatar(archivo) if _tipo(modelo) == "avatar" else generar(archivo)
+    # Solo si la imagen sigue siendo la misma (pudo cambiar mientras tanto)
+    if clase.objects.filter(pk=pk, **{campo: archivo}).update(variantes=variantes):
+        # Aunque sean de la misma imagen: cada save() del storage sumó una
+        # referencia a los archivos, y las de las anteriores se sueltan
+        borrar(anteriores)
+        if modelo == "usuario":
+            # update() no emite post_save: la copia de request.usuario se descarta a mano
+            usuarios.invalidar(pk)
+    else:
+        borrar(variantes)
+
+
+def programar(instancia, etiqueta):
+    """
+    Encola las variantes de ``instancia`` si su imagen cambió y devuelve
+    True si lo hizo. Si se quitó la imagen, borra las variantes que tenía.
+    """
+    clase, campo = _modelo(etiqueta)
+    archivo = getattr(instancia, campo)
+    if vigentes(archivo, instancia.variantes, _tipo(etiqueta)):
+        return False
+    if not archivo:
+        if instancia.variantes:
+            borrar(instancia.variantes)
+            clase.objects.filter(pk=instancia.pk).update(variantes={})
+            instancia.variantes = {}
+        return False
+
+    huella = hashlib.sha1(archivo.name.encode()).hexdigest()[:16]
+    # Si la imagen vuelve a una que ya tuvo, la tarea de entonces ya terminó
+    # y sus variantes se soltaron: ``repetir`` la vuelve a poner en cola
+    generar_variantes.encolar(
+        modelo=etiqueta, pk=instancia.pk, archivo=archivo.name,
+        clave=f"imagen:{etiqueta}:{instancia.pk}:{huella}", repetir=True,
+    )
+    return True
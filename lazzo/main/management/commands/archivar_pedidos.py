@@ -0,0 +1,65 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import archivo
+from main.models import Pedido
+from main.routers import alias_archivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve al archivo los pedidos más viejos que --dias (con sus líneas "
+        "y pagos), en lotes. Se puede interrumpir y volver a correr."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dias", type=int, default=getattr(settings, "ARCHIVO_PEDIDOS_DIAS", 365),
+            help="Antigüedad mínima en días (por defecto ARCHIVO_PEDIDOS_DIAS).",
+        )
+        parser.add_argument(
+            "--lote", type=int, default=500,
+            help="Pedidos por transacción (por defecto 500).",
+        )
+        parser.add_argument(
+            "--max-lotes", type=int, default=None,
+            help="Detenerse después de esta cantidad de lotes.",
+        )
+
+    def handle(self, *args, **options):
+        antes_de = timezone.now() - timedelta(days=options["dias"])
+        pendientes = Pedido.objects.filter(fecha__lt=antes_de).count()
+        self.stdout.write(
+            f"{pendientes} pedidos anteriores a {antes_de:%Y-%m-%d} por archivar "
+            f"(base de archivo: {alias_archivo()})."
+        )
+        if not pendientes:
+            return
+
+        inicio = time.perf_counter()
+        totales = {"pedidos": 0, "detalles": 0, "pagos": 0}
+
+        def progreso(pedidos, detalles, pagos):
+            totales["pedidos"] += pedidos
+            totales["detalles"] += detalles
+            totales["pagos"] += pagos
+            segundos = time.perf_counter() - inicio
+            self.stdout.write(
+                f"  {totales['pedidos']}/{pendientes} pedidos "
+                f"({totales['pedidos'] * 100 // pendientes}%), "
+                f"{totales['pedidos'] / segundos:.0f} pedidos/s"
+            )
+
+        movidos = archivo.archivar(
+            antes_de, lote=options["lote"], max_lotes=options["max_lotes"], progreso=progreso,
+        )
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{movidos} pedidos archivados ({totales['detalles']} líneas, "
+            f"{totales['pagos']} pagos) en {duracion:.2f}s."
+        ))
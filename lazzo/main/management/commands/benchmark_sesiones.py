@@ -0,0 +1,101 @@
+import statistics
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from main.models import Usuario
+
+MOTORES = (
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+    "main.sesiones",
+)
+
+URLS = ("/", "/cart/", "/pedidos/", "/account/")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara los motores de sesión (consultas a la BD y latencia por "
+        "request) navegando como un usuario logueado."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--usuario", type=int,
+            help="Id del usuario con el que se navega (por defecto el primero).",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=50,
+            help="Requests por motor (por defecto 50), repartidos entre las URLs.",
+        )
+        parser.add_argument(
+            "--motor", action="append", dest="motores",
+            help="Motor a medir (se puede repetir). Por defecto: " + ", ".join(MOTORES),
+        )
+
+    def handle(self, *args, **options):
+        usuario = (
+            Usuario.objects.filter(idUsuario=options["usuario"]).first()
+            if options["usuario"]
+            else Usuario.objects.order_by("idUsuario").first()
+        )
+        if usuario is None:
+            raise CommandError("No hay un usuario con el que navegar.")
+
+        # El cliente de pruebas se presenta como "testserver"
+        hosts = list(settings.ALLOWED_HOSTS) + ["testserver"]
+
+        self.stdout.write(
+            f"{'motor':45} {'consultas/req':>14} {'a django_session':>17} "
+            f"{'escrituras':>11} {'ms/req':>8} {'p95 ms':>8}"
+        )
+        for motor in options["motores"] or MOTORES:
+            with override_settings(SESSION_ENGINE=motor, ALLOWED_HOSTS=hosts):
+                fila = self._medir(motor, usuario, options["requests"])
+            self.stdout.write(
+                f"{motor:45} {fila['consultas']:>14.2f} {fila['sesion']:>17.2f} "
+                f"{fila['escrituras']:>11.2f} {fila['ms']:>8.2f} {fila['p95']:>8.2f}"
+            )
+
+    def _medir(self, motor, usuario, cantidad):
+        sesion = import_module(motor).SessionStore()
+        sesion["usuario_id"] = usuario.idUsuario
+        sesion["usuario_nombre"] = usuario.nombre_completo
+        sesion["usuario_rol"] = usuario.rol
+        sesion.create()
+
+        cliente = Client()
+        cliente.cookies[settings.SESSION_COOKIE_NAME] = sesion.session_key
+        # Un request de calentamiento (índices, plantillas, caché de la sesión)
+        cliente.get(URLS[0])
+
+        consultas = consultas_sesion = escrituras = 0
+        tiempos = []
+        try:
+            for i in range(cantidad):
+                with CaptureQueriesContext(connection) as capturadas:
+                    inicio = time.perf_counter()
+                    cliente.get(URLS[i % len(URLS)])
+                    tiempos.append((time.perf_counter() - inicio) * 1000)
+                consultas += len(capturadas.captured_queries)
+                for consulta in capturadas.captured_queries:
+                    if "django_session" in consulta["sql"]:
+                        consultas_sesion += 1
+                        if not consulta["sql"].lstrip().upper().startswith("SELECT"):
+                            escrituras += 1
+        finally:
+            sesion.delete()
+
+        return {
+            "consultas": consultas / cantidad,
+            "sesion": consultas_sesion / cantidad,
+            "escrituras": escrituras / cantidad,
+            "ms": statistics.mean(tiempos),
+            "p95": statistics.quantiles(tiempos, n=20)[-1] if len(tiempos) > 1 else tiempos[0],
+        }
@@ -0,0 +1,46 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from main import almacenamiento, imagenes
+
+
+class Command(BaseCommand):
+    help = (
+        "Pasa los archivos de MEDIA_ROOT subidos antes del storage por "
+        "contenido a su nombre por sha256, borra las copias repetidas y los "
+        "archivos que nada usa, y actualiza las filas que los usan. Recorre "
+        "el árbol de a un archivo; se puede interrumpir y volver a correr."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cada", type=int, default=100,
+            help="Mostrar el avance cada esta cantidad de archivos (por defecto 100).",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        archivos = duplicados = liberados = borrados = 0
+
+        # Las variantes no se migran: se regeneran con el nombre nuevo de su imagen
+        for nombre in almacenamiento.pendientes(default_storage, omitir=(imagenes.CARPETA,)):
+            destino, duplicado, tamano, _, borrado = almacenamiento.migrar(default_storage, nombre)
+            archivos += 1
+            duplicados += duplicado
+            borrados += borrado
+            liberados += tamano * (duplicado + borrado)
+            if options["verbosity"] > 1:
+                detalle = " (sin uso, borrado)" if borrado else " (duplicado)" if duplicado else ""
+                self.stdout.write(f"  {nombre} -> {destino}{detalle}")
+            if archivos % options["cada"] == 0:
+                segundos = time.perf_counter() - inicio
+                self.stdout.write(f"  {archivos} archivos, {archivos / segundos:.0f} archivos/s")
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{archivos} archivos migrados, {duplicados} duplicados borrados, "
+            f"{borrados} sin uso borrados ({liberados / 1024:.0f} KB liberados), "
+            f"en {duracion:.2f}s."
+        ))
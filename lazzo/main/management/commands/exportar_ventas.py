@@ -0,0 +1,71 @@
+import gzip
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main import exportacion
+from main.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta las ventas de un vendedor en CSV o NDJSON, leyendo la base "
+        "por bloques (memoria constante sin importar el tamaño)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("vendedor_id", type=int)
+        parser.add_argument(
+            "--formato", choices=sorted(exportacion.FORMATOS), default="csv",
+        )
+        parser.add_argument("--desde", help="Fecha inicial AAAA-MM-DD (inclusive).")
+        parser.add_argument("--hasta", help="Fecha final AAAA-MM-DD (inclusive).")
+        parser.add_argument(
+            "--salida", help="Archivo de salida (por defecto la salida estándar).",
+        )
+        parser.add_argument(
+            "--gzip", action="store_true", help="Comprimir la salida con gzip.",
+        )
+
+    def handle(self, *args, **options):
+        vendedor_id = options["vendedor_id"]
+        if not Usuario.objects.filter(idUsuario=vendedor_id, rol="vendedor").exists():
+            raise CommandError(f"No existe el vendedor {vendedor_id}.")
+        try:
+            desde, hasta = exportacion.rango_fechas(options["desde"], options["hasta"])
+        except ValueError:
+            raise CommandError("Las fechas deben tener el formato AAAA-MM-DD.")
+
+        contador = {"filas": 0}
+
+        def contar(filas):
+            for fila in filas:
+                contador["filas"] += 1
+                yield fila
+
+        inicio = time.perf_counter()
+        trozos = exportacion.serializar(
+            contar(exportacion.filas(vendedor_id, desde, hasta)), options["formato"],
+        )
+
+        destino = open(options["salida"], "wb") if options["salida"] else sys.stdout.buffer
+        try:
+            if options["gzip"]:
+                with gzip.GzipFile(fileobj=destino, mode="wb") as comprimido:
+                    for trozo in trozos:
+                        comprimido.write(trozo)
+            else:
+                for trozo in trozos:
+                    destino.write(trozo)
+        finally:
+            if options["salida"]:
+                destino.close()
+            else:
+                destino.flush()
+
+        duracion = time.perf_counter() - inicio
+        # A stderr: stdout puede ser la exportación misma
+        self.stderr.write(self.style.SUCCESS(
+            f"{contador['filas']} filas exportadas en {duracion:.2f}s."
+        ))
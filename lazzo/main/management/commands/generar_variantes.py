@@ -0,0 +1,63 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from main import imagenes, tareas
+from main.models import Producto, Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Encola las variantes (WebP/JPEG por ancho, avatares cuadrados para "
+        "las fotos de perfil) de las imágenes que aún no las tienen, p. ej. "
+        "las subidas antes de existir el pipeline. También calcula las "
+        "medidas y la previa de los productos que no las tienen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--procesar", action="store_true",
+            help="Además procesa la cola ahora en vez de esperar al worker.",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        encoladas = 0
+        for modelo, etiqueta, campo in (
+            (Producto, "producto", "imagen"),
+            (Usuario, "usuario", "foto"),
+        ):
+            filas = modelo.objects.exclude(**{campo: ""}).exclude(**{f"{campo}__isnull": True})
+            for instancia in filas.only("pk", campo, "variantes").iterator(chunk_size=500):
+                if imagenes.programar(instancia, etiqueta):
+                    encoladas += 1
+
+        medidos = 0
+        sin_medidas = (
+            Producto.objects.exclude(imagen="").exclude(imagen__isnull=True).filter(imagen_previa="")
+        )
+        for producto in sin_medidas.only("pk", "imagen").iterator(chunk_size=500):
+            try:
+                with default_storage.open(producto.imagen.name, "rb") as archivo:
+                    ancho, alto, previa = imagenes.medir(archivo)
+            except OSError as error:
+                self.stderr.write(f"  {producto.imagen.name}: {error}")
+                continue
+            medidos += Producto.objects.filter(pk=producto.pk, imagen=producto.imagen.name).update(
+                imagen_ancho=ancho, imagen_alto=alto, imagen_previa=previa,
+            )
+
+        mensaje = f"{encoladas} imágenes encoladas, {medidos} productos medidos"
+        if options["procesar"]:
+            completadas = fallidas = 0
+            while True:
+                hechas, fallas = tareas.procesar(lote=10)
+                if not hechas and not fallas:
+                    break
+                completadas += hechas
+                fallidas += fallas
+            mensaje += f", {completadas} tareas completadas y {fallidas} fallidas"
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f"{mensaje} en {duracion:.2f}s."))
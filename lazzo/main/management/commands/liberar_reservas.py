@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import reservas
+
+
+class Command(BaseCommand):
+    help = (
+        "Libera en lote las reservas de stock vencidas. Pensado para "
+        "correr cada pocos minutos (cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote", type=int, default=1000,
+            help="Reservas por transacción (por defecto 1000).",
+        )
+        parser.add_argument(
+            "--recalcular", action="store_true",
+            help="Además rehace Producto.reservado desde las reservas existentes.",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        liberadas = reservas.liberar_vencidas(lote=options["lote"])
+        mensaje = f"{liberadas} reservas vencidas liberadas"
+
+        if options["recalcular"]:
+            corregidos = reservas.recalcular_reservado()
+            mensaje += f", {corregidos} productos corregidos"
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f"{mensaje} en {duracion:.2f}s."))
@@ -0,0 +1,25 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from main import idempotencia
+
+
+class Command(BaseCommand):
+    help = "Borra las claves de idempotencia de checkout más viejas que la ventana."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--horas", type=int, default=int(idempotencia.VENTANA.total_seconds() // 3600),
+            help="Antigüedad mínima de las claves a borrar (por defecto la ventana, 24).",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        borradas = idempotencia.limpiar(timedelta(hours=options["horas"]))
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{borradas} claves de idempotencia borradas en {duracion:.2f}s."
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import carrito
+
+
+class Command(BaseCommand):
+    help = (
+        "Escribe en la base de datos los carritos modificados en caché "
+        "(solo hace algo con CARRITO_ALMACEN = 'cache')."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--usuario", type=int, default=None,
+            help="Persistir solo el carrito de este usuario.",
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        persistidos = carrito.almacen().persistir(options["usuario"])
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{persistidos} carritos persistidos en {duracion:.2f}s."
+        ))
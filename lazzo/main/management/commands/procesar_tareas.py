@@ -0,0 +1,64 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import tareas
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de la cola de tareas en segundo plano (notificaciones de "
+        "pedidos, alertas de stock, etc.). Corre hasta recibir SIGINT/SIGTERM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote", type=int, default=10,
+            help="Tareas que se toman por vuelta (por defecto 10).",
+        )
+        parser.add_argument(
+            "--intervalo", type=float, default=1.0,
+            help="Segundos de espera cuando no hay tareas (por defecto 1).",
+        )
+        parser.add_argument(
+            "--una-vez", action="store_true",
+            help="Procesa lo que haya pendiente y termina.",
+        )
+        parser.add_argument(
+            "--purgar-dias", type=int, default=7,
+            help="Al iniciar, borra las tareas completadas hace más de N días.",
+        )
+
+    def handle(self, *args, **options):
+        self.detener = False
+        signal.signal(signal.SIGTERM, self._detener)
+        signal.signal(signal.SIGINT, self._detener)
+
+        purgadas = tareas.purgar(options["purgar_dias"])
+        if purgadas:
+            self.stdout.write(f"{purgadas} tareas completadas purgadas.")
+
+        total_ok = total_error = 0
+        inicio = time.perf_counter()
+        while not self.detener:
+            # El worker vive mucho: evita usar conexiones caídas o viejas
+            close_old_connections()
+            completadas, fallidas = tareas.procesar(options["lote"])
+            total_ok += completadas
+            total_error += fallidas
+
+            if not completadas and not fallidas:
+                if options["una_vez"]:
+                    break
+                time.sleep(options["intervalo"])
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{total_ok} tareas completadas, {total_error} con error en {duracion:.2f}s."
+        ))
+
+    def _detener(self, signum, frame):
+        # Termina la tarea en curso y sale
+        self.detener = True
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import popularidad
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula desde cero el puntaje de popularidad (orden 'relevancia') "
+        "a partir de publicaciones, favoritos y ventas."
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        actualizados = popularidad.recalcular()
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Popularidad recalculada para {actualizados} productos en {duracion:.2f}s."
+        ))
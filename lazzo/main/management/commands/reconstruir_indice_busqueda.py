@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import sincronizacion
+from main.busqueda import indice
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye el índice de búsqueda de productos y pide a los workers "
+        "que recarguen sus índices en la próxima consulta."
+    )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        indice.reconstruir()
+        duracion = time.perf_counter() - inicio
+
+        sincronizacion.invalidar_todo()
+
+        stats = indice.estadisticas()
+        self.stdout.write(self.style.SUCCESS(
+            f"Índice reconstruido: {stats['productos']} productos, "
+            f"{stats['terminos']} términos en {duracion:.2f}s."
+        ))
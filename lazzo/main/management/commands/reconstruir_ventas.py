@@ -0,0 +1,46 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from main import ventas
+
+
+class Command(BaseCommand):
+    help = (
+        "Rehace las ventas diarias (panel de vendedores) a partir de los "
+        "pedidos, incluidos los archivados. Una transacción por tramo de días."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Primer día AAAA-MM-DD (por defecto el del pedido más antiguo).")
+        parser.add_argument("--hasta", help="Último día AAAA-MM-DD (por defecto hoy).")
+        parser.add_argument(
+            "--dias-por-lote", type=int, default=31,
+            help="Días que se rehacen por transacción (por defecto 31).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options["desde"]) if options["desde"] else ventas.primer_dia()
+            hasta = date.fromisoformat(options["hasta"]) if options["hasta"] else timezone.localdate()
+        except ValueError:
+            raise CommandError("Las fechas deben tener el formato AAAA-MM-DD.")
+        if desde is None:
+            self.stdout.write("No hay pedidos.")
+            return
+
+        inicio = time.perf_counter()
+        filas = 0
+        tramo = desde
+        while tramo <= hasta:
+            fin = min(tramo + timedelta(days=options["dias_por_lote"] - 1), hasta)
+            filas += ventas.reconstruir(tramo, fin)
+            self.stdout.write(f"  {tramo} a {fin}: {filas} filas")
+            tramo = fin + timedelta(days=1)
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"{filas} filas de ventas diarias rehechas en {duracion:.2f}s."
+        ))
@@ -0,0 +1,152 @@
+# main/media.py
+"""
+Entrega de los archivos de MEDIA_ROOT (vista ``media_servir``).
+
+- ETag fuerte y Last-Modified, con 304 para If-None-Match / If-Modified-Since
+  (``get_conditional_response`` de Django).
+- Los nombres por contenido (ver almacenamiento.py) no cambian nunca: se
+  cachean un año con ``immutable``. El resto, ``MAX_AGE`` segundos.
+- ``Range: bytes=...`` de un tramo (206 / 416), respetando If-Range.
+- Con ``MEDIA_ENVIO = "x-sendfile"`` o ``"x-accel-redirect"`` la vista solo
+  arma las cabeceras y el servidor web (Apache / nginx) manda los bytes,
+  incluidos los Range. En nginx la ruta interna se arma con
+  ``MEDIA_ACCEL_PREFIJO``:
+
+      location /protegido/media/ { internal; alias /ruta/a/media/; }
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .almacenamiento import PATRON_NOMBRE
+
+MAX_AGE = 60 * 60
+MAX_AGE_INMUTABLE = 60 * 60 * 24 * 365
+
+TAMANO_TROZO = 64 * 1024
+
+PATRON_RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag(nombre, estado):
+    if PATRON_NOMBRE.match(nombre):
+        # El nombre ya es el sha256 del contenido
+        return '"%s"' % os.path.splitext(os.path.basename(nombre))[0]
+    return '"%x-%x"' % (estado.st_size, estado.st_mtime_ns)
+
+
+def _cabeceras(respuesta, nombre, etag, estado):
+    respuesta["ETag"] = etag
+    respuesta["Last-Modified"] = http_date(estado.st_mtime)
+    if PATRON_NOMBRE.match(nombre):
+        respuesta["Cache-Control"] = f"public, max-age={MAX_AGE_INMUTABLE}, immutable"
+    else:
+        respuesta["Cache-Control"] = f"public, max-age={MAX_AGE}"
+    return respuesta
+
+
+def _rango(request, tamano, etag, modificado):
+    """
+    (inicio, fin) inclusivos del Range pedido, None si no hay que
+    atenderlo (sin Range, varios tramos o If-Range que no coincide) o
+    False si no se puede satisfacer.
+    """
+    pedido = request.headers.get("Range")
+    if not pedido:
+        return None
+    si_rango = request.headers.get("If-Range")
+    if si_rango and si_rango != etag and parse_http_date_safe(si_rango) != int(modificado):
+        return None
+    coincidencia = PATRON_RANGO.match(pedido.strip())
+    if not coincidencia:
+        # Varios tramos o unidades desconocidas: se manda el archivo entero
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        if not fin or not int(fin):
+            return False
+        # bytes=-N: los últimos N
+        return max(tamano - int(fin), 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return False
+    return inicio, fin
+
+
+def _trozos(ruta, inicio, largo):
+    with open(ruta, "rb") as archivo:
+        archivo.seek(inicio)
+        while largo > 0:
+            trozo = archivo.read(min(TAMANO_TROZO, largo))
+            if not trozo:
+                return
+            largo -= len(trozo)
+            yield trozo
+
+
+def respuesta(request, nombre):
+    """Respuesta para ``GET``/``HEAD`` de ``nombre`` (relativo a MEDIA_ROOT)."""
+    try:
+        ruta = safe_join(settings.MEDIA_ROOT, nombre)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        estado = os.stat(ruta)
+    except (OSError, ValueError):
+        raise Http404
+    if not os.path.isfile(ruta):
+        raise Http404
+
+    etag = _etag(nombre, estado)
+    condicional = get_conditional_response(
+        request, etag=etag, last_modified=int(estado.st_mtime)
+    )
+    if condicional is not None:
+        # 304 (o 412): sin cuerpo, pero con las cabeceras de caché
+        return _cabeceras(condicional, nombre, etag, estado)
+
+    tipo = mimetypes.guess_type(ruta)[0] or "application/octet-stream"
+    envio = getattr(settings, "MEDIA_ENVIO", None)
+
+    if envio:
+        salida = HttpResponse(content_type=tipo)
+        if envio == "x-accel-redirect":
+            prefijo = getattr(settings, "MEDIA_ACCEL_PREFIJO", "/protegido/media/")
+            salida["X-Accel-Redirect"] = prefijo + quote(nombre)
+        else:
+            salida["X-Sendfile"] = ruta
+        # El servidor web pone el largo y atiende los Range
+        return _cabeceras(salida, nombre, etag, estado)
+
+    rango = _rango(request, estado.st_size, etag, estado.st_mtime)
+    if rango is False:
+        salida = HttpResponse(status=416, content_type=tipo)
+        salida["Content-Range"] = f"bytes */{estado.st_size}"
+        return _cabeceras(salida, nombre, etag, estado)
+
+    if request.method == "HEAD":
+        salida = HttpResponse(content_type=tipo)
+        largo = estado.st_size
+    elif rango:
+        inicio, fin = rango
+        largo = fin - inicio + 1
+        salida = StreamingHttpResponse(_trozos(ruta, inicio, largo), status=206, content_type=tipo)
+        salida["Content-Range"] = f"bytes {inicio}-{fin}/{estado.st_size}"
+    else:
+        # FileResponse usa wsgi.file_wrapper: el servidor WSGI puede mandar
+        # el archivo con sendfile() sin pasar los bytes por Python
+        salida = FileResponse(open(ruta, "rb"), content_type=tipo)
+        largo = estado.st_size
+
+    salida["Content-Length"] = str(largo)
+    salida["Accept-Ranges"] = "bytes"
+    return _cabeceras(salida, nombre, etag, estado)
@@ -0,0 +1,21 @@
+# main/middleware.py
+from django.utils.functional import SimpleLazyObject
+
+from . import usuarios
+
+
+class UsuarioActualMiddleware:
+    """
+    Agrega ``request.usuario``: el ``Usuario`` de la sesión, o algo falso
+    (``not request.usuario``) si no hay nadie logueado. Se carga recién al
+    usarlo y una sola vez por request, normalmente desde la caché.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.usuario = SimpleLazyObject(
+            lambda: usuarios.obtener(request.session.get("usuario_id"))
+        )
+        return self.get_response(request)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_favorito'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='fecha_publicacion',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='producto',
+            name='popularidad',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(fields=['popularidad', 'idProducto'], name='producto_popularidad_idx'),
+        ),
+    ]
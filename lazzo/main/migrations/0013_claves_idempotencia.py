@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_tareas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64)),
+                ('ruta', models.CharField(max_length=100)),
+                ('huella', models.CharField(max_length=64)),
+                ('completada', models.BooleanField(default=False)),
+                ('codigo', models.IntegerField(blank=True, null=True)),
+                ('cabeceras', models.JSONField(default=dict)),
+                ('contenido', models.BinaryField(default=b'')),
+                ('creada', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main.usuario')),
+            ],
+            options={
+                'unique_together': {('usuario', 'clave')},
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:58
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def rellenar_resumenes(apps, schema_editor):
+    Pedido = apps.get_model("main", "Pedido")
+    DetallePedido = apps.get_model("main", "DetallePedido")
+    Pago = apps.get_model("main", "Pago")
+
+    pedidos = list(Pedido.objects.order_by("idPedido").values_list("idPedido", flat=True))
+    for inicio in range(0, len(pedidos), 500):
+        ids = pedidos[inicio:inicio + 500]
+        resumenes = {pedido_id: {"cantidad_items": 0} for pedido_id in ids}
+
+        detalles = (
+            DetallePedido.objects
+            .filter(pedido_id__in=ids)
+            .select_related("producto")
+            .order_by("id")
+        )
+        for detalle in detalles:
+            resumen = resumenes[detalle.pedido_id]
+            resumen["cantidad_items"] += detalle.cantidad
+            if "producto_principal" not in resumen:
+                resumen["producto_principal"] = detalle.producto.nombre[:100]
+                if detalle.producto.imagen:
+                    resumen["miniatura"] = default_storage.url(detalle.producto.imagen.name)
+
+        for pedido_id, estado in (
+            Pago.objects.filter(pedido_id__in=ids).order_by("-idPago").values_list("pedido_id", "estado")
+        ):
+            resumenes[pedido_id].setdefault("estado_pago", estado)
+
+        cambiados = []
+        for pedido in Pedido.objects.filter(idPedido__in=ids):
+            for campo, valor in resumenes[pedido.idPedido].items():
+                setattr(pedido, campo, valor)
+            cambiados.append(pedido)
+        Pedido.objects.bulk_update(
+            cambiados, ["cantidad_items", "producto_principal", "miniatura", "estado_pago"]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_claves_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='cantidad_items',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='estado_pago',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='miniatura',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='producto_principal',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', '-fecha', '-idPedido'], name='pedido_usuario_fecha_idx'),
+        ),
+        migrations.RunPython(rellenar_resumenes, migrations.RunPython.noop),
+    ]
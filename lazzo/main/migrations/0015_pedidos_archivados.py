@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_pedido_resumen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetallePedidoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('pedido_id', models.IntegerField(db_index=True)),
+                ('producto_id', models.IntegerField()),
+                ('nombre_producto', models.CharField(max_length=100)),
+                ('imagen_producto', models.CharField(blank=True, max_length=255)),
+                ('cantidad', models.IntegerField(default=1)),
+                ('precio_unitario', models.IntegerField()),
+                ('subtotal', models.IntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PagoArchivado',
+            fields=[
+                ('idPago', models.IntegerField(primary_key=True, serialize=False)),
+                ('pedido_id', models.IntegerField(db_index=True)),
+                ('monto', models.IntegerField()),
+                ('metodo', models.CharField(max_length=30)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('pagado', 'Pagado'), ('enviado', 'Enviado'), ('entregado', 'Entregado'), ('cancelado', 'Cancelado')], default='pendiente', max_length=20)),
+                ('fecha', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PedidoArchivado',
+            fields=[
+                ('idPedido', models.IntegerField(primary_key=True, serialize=False)),
+                ('usuario_id', models.IntegerField()),
+                ('fecha', models.DateTimeField()),
+                ('estado', models.CharField(max_length=20)),
+                ('total', models.IntegerField()),
+                ('direccion', models.CharField(blank=True, max_length=100, null=True)),
+                ('envio', models.IntegerField(default=0)),
+                ('cantidad_items', models.IntegerField(default=0)),
+                ('producto_principal', models.CharField(blank=True, max_length=100)),
+                ('miniatura', models.CharField(blank=True, max_length=255)),
+                ('estado_pago', models.CharField(blank=True, max_length=20)),
+                ('archivado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario_id', '-fecha', '-idPedido'], name='pedarch_usuario_fecha_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_pedidos_archivados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='acumulado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='VentaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('ingresos', models.BigIntegerField(default=0)),
+                ('pedidos', models.IntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='main.producto')),
+                ('vendedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ventas_diarias', to='main.usuario')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['vendedor', 'dia'], name='venta_vendedor_dia_idx')],
+                'unique_together': {('producto', 'dia')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_ventas_diarias'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='variantes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='variantes',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_variantes_imagen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=255, unique=True)),
+                ('hash', models.CharField(db_index=True, max_length=64)),
+                ('tamano', models.BigIntegerField()),
+                ('referencias', models.IntegerField(default=0)),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_medidas_imagen_producto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claveidempotencia',
+            name='vence',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
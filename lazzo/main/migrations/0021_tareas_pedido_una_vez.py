@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_arriendo_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='confirmacion_enviada',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='popularidad_sumada',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='vendedores_avisados',
+            field=models.BooleanField(default=False),
+        ),
+    ]
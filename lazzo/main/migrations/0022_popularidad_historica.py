@@ -0,0 +1,109 @@
+import math
+from datetime import datetime, timezone
+
+from django.db import migrations
+from django.db.models import Min, Sum
+
+# Copia de main/popularidad.py al escribir esta migración: si el cálculo
+# cambia después, esta migración tiene que seguir dando lo mismo
+EPOCA = datetime(2025, 1, 1, tzinfo=timezone.utc)
+VIDA_MEDIA_DIAS = 14
+PESO_PUBLICACION = 10.0
+PESO_FAVORITO = 3.0
+PESO_UNIDAD_VENDIDA = 5.0
+
+
+def puntaje(peso, momento):
+    dias = (momento - EPOCA).total_seconds() / 86400
+    return math.log2(peso) + dias / VIDA_MEDIA_DIAS
+
+
+def sumar_puntajes(a, b):
+    return max(a, b) + math.log2(1 + 2 ** -abs(a - b))
+
+
+def fechas_publicacion(apps, schema_editor):
+    """
+    0010 dejó a todos los productos con la fecha de esa migración. Se
+    estima desde el historial: un producto se publicó antes de su primera
+    venta y de su primer favorito, y antes que cualquier producto con un id
+    mayor (los ids son crecientes). Los que no tienen nada de historial ni
+    productos posteriores con historial quedan como estaban.
+    """
+    Producto = apps.get_model("main", "Producto")
+    DetallePedido = apps.get_model("main", "DetallePedido")
+    Favorito = apps.get_model("main", "Favorito")
+
+    primeras = dict(
+        DetallePedido.objects.values("producto_id").annotate(primera=Min("pedido__fecha"))
+        .values_list("producto_id", "primera")
+    )
+    for producto_id, fecha in (
+        Favorito.objects.values("producto_id").annotate(primera=Min("fecha"))
+        .values_list("producto_id", "primera")
+    ):
+        if producto_id not in primeras or fecha < primeras[producto_id]:
+            primeras[producto_id] = fecha
+
+    cambiados = []
+    limite = None
+    for producto in (
+        Producto.objects.order_by("-idProducto").only("idProducto", "fecha_publicacion")
+        .iterator(chunk_size=2000)
+    ):
+        estimada = primeras.get(producto.idProducto)
+        if limite is not None and (estimada is None or limite < estimada):
+            estimada = limite
+        if estimada is not None and estimada < producto.fecha_publicacion:
+            producto.fecha_publicacion = estimada
+            cambiados.append(producto)
+        if limite is None or producto.fecha_publicacion < limite:
+            limite = producto.fecha_publicacion
+    Producto.objects.bulk_update(cambiados, ["fecha_publicacion"], batch_size=500)
+
+
+def recalcular_popularidad(apps, schema_editor):
+    """Como ``popularidad.recalcular()``, con los modelos de esta migración."""
+    Producto = apps.get_model("main", "Producto")
+    Favorito = apps.get_model("main", "Favorito")
+    DetallePedido = apps.get_model("main", "DetallePedido")
+
+    # Los pedidos existentes ya quedan contados: si alguna tarea de
+    # popularidad sigue en cola no los vuelve a sumar
+    apps.get_model("main", "Pedido").objects.update(popularidad_sumada=True)
+
+    puntajes = {
+        producto_id: puntaje(PESO_PUBLICACION, fecha)
+        for producto_id, fecha in Producto.objects.values_list("idProducto", "fecha_publicacion")
+    }
+    for producto_id, fecha in Favorito.objects.values_list("producto_id", "fecha").iterator(chunk_size=2000):
+        puntajes[producto_id] = sumar_puntajes(puntajes[producto_id], puntaje(PESO_FAVORITO, fecha))
+    ventas = (
+        DetallePedido.objects
+        .values_list("producto_id", "pedido__fecha")
+        .annotate(unidades=Sum("cantidad"))
+        .order_by()
+    )
+    for producto_id, fecha, unidades in ventas.iterator(chunk_size=2000):
+        if unidades > 0:
+            puntajes[producto_id] = sumar_puntajes(
+                puntajes[producto_id], puntaje(PESO_UNIDAD_VENDIDA * unidades, fecha)
+            )
+
+    Producto.objects.bulk_update(
+        [Producto(idProducto=producto_id, popularidad=valor) for producto_id, valor in puntajes.items()],
+        ["popularidad"],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0021_tareas_pedido_una_vez'),
+    ]
+
+    operations = [
+        migrations.RunPython(fechas_publicacion, migrations.RunPython.noop),
+        migrations.RunPython(recalcular_popularidad, migrations.RunPython.noop),
+    ]
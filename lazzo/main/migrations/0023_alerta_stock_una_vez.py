@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0022_popularidad_historica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='stock_avisado',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copiar_nombres(apps, schema_editor):
+    VentaDiaria = apps.get_model("main", "VentaDiaria")
+    Producto = apps.get_model("main", "Producto")
+
+    VentaDiaria.objects.update(nombre=Subquery(
+        Producto.objects.filter(idProducto=OuterRef("producto_id")).values("nombre")[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0023_alerta_stock_una_vez'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ventadiaria',
+            name='nombre',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='ventadiaria',
+            name='producto',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ventas_diarias', to='main.producto'),
+        ),
+        migrations.RunPython(copiar_nombres, migrations.RunPython.noop),
+    ]
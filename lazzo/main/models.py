@@ -70,6 +70,8 @@ class Usuario(models.Model):
         blank=True,
         null=True
     )
+    # Copias redimensionadas de la foto (ver main/imagenes.py)
+    variantes = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return self.nombre_completo
@@ -108,6 +110,15 @@ class Producto(models.Model):
         null=True
     )
 
+    # Copias redimensionadas de la imagen (ver main/imagenes.py)
+    variantes = models.JSONField(default=dict, blank=True)
+
+    # Medidas de la imagen y una miniatura de ~16 px como data URI, para
+    # reservar su espacio y mostrar algo mientras carga (se calculan al subirla)
+    imagen_ancho = models.PositiveIntegerField(null=True, blank=True)
+    imagen_alto = models.PositiveIntegerField(null=True, blank=True)
+    imagen_previa = models.TextField(blank=True, default="")
+
     tipo = models.CharField(max_length=20, choices=TIPOS_PRODUCTO, default='producto')
     categoria = models.CharField(max_length=50)
 
@@ -115,9 +126,42 @@ class Producto(models.Model):
     categoria = models.CharField(max_length=50)
     vendedor = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="productos")
 
+    fecha_publicacion = models.DateTimeField(default=timezone.now)
+
+    # Puntaje de "relevancia" (favoritos + ventas + novedad, con decaimiento
+    # en el tiempo). Se actualiza en main/popularidad.py, nunca a mano.
+    popularidad = models.FloatField(default=0)
+
+    # Unidades apartadas en carritos (suma de las Reserva vigentes). Se
+    # mantiene junto al stock en main/reservas.py, nunca a mano.
+    reservado = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["popularidad", "idProducto"], name="producto_popularidad_idx"),
+        ]
+
     def __str__(self):
         return self.nombre
 
+    @property
+    def disponible(self):
+        """Unidades que todavía se pueden agregar a un carrito."""
+        return max(self.stock - self.reservado, 0)
+
+class Reserva(models.Model):
+    """Unidades de un producto apartadas por un usuario hasta ``vence``."""
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="reservas")
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name="reservas")
+    cantidad = models.IntegerField()
+    vence = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ("usuario", "producto")
+
+    def __str__(self):
+        return f"Reserva {self.id} - {self.cantidad} x {self.producto_id}"
+
 class Favorito(models.Model):
     idFavorito = models.AutoField(primary_key=True)
     usuario = models.ForeignKey(
@@ -182,6 +226,28 @@ class Pedido(models.Model):
     direccion = models.CharField(max_length=100, blank=True, null=True)
     envio = models.IntegerField(default=0)
 
+    # Resumen para "Mis pedidos" (se escribe al crear el pedido, así el
+    # listado no necesita ir a DetallePedido, Producto ni Pago)
+    cantidad_items = models.IntegerField(default=0)
+    producto_principal = models.CharField(max_length=100, blank=True)
+    miniatura = models.CharField(max_length=255, blank=True)
+    estado_pago = models.CharField(max_length=20, blank=True)
+
+    # Ya sumado a VentaDiaria (evita contarlo dos veces si la tarea se repite)
+    acumulado = models.BooleanField(default=False)
+    # Igual para las demás tareas del pedido (ver main/notificaciones.py):
+    # si el arriendo de la tarea vence y otro worker la retoma, no repiten
+    # las notificaciones ni el puntaje de popularidad
+    confirmacion_enviada = models.BooleanField(default=False)
+    vendedores_avisados = models.BooleanField(default=False)
+    stock_avisado = models.BooleanField(default=False)
+    popularidad_sumada = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["usuario", "-fecha", "-idPedido"], name="pedido_usuario_fecha_idx"),
+        ]
+
     def __str__(self):
         return f"Pedido {self.idPedido}"
     
@@ -223,6 +289,83 @@ class Pago(models.Model):
         return f"Pago {self.idPago}"
 
 
+class VentaDiaria(models.Model):
+    """Ventas de un producto en un día (ver main/ventas.py)."""
+    vendedor = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="ventas_diarias")
+    # Si el producto se borra la fila queda (con su nombre): es historia del vendedor
+    producto = models.ForeignKey(
+        Producto, on_delete=models.SET_NULL, null=True, related_name="ventas_diarias"
+    )
+    nombre = models.CharField(max_length=100, blank=True)
+    dia = models.DateField()
+    unidades = models.IntegerField(default=0)
+    ingresos = models.BigIntegerField(default=0)
+    pedidos = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("producto", "dia")
+        indexes = [
+            models.Index(fields=["vendedor", "dia"], name="venta_vendedor_dia_idx"),
+        ]
+
+    def __str__(self):
+        return f"VentaDiaria {self.dia} - {self.producto_id}: {self.unidades}"
+
+
+# Archivo de pedidos viejos (ver main/archivo.py). Guardan los mismos ids que
+# tenían en las tablas "calientes" y no tienen claves foráneas: pueden vivir
+# en otra base de datos (settings.ARCHIVO_DB) y sobreviven a que se borre el
+# producto. Por eso cada línea lleva copia del nombre e imagen del producto.
+
+class PedidoArchivado(models.Model):
+    idPedido = models.IntegerField(primary_key=True)
+    usuario_id = models.IntegerField()
+    fecha = models.DateTimeField()
+    estado = models.CharField(max_length=20)
+    total = models.IntegerField()
+    direccion = models.CharField(max_length=100, blank=True, null=True)
+    envio = models.IntegerField(default=0)
+    cantidad_items = models.IntegerField(default=0)
+    producto_principal = models.CharField(max_length=100, blank=True)
+    miniatura = models.CharField(max_length=255, blank=True)
+    estado_pago = models.CharField(max_length=20, blank=True)
+    archivado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["usuario_id", "-fecha", "-idPedido"], name="pedarch_usuario_fecha_idx"),
+        ]
+
+    def __str__(self):
+        return f"Pedido {self.idPedido} (archivado)"
+
+
+class DetallePedidoArchivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    pedido_id = models.IntegerField(db_index=True)
+    producto_id = models.IntegerField()
+    nombre_producto = models.CharField(max_length=100)
+    imagen_producto = models.CharField(max_length=255, blank=True)
+    cantidad = models.IntegerField(default=1)
+    precio_unitario = models.IntegerField()
+    subtotal = models.IntegerField()
+
+    def __str__(self):
+        return f"DetallePedido {self.id} - Pedido {self.pedido_id} (archivado)"
+
+
+class PagoArchivado(models.Model):
+    idPago = models.IntegerField(primary_key=True)
+    pedido_id = models.IntegerField(db_index=True)
+    monto = models.IntegerField()
+    metodo = models.CharField(max_length=30)
+    estado = models.CharField(max_length=20, choices=Pago.estados, default='pendiente')
+    fecha = models.DateTimeField()
+
+    def __str__(self):
+        return f"Pago {self.idPago} (archivado)"
+
+
 class Mensaje(models.Model):
     idMensaje = models.AutoField(primary_key=True)
     emisor = models.ForeignKey(Usuario, related_name="mensajes_enviados", on_delete=models.CASCADE)
@@ -243,3 +386,70 @@ class Notificacion(models.Model):
 
     def __str__(self):
         return f"Notificación {self.idNotificacion}"
+
+
+class Tarea(models.Model):
+    """Trabajo en segundo plano (ver main/tareas.py)."""
+    ESTADOS = (
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completada', 'Completada'),
+        ('fallida', 'Fallida'),
+    )
+    nombre = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict)
+    # Si se indica, encolar dos veces con la misma clave no duplica la tarea
+    clave = models.CharField(max_length=150, unique=True, blank=True, null=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.IntegerField(default=0)
+    max_intentos = models.IntegerField(default=5)
+    disponible_desde = models.DateTimeField(default=timezone.now)
+    # Mientras está en proceso: si el worker muere, se retoma al vencer
+    bloqueada_hasta = models.DateTimeField(blank=True, null=True)
+    error = models.TextField(blank=True)
+    creada = models.DateTimeField(default=timezone.now)
+    terminada = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["estado", "disponible_desde"], name="tarea_pendientes_idx"),
+        ]
+
+    def __str__(self):
+        return f"Tarea {self.id} - {self.nombre} ({self.estado})"
+
+
+class ClaveIdempotencia(models.Model):
+    """Respuesta guardada de un POST que crea pedidos (ver main/idempotencia.py)."""
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    clave = models.CharField(max_length=64)
+    ruta = models.CharField(max_length=100)
+    # Hash del cuerpo: la misma clave con otros datos es un error del cliente
+    huella = models.CharField(max_length=64)
+    completada = models.BooleanField(default=False)
+    # Mientras no está completada: hasta cuándo el request que la tomó la
+    # tiene; después otro la puede retomar (el primero se cayó)
+    vence = models.DateTimeField(null=True, blank=True)
+    codigo = models.IntegerField(null=True, blank=True)
+    cabeceras = models.JSONField(default=dict)
+    contenido = models.BinaryField(default=b"")
+    creada = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        unique_together = ("usuario", "clave")
+
+    def __str__(self):
+        return f"ClaveIdempotencia {self.clave} ({self.ruta})"
+
+
+class ArchivoMedia(models.Model):
+    """Archivo de media guardado por su contenido (ver main/almacenamiento.py)."""
+    nombre = models.CharField(max_length=255, unique=True)
+    hash = models.CharField(max_length=64, db_index=True)
+    tamano = models.BigIntegerField()
+    # Cuántas veces se guardó; el archivo se borra cuando llega a cero
+    referencias = models.IntegerField(default=0)
+    creado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.referencias} ref.)"
@@ -0,0 +1,109 @@
+# main/notificaciones.py
+"""
+Tareas que se encolan al confirmar un pedido (ver ``encolar_para_pedido``).
+Corren en el worker de ``procesar_tareas``, fuera del request del checkout.
+
+Una tarea puede correr dos veces (se retoma si su arriendo vence), así que
+las que escriben por pedido marcan primero un campo del pedido con un
+``UPDATE`` condicional, como ``ventas.acumular_pedido`` con ``acumulado``.
+"""
+from .models import DetallePedido, Notificacion, Pedido, Producto
+from .popularidad import registrar_ventas_pedido
+from .tareas import tarea
+from .ventas import acumular_pedido
+
+# Con este stock o menos se avisa al vendedor
+UMBRAL_STOCK_BAJO = 3
+
+
+@tarea("pedidos.confirmar")
+def confirmar_pedido(pedido_id):
+    if not Pedido.objects.filter(
+        idPedido=pedido_id, confirmacion_enviada=False
+    ).update(confirmacion_enviada=True):
+        return
+    pedido = Pedido.objects.get(idPedido=pedido_id)
+    Notificacion.objects.create(
+        usuario_id=pedido.usuario_id,
+        tipo="Pedido confirmado",
+        mensaje=f"Tu pedido #{pedido.idPedido} por ${pedido.total} fue confirmado.",
+    )
+
+
+@tarea("pedidos.avisar_vendedores")
+def avisar_vendedores(pedido_id):
+    if not Pedido.objects.filter(
+        idPedido=pedido_id, vendedores_avisados=False
+    ).update(vendedores_avisados=True):
+        return
+    ventas = {}
+    for detalle in (
+        DetallePedido.objects
+        .filter(pedido_id=pedido_id)
+        .select_related("producto")
+        .only("cantidad", "producto__nombre", "producto__vendedor_id")
+    ):
+        ventas.setdefault(detalle.producto.vendedor_id, []).append(
+            f"{detalle.cantidad} x {detalle.producto.nombre}"
+        )
+
+    Notificacion.objects.bulk_create([
+        Notificacion(
+            usuario_id=vendedor_id,
+            tipo="Nueva venta",
+            mensaje=f"Pedido #{pedido_id}: " + ", ".join(lineas),
+        )
+        for vendedor_id, lineas in ventas.items()
+    ])
+
+
+@tarea("productos.alerta_stock")
+def alerta_stock(vendidas, pedido_id=None):
+    """
+    ``vendidas``: {producto_id: unidades} del pedido. Avisa solo a los
+    productos que con esta venta cruzaron el umbral (no en cada venta).
+    Las tareas encoladas antes de ``pedido_id`` no tienen con qué marcarse.
+    """
+    if pedido_id is not None and not Pedido.objects.filter(
+        idPedido=pedido_id, stock_avisado=False
+    ).update(stock_avisado=True):
+        return
+    vendidas = {int(producto_id): cantidad for producto_id, cantidad in vendidas.items()}
+    bajos = [
+        producto
+        for producto in (
+            Producto.objects
+            .filter(idProducto__in=vendidas, stock__lte=UMBRAL_STOCK_BAJO)
+            .only("nombre", "stock", "vendedor_id")
+        )
+        if producto.stock + vendidas[producto.idProducto] > UMBRAL_STOCK_BAJO
+        or producto.stock <= 0
+    ]
+    Notificacion.objects.bulk_create([
+        Notificacion(
+            usuario_id=producto.vendedor_id,
+            tipo="Sin stock" if producto.stock <= 0 else "Stock bajo",
+            mensaje=(
+                f"'{producto.nombre}' se agotó."
+                if producto.stock <= 0
+                else f"A '{producto.nombre}' le quedan {producto.stock} unidades."
+            ),
+        )
+        for producto in bajos
+    ])
+
+
+def encolar_para_pedido(pedido, cantidades):
+    """
+    Encola el trabajo posterior a un pedido. Llamar dentro de la misma
+    transacción que lo crea: las tareas existen solo si el pedido existe.
+    """
+    clave = f"pedido:{pedido.idPedido}"
+    confirmar_pedido.encolar(pedido_id=pedido.idPedido, clave=f"{clave}:confirmar")
+    avisar_vendedores.encolar(pedido_id=pedido.idPedido, clave=f"{clave}:vendedores")
+    alerta_stock.encolar(
+        vendidas={str(producto_id): cantidad for producto_id, cantidad in cantidades.items()},
+        pedido_id=pedido.idPedido, clave=f"{clave}:stock",
+    )
+    registrar_ventas_pedido.encolar(pedido_id=pedido.idPedido, clave=f"{clave}:popularidad")
+    acumular_pedido.encolar(pedido_id=pedido.idPedido, clave=f"{clave}:ventas")
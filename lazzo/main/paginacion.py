@@ -0,0 +1,235 @@
+# main/paginacion.py
+"""
+Paginación por cursor (keyset) para los listados de productos.
+
+En vez de ``OFFSET`` + ``COUNT(*)`` (lo que hace ``Paginator``), cada página
+se pide "a partir de" la última fila vista: ``WHERE (clave, id) > (...)``.
+Así la página N cuesta lo mismo que la página 1.
+
+El cursor que viaja en la URL es opaco y va firmado con ``SECRET_KEY``,
+de modo que no se puede manipular a mano.
+"""
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from django.core import signing
+from django.db.models import Q
+
+SALT_CURSOR = "main.paginacion.cursor"
+
+# Hasta dónde contamos filas para el total aproximado ("1000+")
+LIMITE_CONTEO = 1000
+
+# Orden de cada modo del catálogo. El último campo siempre es la PK para
+# que el orden sea total (desempate estable).
+ORDENES_CATALOGO = {
+    "precio_asc": ("precio", "idProducto"),
+    "precio_desc": ("-precio", "-idProducto"),
+    "recientes": ("-idProducto",),
+    # Puntaje precalculado en main/popularidad.py (columna indexada)
+    "relevancia": ("-popularidad", "-idProducto"),
+}
+
+# "Mis pedidos", del más reciente al más antiguo (índice pedido_usuario_fecha_idx)
+ORDEN_PEDIDOS = ("-fecha", "-idPedido")
+
+
+class PaginaCursor:
+    """
+    Una página de resultados. Se usa en las plantillas como ``page_obj``:
+    se puede iterar y expone ``has_next``/``has_previous`` y los cursores.
+    """
+
+    def __init__(self, object_list, numero, cursor_siguiente=None,
+                 cursor_anterior=None, total_aproximado=None, total_exacto=True):
+        self.object_list = object_list
+        self.number = numero
+        self.cursor_siguiente = cursor_siguiente
+        self.cursor_anterior = cursor_anterior
+        self.total_aproximado = total_aproximado
+        self.total_exacto = total_exacto
+
+    @property
+    def has_next(self):
+        return self.cursor_siguiente is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor_anterior is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+# ---------- Cursores ----------
+
+def _serializar(valor):
+    if isinstance(valor, datetime):
+        return {"dt": valor.isoformat()}
+    return valor
+
+
+def _deserializar(valor):
+    if isinstance(valor, dict) and "dt" in valor:
+        return datetime.fromisoformat(valor["dt"])
+    return valor
+
+
+def crear_cursor(orden, valores, direccion, numero):
+    return signing.dumps(
+        {
+            "o": list(orden),
+            "v": [_serializar(v) for v in valores],
+            "d": direccion,
+            "n": numero,
+        },
+        salt=SALT_CURSOR,
+        compress=True,
+    )
+
+
+def leer_cursor(cursor, orden):
+    """
+    Devuelve (valores, dirección, número de página) o None si el cursor no
+    existe, fue manipulado o pertenece a otro orden.
+    """
+    if not cursor:
+        return None
+    try:
+        datos = signing.loads(cursor, salt=SALT_CURSOR)
+    except signing.BadSignature:
+        return None
+    if datos.get("o") != list(orden) or datos.get("d") not in ("sig", "ant"):
+        return None
+    valores = [_deserializar(v) for v in datos.get("v", [])]
+    if len(valores) != len(orden):
+        return None
+    return valores, datos["d"], datos.get("n", 1)
+
+
+# ---------- QuerySets ----------
+
+def _campo(orden_campo):
+    return orden_campo.lstrip("-")
+
+
+def _invertir(orden):
+    return tuple(c[1:] if c.startswith("-") else f"-{c}" for c in orden)
+
+
+def _filtro_despues(orden, valores):
+    """
+    Filas estrictamente posteriores a ``valores`` según ``orden``:
+    (a > x) OR (a = x AND b > y) OR ...
+    """
+    filtro = Q()
+    iguales = {}
+    for campo_orden, valor in zip(orden, valores):
+        campo = _campo(campo_orden)
+        operador = "lt" if campo_orden.startswith("-") else "gt"
+        filtro |= Q(**iguales, **{f"{campo}__{operador}": valor})
+        iguales[campo] = valor
+    return filtro
+
+
+def paginar(request, queryset, orden, por_pagina=12, contar=False, total=None):
+    """
+    Pagina ``queryset`` por cursor según ``orden`` (tupla de campos estilo
+    ``order_by``, el último debe ser único). El cursor se lee de
+    ``?cursor=`` en ``request.GET``.
+
+    Con ``contar=True`` se calcula un total acotado a ``LIMITE_CONTEO``
+    (``total_exacto`` es False si se llegó al límite). Si el total ya se
+    conoce (p. ej. desde las facetas) se puede pasar en ``total``.
+    """
+    orden = tuple(orden)
+    leido = leer_cursor(request.GET.get("cursor"), orden)
+
+    if leido is None:
+        valores, direccion, numero = None, "sig", 1
+    else:
+        valores, direccion, numero = leido
+
+    if direccion == "sig":
+        qs = queryset.order_by(*orden)
+        if valores is not None:
+            qs = qs.filter(_filtro_despues(orden, valores))
+    else:
+        qs = queryset.order_by(*_invertir(orden))
+        qs = qs.filter(_filtro_despues(_invertir(orden), valores))
+
+    filas = list(qs[:por_pagina + 1])
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+
+    if direccion == "ant":
+        filas.reverse()
+
+    def _cursor(obj, dir_cursor, num):
+        return crear_cursor(
+            orden, [getattr(obj, _campo(c)) for c in orden], dir_cursor, num
+        )
+
+    cursor_siguiente = cursor_anterior = None
+    if filas:
+        if (direccion == "sig" and hay_mas) or direccion == "ant":
+            cursor_siguiente = _cursor(filas[-1], "sig", numero + 1)
+        if (direccion == "ant" and hay_mas) or (direccion == "sig" and valores is not None):
+            cursor_anterior = _cursor(filas[0], "ant", numero - 1)
+
+    exacto = True
+    if total is None and contar:
+        total = queryset.order_by()[:LIMITE_CONTEO + 1].count()
+        exacto = total <= LIMITE_CONTEO
+        total = min(total, LIMITE_CONTEO)
+
+    return PaginaCursor(filas, numero, cursor_siguiente, cursor_anterior, total, exacto)
+
+
+# ---------- Listas ya ordenadas en memoria ----------
+
+def paginar_lista(request, pares, por_pagina=12):
+    """
+    Igual que ``paginar`` pero para listas de (id, puntuación) ya
+    ordenadas por puntuación descendente e id descendente (lo que devuelve
+    el índice de búsqueda). Los elementos de la página son los pares.
+    """
+    orden = ("-puntuacion", "-id")
+    leido = leer_cursor(request.GET.get("cursor"), orden)
+
+    def _clave(par):
+        return (-par[1], -par[0])
+
+    if leido is None:
+        inicio, numero = 0, 1
+    else:
+        (puntuacion, ultimo_id), direccion, numero = leido
+        clave = (-puntuacion, -ultimo_id)
+        if direccion == "sig":
+            inicio = bisect_right(pares, clave, key=_clave)
+        else:
+            inicio = max(bisect_left(pares, clave, key=_clave) - por_pagina, 0)
+
+    filas = pares[inicio:inicio + por_pagina]
+
+    def _cursor(par, dir_cursor, num):
+        return crear_cursor(orden, [par[1], par[0]], dir_cursor, num)
+
+    cursor_siguiente = cursor_anterior = None
+    if filas:
+        if inicio + por_pagina < len(pares):
+            cursor_siguiente = _cursor(filas[-1], "sig", numero + 1)
+        if inicio > 0:
+            cursor_anterior = _cursor(filas[0], "ant", max(numero - 1, 1))
+
+    return PaginaCursor(filas, numero, cursor_siguiente, cursor_anterior, len(pares))
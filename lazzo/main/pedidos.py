@@ -0,0 +1,199 @@
+# main/pedidos.py
+"""
+Creación de pedidos a partir de las líneas del carrito.
+
+Todo ocurre en una sola transacción:
+
+  1. Se bloquean (``SELECT ... FOR UPDATE``) las reservas del comprador y
+     después los productos del pedido, siempre en orden de ``idProducto``:
+     dos compras simultáneas piden los bloqueos en el mismo orden y no
+     pueden quedar en deadlock.
+  2. Se valida el stock con las filas ya bloqueadas. Lo que el comprador
+     tiene reservado cuenta como disponible para él.
+  3. Se descuenta el stock (y se liberan sus reservas) con un solo
+     ``UPDATE`` condicional. Si alguna fila no cumple, se revierte todo.
+  4. Se crean el pedido, sus detalles (``bulk_create``) y el pago, y se
+     encolan las notificaciones y demás trabajo posterior (ver
+     ``notificaciones.py``), que corre fuera del request.
+
+Si falta stock se lanza ``StockInsuficiente`` y no queda nada escrito.
+"""
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+
+from .models import DetallePedido, Pago, Pedido, Producto, Reserva
+from .notificaciones import encolar_para_pedido
+from .signals import actualizar_indices
+
+
+class StockInsuficiente(Exception):
+
+    def __init__(self, producto, disponible, solicitado):
+        self.producto = producto
+        self.disponible = disponible
+        self.solicitado = solicitado
+        super().__init__(
+            f"No hay stock suficiente para '{producto.nombre}'. "
+            f"Disponible: {disponible}, solicitado: {solicitado}."
+        )
+
+
+class ProductoNoDisponible(StockInsuficiente):
+    """Un producto del pedido se eliminó: para las vistas es stock 0."""
+
+    def __init__(self, producto_id, solicitado):
+        self.producto = None
+        self.producto_id = producto_id
+        self.disponible = 0
+        self.solicitado = solicitado
+        Exception.__init__(self, "Uno de los productos de tu carrito ya no está disponible.")
+
+
+def _agrupar(lineas):
+    cantidades = {}
+    for producto_id, cantidad in lineas:
+        cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    return cantidades
+
+
+def _disponible(producto, propias):
+    return producto.stock - producto.reservado + propias.get(producto.idProducto, 0)
+
+
+def _validar_stock(productos, cantidades, propias):
+    for producto in productos:
+        disponible = _disponible(producto, propias)
+        if cantidades[producto.idProducto] > disponible:
+            raise StockInsuficiente(producto, max(disponible, 0), cantidades[producto.idProducto])
+
+
+class _StockCambio(Exception):
+    """El UPDATE condicional no alcanzó a todas las filas (ver crear_pedido)."""
+
+    def __init__(self, cantidades, propias):
+        self.cantidades = cantidades
+        self.propias = propias
+
+
+def crear_pedido(usuario, lineas, direccion=None, envio=0, estado="pagado",
+                 metodo_pago=None):
+    """
+    ``lineas``: iterable de (producto_id, cantidad). El precio se toma de
+    los productos bloqueados, no del carrito. Si se indica ``metodo_pago``
+    se registra también el ``Pago`` por el total.
+    """
+    try:
+        return _crear_pedido(usuario, lineas, direccion, envio, estado, metodo_pago)
+    except _StockCambio as cambio:
+        # Con la transacción ya revertida, el stock que se lee es el real:
+        # así se informa el producto que de verdad faltó, no el primero
+        productos = list(
+            Producto.objects.filter(idProducto__in=cambio.cantidades).order_by("idProducto")
+        )
+        _validar_stock(productos, cambio.cantidades, cambio.propias)
+        # Se liberó stock entre medio: el más justo fue el que no alcanzó
+        producto = min(
+            productos,
+            key=lambda p: _disponible(p, cambio.propias) - cambio.cantidades[p.idProducto],
+        )
+        raise StockInsuficiente(
+            producto, max(_disponible(producto, cambio.propias), 0),
+            cambio.cantidades[producto.idProducto],
+        )
+
+
+@transaction.atomic
+def _crear_pedido(usuario, lineas, direccion, envio, estado, metodo_pago):
+    cantidades = _agrupar(lineas)
+    if not cantidades:
+        raise ValueError("El pedido no tiene productos.")
+
+    reservas = Reserva.objects.select_for_update().filter(
+        usuario=usuario, producto_id__in=cantidades
+    )
+    propias = dict(reservas.order_by("producto_id").values_list("producto_id", "cantidad"))
+
+    productos = list(
+        Producto.objects
+        .select_for_update()
+        .filter(idProducto__in=cantidades)
+        .order_by("idProducto")
+    )
+    if len(productos) != len(cantidades):
+        encontrados = {producto.idProducto for producto in productos}
+        faltante = next(i for i in cantidades if i not in encontrados)
+        raise ProductoNoDisponible(faltante, cantidades[faltante])
+    _validar_stock(productos, cantidades, propias)
+
+    # Un solo UPDATE; la condición por fila protege aunque la BD no soporte
+    # FOR UPDATE (p. ej. SQLite en desarrollo).
+    condicion = Q()
+    for producto_id, cantidad in cantidades.items():
+        propia = propias.get(producto_id, 0)
+        condicion |= Q(idProducto=producto_id, stock__gte=F("reservado") - propia + cantidad)
+    actualizados = Producto.objects.filter(condicion).update(
+        stock=Case(
+            *(When(idProducto=producto_id, then=F("stock") - cantidad)
+              for producto_id, cantidad in cantidades.items()),
+            default=F("stock"),
+        ),
+        reservado=Case(
+            *(When(idProducto=producto_id, then=F("reservado") - propia)
+              for producto_id, propia in propias.items()),
+            default=F("reservado"),
+        ),
+    )
+    if actualizados != len(cantidades):
+        # Sin FOR UPDATE otro pedido pudo descontar stock entre medio. Las
+        # filas que sí se actualizaron ya no sirven para saber cuál faltó:
+        # se revierte y crear_pedido lo averigua
+        raise _StockCambio(cantidades, propias)
+    reservas.delete()
+
+    detalles = []
+    subtotal = 0
+    for producto in productos:
+        cantidad = cantidades[producto.idProducto]
+        detalles.append(DetallePedido(
+            producto=producto,
+            cantidad=cantidad,
+            precio_unitario=producto.precio,
+            subtotal=cantidad * producto.precio,
+        ))
+        subtotal += cantidad * producto.precio
+        producto.stock -= cantidad
+        producto.reservado -= propias.get(producto.idProducto, 0)
+
+    # Resumen para "Mis pedidos": el primer producto de las líneas
+    primero = next(iter(cantidades))
+    principal = next(p for p in productos if p.idProducto == primero)
+    pedido = Pedido.objects.create(
+        usuario=usuario,
+        total=subtotal + envio,
+        estado=estado,
+        direccion=direccion,
+        envio=envio,
+        cantidad_items=sum(cantidades.values()),
+        producto_principal=principal.nombre,
+        miniatura=principal.imagen.url if principal.imagen else "",
+        estado_pago=estado if metodo_pago else "",
+    )
+    for detalle in detalles:
+        detalle.pedido = pedido
+    DetallePedido.objects.bulk_create(detalles)
+
+    if metodo_pago:
+        Pago.objects.create(
+            pedido=pedido,
+            monto=pedido.total,
+            metodo=metodo_pago,
+            estado=estado,
+        )
+
+    encolar_para_pedido(pedido, cantidades)
+
+    # El UPDATE no dispara post_save: los índices en memoria se refrescan
+    # a mano con el stock nuevo.
+    actualizar_indices(productos)
+
+    return pedido
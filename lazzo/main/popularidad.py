@@ -0,0 +1,165 @@
+# main/popularidad.py
+"""
+Puntaje de popularidad de los productos (orden "relevancia" del catálogo).
+
+Cada evento vale ``peso * 2 ** ((momento - EPOCA) / VIDA_MEDIA)``: un evento
+de hoy vale el doble que uno de hace ``VIDA_MEDIA_DIAS`` días. Como todos los
+eventos se escalan contra la misma época fija, comparar sumas equivale a
+comparar los puntajes con decaimiento, pero cada evento es solo un
+``UPDATE`` sobre la fila (sin recalcular nada).
+
+Esa suma crece sin límite (se duplica cada ``VIDA_MEDIA_DIAS``), así que la
+columna guarda su logaritmo en base 2, que crece de forma lineal con el
+tiempo y ordena igual. Sumar un evento de log ``e`` a un puntaje ``p`` es
+``max(p, e) + log2(1 + 2 ** -|p - e|)``, que se calcula en el mismo
+``UPDATE`` sin pasar nunca por la suma completa.
+
+Eventos:
+  - publicación del producto (novedad)
+  - agregar / quitar de favoritos
+  - unidades vendidas en un pedido
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import F, FloatField, Sum, Value
+from django.db.models.functions import Abs, Greatest, Log, Power
+from django.utils import timezone
+
+from .models import DetallePedido, Favorito, Pedido, Producto
+from .tareas import tarea
+
+EPOCA = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+VIDA_MEDIA_DIAS = 14
+
+PESO_PUBLICACION = 10.0
+PESO_FAVORITO = 3.0
+PESO_UNIDAD_VENDIDA = 5.0
+
+# Al restar un evento (quitar un favorito) el puntaje no baja de
+# ``p - RESTA_MAXIMA``: evita log2(0) por redondeo
+RESTA_MAXIMA = 30
+
+
+def puntaje(peso, momento=None):
+    """log2 de ``peso * 2 ** ((momento - EPOCA) / VIDA_MEDIA)``."""
+    momento = momento or timezone.now()
+    dias = (momento - EPOCA).total_seconds() / 86400
+    return math.log2(peso) + dias / VIDA_MEDIA_DIAS
+
+
+def puntaje_publicacion(momento=None):
+    return puntaje(PESO_PUBLICACION, momento)
+
+
+def sumar_puntajes(a, b):
+    """log2(2 ** a + 2 ** b) sin calcular las potencias."""
+    if a is None:
+        return b
+    return max(a, b) + math.log2(1 + 2 ** -abs(a - b))
+
+
+def _sumar(producto_id, evento):
+    actual = F("popularidad")
+    evento = Value(evento, output_field=FloatField())
+    Producto.objects.filter(idProducto=producto_id).update(
+        popularidad=Greatest(actual, evento)
+        + Log(Value(2.0), Value(1.0) + Power(Value(2.0), -Abs(actual - evento)))
+    )
+
+
+def _restar(producto_id, evento):
+    actual = F("popularidad")
+    evento = Value(evento, output_field=FloatField())
+    Producto.objects.filter(idProducto=producto_id).update(
+        popularidad=actual + Log(Value(2.0), Greatest(
+            Value(1.0) - Power(Value(2.0), evento - actual),
+            Value(2.0 ** -RESTA_MAXIMA),
+        ))
+    )
+
+
+def registrar_favorito(favorito, agregado=True):
+    """Suma (o resta, si se quitó) el aporte de un favorito."""
+    evento = puntaje(PESO_FAVORITO, favorito.fecha)
+    if agregado:
+        _sumar(favorito.producto_id, evento)
+    else:
+        _restar(favorito.producto_id, evento)
+
+
+def registrar_ventas(lineas, momento=None):
+    """``lineas``: iterable de (producto_id, cantidad) de un pedido."""
+    unidades = {}
+    for producto_id, cantidad in lineas:
+        unidades[producto_id] = unidades.get(producto_id, 0) + cantidad
+    # Orden fijo para que dos pedidos simultáneos no se bloqueen entre sí
+    for producto_id in sorted(unidades):
+        if unidades[producto_id] > 0:
+            _sumar(producto_id, puntaje(PESO_UNIDAD_VENDIDA * unidades[producto_id], momento))
+
+
+@tarea("popularidad.ventas")
+def registrar_ventas_pedido(pedido_id):
+    """Suma al puntaje las unidades de un pedido (se encola al confirmarlo)."""
+    # Marca y suma en la misma transacción: si la tarea se repite, no suma dos veces
+    if not Pedido.objects.filter(
+        idPedido=pedido_id, popularidad_sumada=False
+    ).update(popularidad_sumada=True):
+        return
+    fecha = Pedido.objects.values_list("fecha", flat=True).get(idPedido=pedido_id)
+    registrar_ventas(
+        DetallePedido.objects.filter(pedido_id=pedido_id).values_list("producto_id", "cantidad"),
+        momento=fecha,
+    )
+
+
+def recalcular(productos=None):
+    """
+    Recalcula desde cero el puntaje de ``productos`` (QuerySet, por defecto
+    todos) a partir de su fecha de publicación, sus favoritos y sus ventas.
+    Son tres consultas en total (productos, favoritos y ventas agrupadas por
+    producto y pedido) más las escrituras en lotes. Devuelve la cantidad de
+    productos actualizados.
+    """
+    if productos is None:
+        productos = Producto.objects.all()
+
+    puntajes = {
+        producto_id: puntaje_publicacion(fecha)
+        for producto_id, fecha in productos.values_list("idProducto", "fecha_publicacion")
+    }
+    ids = productos.values("idProducto")
+
+    favoritos = (
+        Favorito.objects
+        .filter(producto__in=ids)
+        .values_list("producto_id", "fecha")
+    )
+    for producto_id, fecha in favoritos.iterator(chunk_size=2000):
+        puntajes[producto_id] = sumar_puntajes(
+            puntajes[producto_id], puntaje(PESO_FAVORITO, fecha)
+        )
+
+    ventas = (
+        DetallePedido.objects
+        .filter(producto__in=ids)
+        .values_list("producto_id", "pedido__fecha")
+        .annotate(unidades=Sum("cantidad"))
+        .order_by()
+    )
+    for producto_id, fecha, unidades in ventas.iterator(chunk_size=2000):
+        if unidades > 0:
+            puntajes[producto_id] = sumar_puntajes(
+                puntajes[producto_id], puntaje(PESO_UNIDAD_VENDIDA * unidades, fecha)
+            )
+
+    Producto.objects.bulk_update(
+        [
+            Producto(idProducto=producto_id, popularidad=valor)
+            for producto_id, valor in puntajes.items()
+        ],
+        ["popularidad"],
+        batch_size=500,
+    )
+    return len(puntajes)
@@ -0,0 +1,160 @@
+# main/reservas.py
+"""
+Reservas de stock para los productos en carritos.
+
+Al agregar un producto al carrito (o cambiar su cantidad) se aparta esa
+cantidad por ``RESERVA_MINUTOS`` con una ``Reserva``. ``Producto.reservado``
+lleva la suma de las reservas de cada producto, así que lo disponible es
+``stock - reservado`` sin sumar reservas en cada request.
+
+  - ``reservar`` sube o baja la reserva con un ``UPDATE`` condicional sobre
+    el contador (nunca se aparta más de lo que hay).
+  - Al pagar, ``pedidos.crear_pedido`` convierte las reservas del comprador
+    en stock descontado.
+  - ``liberar_vencidas`` (comando ``liberar_reservas``) devuelve en lote las
+    reservas vencidas.
+
+Cada cambio de ``reservado`` se anota con ``sincronizacion.registrar`` en
+``CANAL_RESERVAS`` para que las facetas "con stock" de todos los workers lo
+vean (búsqueda y autocompletar no usan ``reservado`` y no lo escuchan).
+
+Orden de bloqueos en todo el módulo (y en pedidos.py): primero las filas de
+``Reserva``, después las de ``Producto``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, Sum, When
+from django.utils import timezone
+
+from . import sincronizacion
+from .models import Producto, Reserva
+
+
+def duracion():
+    return timedelta(minutes=getattr(settings, "RESERVA_MINUTOS", 15))
+
+
+def _sumar_reservado(producto_id, delta, solo_si_alcanza=False):
+    """
+    Suma ``delta`` a ``Producto.reservado``. Con ``solo_si_alcanza`` lo hace
+    solo si quedan al menos ``delta`` unidades libres (devuelve 0 si no).
+    """
+    productos = Producto.objects.filter(idProducto=producto_id)
+    if solo_si_alcanza:
+        productos = productos.filter(stock__gte=F("reservado") + delta)
+    return productos.update(reservado=F("reservado") + delta)
+
+
+@transaction.atomic
+def reservar(usuario_id, producto, cantidad):
+    """
+    Deja la reserva del usuario sobre ``producto`` en ``cantidad`` unidades
+    (o en lo máximo posible) y renueva su vencimiento. Devuelve la cantidad
+    reservada; 0 si no queda nada disponible.
+    """
+    reserva, _ = Reserva.objects.select_for_update().get_or_create(
+        usuario_id=usuario_id,
+        producto=producto,
+        defaults={"cantidad": 0, "vence": timezone.now()},
+    )
+
+    delta = cantidad - reserva.cantidad
+    if delta > 0 and not _sumar_reservado(producto.idProducto, delta, solo_si_alcanza=True):
+        # No alcanza: apartamos lo que quede libre
+        producto.refresh_from_db(fields=["stock", "reservado"])
+        delta = min(delta, producto.disponible)
+        if delta > 0 and not _sumar_reservado(producto.idProducto, delta, solo_si_alcanza=True):
+            delta = 0
+    elif delta < 0:
+        _sumar_reservado(producto.idProducto, delta)
+    if delta:
+        sincronizacion.registrar([producto.idProducto], sincronizacion.CANAL_RESERVAS)
+
+    reserva.cantidad += delta
+    if reserva.cantidad <= 0:
+        reserva.delete()
+        return 0
+
+    reserva.vence = timezone.now() + duracion()
+    reserva.save(update_fields=["cantidad", "vence"])
+    return reserva.cantidad
+
+
+def _devolver(reservas):
+    """Borra ``reservas`` (ya bloqueadas) y descuenta sus unidades del contador."""
+    por_producto = {}
+    for reserva_id, producto_id, cantidad in reservas:
+        por_producto[producto_id] = por_producto.get(producto_id, 0) + cantidad
+    if not por_producto:
+        return 0
+
+    Reserva.objects.filter(id__in=[reserva_id for reserva_id, _, _ in reservas]).delete()
+    Producto.objects.filter(idProducto__in=por_producto).update(
+        reservado=Case(
+            *(When(idProducto=producto_id, then=F("reservado") - cantidad)
+              for producto_id, cantidad in por_producto.items()),
+            default=F("reservado"),
+        )
+    )
+    sincronizacion.registrar(por_producto, sincronizacion.CANAL_RESERVAS)
+    return len(reservas)
+
+
+@transaction.atomic
+def liberar(usuario_id, producto_ids=None):
+    """Libera las reservas del usuario (todas, o solo las de ``producto_ids``)."""
+    reservas = Reserva.objects.select_for_update().filter(usuario_id=usuario_id)
+    if producto_ids is not None:
+        reservas = reservas.filter(producto_id__in=producto_ids)
+    return _devolver(list(
+        reservas.order_by("id").values_list("id", "producto_id", "cantidad")
+    ))
+
+
+def liberar_vencidas(lote=1000):
+    """
+    Libera las reservas vencidas en lotes de ``lote`` (una transacción
+    corta por lote). Devuelve cuántas se liberaron.
+    """
+    liberadas = 0
+    while True:
+        with transaction.atomic():
+            vencidas = list(
+                Reserva.objects
+                .select_for_update()
+                .filter(vence__lte=timezone.now())
+                .order_by("id")
+                .values_list("id", "producto_id", "cantidad")[:lote]
+            )
+            liberadas += _devolver(vencidas)
+        if len(vencidas) < lote:
+            return liberadas
+
+
+def recalcular_reservado():
+    """
+    Rehace ``Producto.reservado`` desde las reservas existentes (por si el
+    contador se desalineó, p. ej. al borrar usuarios con reservas).
+    Devuelve cuántos productos se corrigieron.
+    """
+    sumas = dict(
+        Reserva.objects.values("producto_id")
+        .annotate(total=Sum("cantidad"))
+        .values_list("producto_id", "total")
+    )
+    corregidos = []
+    candidatos = (
+        Producto.objects
+        .filter(~Q(reservado=0) | Q(idProducto__in=list(sumas)))
+        .only("idProducto", "reservado")
+        .iterator(chunk_size=2000)
+    )
+    for producto in candidatos:
+        correcto = sumas.get(producto.idProducto, 0)
+        if producto.reservado != correcto:
+            Producto.objects.filter(idProducto=producto.idProducto).update(reservado=correcto)
+            corregidos.append(producto.idProducto)
+    sincronizacion.registrar(corregidos, sincronizacion.CANAL_RESERVAS)
+    return len(corregidos)
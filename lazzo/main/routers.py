@@ -0,0 +1,35 @@
+# main/routers.py
+from django.conf import settings
+
+# Modelos que van a la base de datos de archivo (settings.ARCHIVO_DB)
+MODELOS_ARCHIVO = {"pedidoarchivado", "detallepedidoarchivado", "pagoarchivado"}
+
+
+def alias_archivo():
+    return getattr(settings, "ARCHIVO_DB", "default")
+
+
+def es_de_archivo(app_label, model_name):
+    return app_label == "main" and model_name in MODELOS_ARCHIVO
+
+
+class RouterArchivo:
+    """
+    Manda las tablas de pedidos archivados a ``ARCHIVO_DB`` y solo a ella.
+    Con ``ARCHIVO_DB = "default"`` (lo normal) no cambia nada.
+    """
+
+    def db_for_read(self, model, **hints):
+        if es_de_archivo(model._meta.app_label, model._meta.model_name):
+            return alias_archivo()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name is not None and es_de_archivo(app_label, model_name):
+            return db == alias_archivo()
+        if db != "default" and db == alias_archivo():
+            # La base de archivo no lleva el resto de las tablas
+            return False
+        return None
@@ -0,0 +1,36 @@
+# main/sesiones.py
+"""
+Motor de sesiones ``cached_db`` que solo escribe cuando los datos cambian.
+
+Las lecturas salen de la caché (la BD solo se consulta si la sesión no está
+en la caché) y ``save`` compara los datos con los que se cargaron: si el
+request marcó la sesión como modificada pero dejó lo mismo (p. ej. volvió a
+asignar ``usuario_rol`` con el mismo valor, o los mensajes leídos ya no
+estaban), no se escribe ni en la caché ni en ``django_session``.
+
+Se activa con ``SESSION_ENGINE = "main.sesiones"``.
+"""
+import hashlib
+
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+
+class SessionStore(CachedDBStore):
+
+    def _huella_de(self, datos):
+        return hashlib.sha256(self.serializer().dumps(datos)).hexdigest()
+
+    def load(self):
+        datos = super().load()
+        self._huella = self._huella_de(datos)
+        return datos
+
+    def save(self, must_create=False):
+        if (
+            not must_create
+            and self.session_key is not None
+            and getattr(self, "_huella", None) == self._huella_de(self._get_session())
+        ):
+            return
+        super().save(must_create=must_create)
+        self._huella = self._huella_de(self._get_session())
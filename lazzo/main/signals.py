@@ -0,0 +1,161 @@
+# main/signals.py
+import logging
+
+from django.db import DatabaseError, transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+
+from .autocompletar import indice as indice_autocompletar
+from .busqueda import indice as indice_busqueda
+from . import almacenamiento, imagenes, popularidad, sincronizacion, usuarios
+from .facetas import indice as indice_facetas
+from .models import Favorito, Producto, Servicio, Usuario
+
+logger = logging.getLogger(__name__)
+
+# Índices en memoria que se mantienen con los cambios de Producto
+INDICES_PRODUCTO = (indice_busqueda, indice_facetas, indice_autocompletar)
+
+
+def cargar_indices():
+    """
+    Construye los índices al arrancar el worker (wsgi.py / asgi.py) para
+    que la primera petición no pague la carga. Si la BD no está disponible
+    se construirán en la primera consulta.
+    """
+    for indice in INDICES_PRODUCTO:
+        try:
+            indice.reconstruir()
+        except DatabaseError:
+            logger.warning("No se pudo precargar %s", type(indice).__name__, exc_info=True)
+
+
+def actualizar_indices(productos):
+    """
+    Refresca ``productos`` en los índices cuando la transacción se confirma.
+    Para cambios hechos con ``QuerySet.update()``, que no emiten post_save.
+    Los demás workers se enteran por ``sincronizacion.registrar``.
+    """
+    # Solo tocamos los índices cuando el cambio queda confirmado en la BD
+    def _actualizar():
+        for producto in productos:
+            for indice in INDICES_PRODUCTO:
+                indice.actualizar(producto)
+
+    transaction.on_commit(_actualizar)
+    sincronizacion.registrar(producto.idProducto for producto in productos)
+
+
+@receiver(post_save, sender=Producto)
+def producto_guardado(sender, instance, **kwargs):
+    actualizar_indices([instance])
+
+
+@receiver(post_delete, sender=Producto)
+def producto_eliminado(sender, instance, **kwargs):
+    producto_id = instance.idProducto
+
+    def _eliminar():
+        for indice in INDICES_PRODUCTO:
+            indice.eliminar(producto_id)
+
+    transaction.on_commit(_eliminar)
+    sincronizacion.registrar([producto_id])
+
+
+# ---------- Popularidad ----------
+
+@receiver(pre_save, sender=Producto)
+def producto_popularidad_inicial(sender, instance, **kwargs):
+    # Un producto recién publicado parte con el puntaje de "novedad"
+    if instance._state.adding and not instance.popularidad:
+        instance.popularidad = popularidad.puntaje_publicacion(instance.fecha_publicacion)
+
+
+@receiver(post_save, sender=Favorito)
+def favorito_guardado(sender, instance, created, **kwargs):
+    if created:
+        popularidad.registrar_favorito(instance)
+
+
+@receiver(post_delete, sender=Favorito)
+def favorito_eliminado(sender, instance, **kwargs):
+    popularidad.registrar_favorito(instance, agregado=False)
+
+
+# ---------- Caché de request.usuario ----------
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def usuario_modificado(sender, instance, **kwargs):
+    usuario_id = instance.idUsuario
+    usuarios.invalidar(usuario_id)
+    # Y otra vez al confirmar: mientras tanto otro request pudo volver a
+    # guardar en la caché la fila vieja
+    transaction.on_commit(lambda: usuarios.invalidar(usuario_id))
+
+
+# ---------- Variantes de imágenes ----------
+
+@receiver(pre_save, sender=Producto)
+def producto_imagen_medida(sender, instance, **kwargs):
+    imagenes.preparar_producto(instance)
+
+
+@receiver(post_save, sender=Producto)
+def producto_imagen_guardada(sender, instance, **kwargs):
+    imagenes.programar(instance, "producto")
+
+
+@receiver(post_save, sender=Usuario)
+def usuario_foto_guardada(sender, instance, **kwargs):
+    imagenes.programar(instance, "usuario")
+
+
+# ---------- Referencias de archivos (ver almacenamiento.py) ----------
+
+# Campo de archivo de cada modelo, y si los pedidos pueden guardar su URL
+CAMPOS_ARCHIVO = {Producto: ("imagen", True), Servicio: ("imagen", False), Usuario: ("foto", False)}
+
+
+@receiver(post_init, sender=Producto)
+@receiver(post_init, sender=Servicio)
+@receiver(post_init, sender=Usuario)
+def archivo_cargado(sender, instance, **kwargs):
+    campo, _ = CAMPOS_ARCHIVO[sender]
+    # El valor crudo: leer el atributo arma un FieldFile, y si el campo es
+    # diferido iría a la BD. Un archivo recién asignado aún no es de nadie
+    valor = instance.__dict__.get(campo)
+    instance._archivo_guardado = valor if isinstance(valor, str) else None
+
+
+@receiver(post_save, sender=Producto)
+@receiver(post_save, sender=Servicio)
+@receiver(post_save, sender=Usuario)
+def archivo_reemplazado(sender, instance, update_fields=None, **kwargs):
+    campo, en_pedidos = CAMPOS_ARCHIVO[sender]
+    if campo not in instance.__dict__ or (update_fields is not None and campo not in update_fields):
+        return
+    archivo = getattr(instance, campo)
+    anterior = instance._archivo_guardado
+    instance._archivo_guardado = archivo.name or None
+    if not anterior or anterior == archivo.name:
+        return
+    if en_pedidos and almacenamiento.en_pedidos(archivo.storage, anterior):
+        return
+    archivo.storage.delete(anterior)
+
+
+@receiver(post_delete, sender=Producto)
+@receiver(post_delete, sender=Servicio)
+@receiver(post_delete, sender=Usuario)
+def archivo_borrado(sender, instance, **kwargs):
+    campo, en_pedidos = CAMPOS_ARCHIVO[sender]
+    nombre = instance._archivo_guardado
+    if not nombre:
+        return
+    storage = sender._meta.get_field(campo).storage
+    if en_pedidos and almacenamiento.en_pedidos(storage, nombre):
+        return
+    # Del disco se borra recién al confirmar (ver AlmacenamientoContenido.delete)
+    storage.delete(nombre)
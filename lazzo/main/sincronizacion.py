@@ -0,0 +1,151 @@
+# main/sincronizacion.py
+"""
+Mantiene al día entre workers los índices en memoria de productos
+(búsqueda, facetas y autocompletar).
+
+Cada worker tiene su propia copia de los índices. Cuando un producto cambia
+(señales de ``Producto``, o ``registrar`` desde el código que usa
+``update()``), al confirmarse la transacción se sube ``CLAVE_VERSION`` en la
+caché compartida y el id del producto queda anotado en ``cambio:<versión>``.
+
+Antes de cada consulta el índice compara su versión con la compartida y
+vuelve a leer de la BD solo los productos que cambiaron. Si le falta algún
+cambio (expiró, o son más de ``MAX_CAMBIOS``) se reconstruye completo.
+
+Los cambios de ``reservado`` (cada clic de "agregar al carrito", ver
+reservas.py) van por su propio canal, ``CANAL_RESERVAS``, con su propia
+versión: solo los escuchan los índices que lo ponen en ``CANALES`` (las
+facetas), y una venta flash no obliga a búsqueda y autocompletar a releer
+ni a reconstruirse.
+``invalidar_todo`` (comando ``reconstruir_indice_busqueda``) sube la
+generación y obliga a todos a reconstruir.
+
+Necesita una caché compartida entre procesos (``CACHES`` en settings); con
+LocMemCache cada worker solo vería sus propios cambios.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+CANAL_PRODUCTOS = "productos"
+CANAL_RESERVAS = "reservas"
+
+CLAVE_VERSION = "productos:version"
+CLAVE_GENERACION = "productos:generacion"
+
+# Más cambios pendientes que esto: sale más barato reconstruir
+MAX_CAMBIOS = 500
+
+# Segundos que se guarda cada cambio; un worker que lleva más tiempo sin
+# consultar se reconstruye entero
+DURACION_CAMBIO = 60 * 60 * 24
+
+
+def _clave_version(canal):
+    return f"{canal}:version"
+
+
+def _clave_cambio(version, canal=CANAL_PRODUCTOS):
+    return f"{canal}:cambio:{version}"
+
+
+def _incrementar(clave):
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 0, timeout=None)
+        return cache.incr(clave)
+
+
+def estado(canales=(CANAL_PRODUCTOS,)):
+    """
+    (versión de cada canal…, generación) compartidas, en una sola ida a la
+    caché.
+    """
+    claves = [_clave_version(canal) for canal in canales]
+    valores = cache.get_many([*claves, CLAVE_GENERACION])
+    return (*(valores.get(clave, 0) for clave in claves), valores.get(CLAVE_GENERACION, 0))
+
+
+def _anotar(producto_ids, canal):
+    for producto_id in producto_ids:
+        version = _incrementar(_clave_version(canal))
+        cache.set(_clave_cambio(version, canal), producto_id, timeout=DURACION_CAMBIO)
+
+
+def registrar(producto_ids, canal=CANAL_PRODUCTOS):
+    """Avisa a todos los workers que ``producto_ids`` cambiaron (al confirmar)."""
+    producto_ids = list(producto_ids)
+    transaction.on_commit(lambda: _anotar(producto_ids, canal))
+
+
+def invalidar_todo():
+    """Pide a todos los workers que reconstruyan sus índices."""
+    _incrementar(CLAVE_GENERACION)
+
+
+def cambios(desde, hasta, canal=CANAL_PRODUCTOS):
+    """
+    Ids de los productos que cambiaron en ``canal`` entre las versiones
+    ``desde`` y ``hasta``, o None si no se pueden saber todos.
+    """
+    if hasta - desde > MAX_CAMBIOS:
+        return None
+    claves = [_clave_cambio(version, canal) for version in range(desde + 1, hasta + 1)]
+    valores = cache.get_many(claves)
+    if len(valores) != len(claves):
+        return None
+    return set(valores.values())
+
+
+class IndiceSincronizado:
+    """
+    Base de los índices de productos. Las subclases definen ``CAMPOS`` (los
+    que leen de ``Producto``), ``CANALES`` (los cambios que escuchan),
+    ``reconstruir`` (que anota ``estado(self.CANALES)`` antes de leer los
+    productos), ``actualizar`` y ``eliminar``, y llaman a ``sincronizar``
+    antes de cada consulta.
+    """
+
+    CAMPOS = ("idProducto",)
+    CANALES = (CANAL_PRODUCTOS,)
+
+    def __init__(self):
+        # (versión, generación) compartidas que ya están aplicadas
+        self._estado = None
+        self.cargado = False
+
+    def sincronizar(self):
+        from .models import Producto
+
+        actual = estado(self.CANALES)
+        previo = self._estado
+        if (
+            not self.cargado or previo is None
+            or actual[-1] != previo[-1]
+            or any(hasta < desde for desde, hasta in zip(previo[:-1], actual[:-1]))
+        ):
+            self.reconstruir()
+            return
+        if actual == previo:
+            return
+
+        ids = set()
+        for canal, desde, hasta in zip(self.CANALES, previo, actual):
+            if desde == hasta:
+                continue
+            nuevos = cambios(desde, hasta, canal)
+            if nuevos is None:
+                self.reconstruir()
+                return
+            ids |= nuevos
+        encontrados = {
+            producto.idProducto: producto
+            for producto in Producto.objects.filter(idProducto__in=ids).only(*self.CAMPOS)
+        }
+        with self._lock:
+            for producto_id in ids:
+                if producto_id in encontrados:
+                    self.actualizar(encontrados[producto_id])
+                else:
+                    self.eliminar(producto_id)
+            self._estado = actual
@@ -0,0 +1,181 @@
+# main/tareas.py
+"""
+Cola de tareas en segundo plano guardada en la tabla ``Tarea``.
+
+Uso:
+
+    @tarea("pedidos.confirmar")
+    def confirmar_pedido(pedido_id):
+        ...
+
+    confirmar_pedido.encolar(pedido_id=5, clave="pedido:5:confirmar")
+
+Encolar es un ``INSERT`` en la misma transacción de quien encola: si el
+pedido se revierte, sus tareas también. Con ``clave`` la tarea es
+idempotente (una segunda llamada con la misma clave no crea otra).
+
+El worker es ``manage.py procesar_tareas``. Cada tarea corre en su propia
+transacción; si falla se reintenta con espera exponencial hasta
+``max_intentos`` y después queda "fallida" con el error guardado.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+# Espera antes del reintento n: ESPERA_BASE * 2**(n-1) segundos, con tope
+ESPERA_BASE = 10
+ESPERA_MAXIMA = 60 * 60
+
+# Tiempo que un worker "posee" una tarea tomada antes de que otro la retome
+DURACION_BLOQUEO = timedelta(minutes=5)
+
+_registro = {}
+
+
+def tarea(nombre, max_intentos=5):
+    """Registra la función como tarea y le agrega ``.encolar(...)``."""
+    def decorador(funcion):
+        if nombre in _registro:
+            raise ValueError(f"Ya hay una tarea registrada como {nombre!r}.")
+        _registro[nombre] = funcion
+
+        def encolar_tarea(clave=None, retraso=None, repetir=False, **argumentos):
+            return encolar(
+                nombre, clave=clave, retraso=retraso,
+                max_intentos=max_intentos, repetir=repetir, **argumentos
+            )
+
+        funcion.nombre_tarea = nombre
+        funcion.encolar = encolar_tarea
+        return funcion
+
+    return decorador
+
+
+def encolar(nombre, clave=None, retraso=None, max_intentos=5, repetir=False, **argumentos):
+    """
+    Crea la tarea ``nombre`` con ``argumentos`` (deben ser serializables a
+    JSON). ``retraso`` (timedelta) posterga su primera ejecución. Devuelve la
+    ``Tarea``; si ya existía una con la misma ``clave``, devuelve esa. Con
+    ``repetir``, si esa ya terminó se vuelve a dejar pendiente (la clave
+    solo evita duplicados mientras está en cola).
+    """
+    datos = {
+        "nombre": nombre,
+        "argumentos": argumentos,
+        "max_intentos": max_intentos,
+        "disponible_desde": timezone.now() + (retraso or timedelta()),
+    }
+    if clave is None:
+        return Tarea.objects.create(**datos)
+
+    try:
+        # Savepoint propio: un choque de clave no invalida la transacción
+        # de quien encola
+        with transaction.atomic():
+            return Tarea.objects.create(clave=clave, **datos)
+    except IntegrityError:
+        existente = Tarea.objects.get(clave=clave)
+    if repetir and existente.estado in ("completada", "fallida"):
+        # Condicional: otro pudo volver a encolarla entre medio
+        Tarea.objects.filter(pk=existente.pk, estado=existente.estado).update(
+            estado="pendiente", intentos=0, error="", bloqueada_hasta=None, terminada=None, **datos
+        )
+        existente.refresh_from_db()
+    return existente
+
+
+def _espera(intentos):
+    segundos = min(ESPERA_BASE * 2 ** (intentos - 1), ESPERA_MAXIMA)
+    # Un poco de azar para que los reintentos no lleguen todos juntos
+    return timedelta(seconds=segundos * random.uniform(0.8, 1.2))
+
+
+def tomar(lote=10):
+    """
+    Marca como "en_proceso" hasta ``lote`` tareas listas para correr (o
+    abandonadas por un worker caído) y las devuelve.
+    """
+    ahora = timezone.now()
+    listas = (
+        Tarea.objects
+        .filter(
+            Q(estado="pendiente", disponible_desde__lte=ahora)
+            | Q(estado="en_proceso", bloqueada_hasta__lt=ahora)
+        )
+        .order_by("disponible_desde", "id")
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        # Varios workers no se esperan entre sí: cada uno salta lo tomado
+        listas = listas.select_for_update(skip_locked=True)
+    else:
+        listas = listas.select_for_update()
+
+    with transaction.atomic():
+        tareas = list(listas[:lote])
+        if tareas:
+            Tarea.objects.filter(id__in=[t.id for t in tareas]).update(
+                estado="en_proceso",
+                bloqueada_hasta=ahora + DURACION_BLOQUEO,
+                intentos=F("intentos") + 1,
+            )
+    for t in tareas:
+        t.intentos += 1
+    return tareas
+
+
+def ejecutar(tarea_obj):
+    """Corre una tarea ya tomada y guarda el resultado. True si terminó bien."""
+    funcion = _registro.get(tarea_obj.nombre)
+    try:
+        if funcion is None:
+            raise LookupError(f"No hay ninguna tarea registrada como {tarea_obj.nombre!r}.")
+        with transaction.atomic():
+            funcion(**tarea_obj.argumentos)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Falló la tarea %s (intento %s)", tarea_obj, tarea_obj.intentos, exc_info=True)
+        if tarea_obj.intentos >= tarea_obj.max_intentos:
+            Tarea.objects.filter(id=tarea_obj.id).update(
+                estado="fallida", error=error, bloqueada_hasta=None, terminada=timezone.now(),
+            )
+        else:
+            Tarea.objects.filter(id=tarea_obj.id).update(
+                estado="pendiente",
+                error=error,
+                bloqueada_hasta=None,
+                disponible_desde=timezone.now() + _espera(tarea_obj.intentos),
+            )
+        return False
+
+    Tarea.objects.filter(id=tarea_obj.id).update(
+        estado="completada", error="", bloqueada_hasta=None, terminada=timezone.now(),
+    )
+    return True
+
+
+def procesar(lote=10):
+    """Toma y corre un lote. Devuelve (completadas, fallidas)."""
+    completadas = fallidas = 0
+    for tarea_obj in tomar(lote):
+        if ejecutar(tarea_obj):
+            completadas += 1
+        else:
+            fallidas += 1
+    return completadas, fallidas
+
+
+def purgar(dias=7):
+    """Borra las tareas completadas hace más de ``dias`` días."""
+    limite = timezone.now() - timedelta(days=dias)
+    borradas, _ = Tarea.objects.filter(estado="completada", terminada__lt=limite).delete()
+    return borradas
@@ -0,0 +1,107 @@
+# main/templatetags/imagenes.py
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from main import imagenes
+
+register = template.Library()
+
+
+def _srcset(variantes, formato):
+    return ", ".join(
+        f"{default_storage.url(archivos[formato])} {ancho}w"
+        for ancho, archivos in imagenes.anchos(variantes)
+    )
+
+
+def _atributos(ancho, alto, previa):
+    """width/height (el navegador reserva el espacio) y la previa de fondo."""
+    atributos = format_html(' width="{}" height="{}"', ancho, alto) if ancho and alto else ""
+    if previa:
+        atributos += format_html(
+            ' style="background: url({}) center / cover no-repeat"', previa
+        )
+    return atributos
+
+
+@register.simple_tag
+def imagen_responsive(archivo, variantes, alt="", sizes="280px", clase="",
+                      ancho=None, alto=None, previa="", carga="lazy"):
+    """
+    ``<picture>`` con las variantes WebP/JPEG de ``archivo`` para que el
+    navegador baje solo el ancho que necesita (según ``sizes``). Sin
+    variantes todavía, un ``<img>`` con el original. ``carga="eager"`` para
+    la imagen principal de la página, que se ve sin hacer scroll.
+
+        {% imagen_responsive producto.imagen producto.variantes alt=producto.nombre sizes="280px" %}
+    """
+    if not archivo:
+        return ""
+    atributos = _atributos(ancho, alto, previa)
+    if not imagenes.vigentes(archivo, variantes):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}"{} loading="{}" decoding="async">',
+            archivo.url, alt, clase, atributos, carga,
+        )
+
+    _, mayor = imagenes.anchos(variantes)[-1]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}"{} loading="{}" decoding="async">'
+        '</picture>',
+        _srcset(variantes, "webp"), sizes,
+        default_storage.url(mayor["jpeg"]), _srcset(variantes, "jpeg"), sizes, alt, clase, atributos,
+        carga,
+    )
+
+
+@register.simple_tag
+def imagen_producto(producto, sizes="280px", clase="", carga="lazy"):
+    """
+    ``imagen_responsive`` de la imagen de ``producto`` con sus medidas y su
+    previa en línea: la grilla no salta al cargar y cada tarjeta muestra la
+    previa borrosa hasta que llega la imagen (que se baja recién al acercarse).
+
+        {% imagen_producto producto %}
+    """
+    return imagen_responsive(
+        producto.imagen, producto.variantes, alt=producto.nombre, sizes=sizes, clase=clase,
+        ancho=producto.imagen_ancho, alto=producto.imagen_alto, previa=producto.imagen_previa,
+        carga=carga,
+    )
+
+
+@register.simple_tag
+def avatar(usuario, alt=None, clase=""):
+    """
+    Foto de perfil cuadrada de ``usuario``: WebP (animada si la foto es un
+    GIF animado) con la JPEG estática de respaldo, en 1x y 2x. El tamaño lo
+    pone el CSS. Sin foto devuelve "" para que la plantilla muestre la inicial.
+
+        {% avatar vendedor %}
+    """
+    foto = usuario.foto
+    if not foto:
+        return ""
+    if alt is None:
+        alt = usuario.nombre_completo
+    if not imagenes.vigentes(foto, usuario.variantes, "avatar"):
+        return format_html('<img src="{}" alt="{}" class="{}" decoding="async">', foto.url, alt, clase)
+
+    lados = imagenes.anchos(usuario.variantes)
+    chico, grande = lados[0][1], lados[-1][1]
+
+    def densidades(formato):
+        if chico is grande:
+            return default_storage.url(chico[formato])
+        return f"{default_storage.url(chico[formato])} 1x, {default_storage.url(grande[formato])} 2x"
+
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" alt="{}" class="{}" decoding="async">'
+        '</picture>',
+        densidades("webp"), default_storage.url(chico["jpeg"]), densidades("jpeg"), alt, clase,
+    )
@@ -1,3 +1,2003 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.template import Context, Template
+from django.test import (
+    Client, RequestFactory, TestCase, TransactionTestCase, override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.client import BOUNDARY, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    almacenamiento, archivo, busqueda, carrito, idempotencia, imagenes, paginacion, pedidos,
+    popularidad, reservas, sincronizacion, tareas, ventas, views,
+)
+from .autocompletar import IndiceAutocompletar
+from .busqueda import IndiceBusqueda
+from .facetas import IndiceFacetas, indice as indice_facetas
+from .models import (
+    ArchivoMedia, Carrito, ClaveIdempotencia, DetallePedido, DetallePedidoArchivado, Favorito,
+    Notificacion, ObjetoCarrito, Pago, PagoArchivado, Pedido, PedidoArchivado, Producto, Reserva, Tarea,
+    Usuario, VentaDiaria,
+)
+from .pedidos import StockInsuficiente, crear_pedido
+from .sesiones import SessionStore
+
+
+def crear_usuario(correo, rol="cliente"):
+    return Usuario.objects.create(
+        nombre_completo=correo.split("@")[0],
+        correo=correo,
+        contrasena="x",
+        rol=rol,
+    )
+
+
+def crear_producto(vendedor, stock, precio=1000, nombre="Producto"):
+    return Producto.objects.create(
+        nombre=nombre,
+        descripcion="x",
+        precio=precio,
+        stock=stock,
+        categoria="ropa",
+        vendedor=vendedor,
+    )
+
+
+class CrearPedidoTests(TestCase):
+
+    def setUp(self):
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+
+    def test_descuenta_stock_y_crea_detalles_y_pago(self):
+        a = crear_producto(self.vendedor, stock=5, precio=1000)
+        b = crear_producto(self.vendedor, stock=2, precio=500)
+
+        pedido = crear_pedido(
+            self.cliente, [(a.idProducto, 2), (b.idProducto, 1), (a.idProducto, 1)],
+            envio=2990, metodo_pago="Pago en línea",
+        )
+
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.stock, b.stock), (2, 1))
+        self.assertEqual(pedido.total, 3 * 1000 + 500 + 2990)
+        self.assertEqual(pedido.detalles.count(), 2)
+        self.assertEqual(Pago.objects.get(pedido=pedido).monto, pedido.total)
+
+    def test_sin_stock_no_escribe_nada(self):
+        a = crear_producto(self.vendedor, stock=5)
+        b = crear_producto(self.vendedor, stock=1)
+
+        with self.assertRaises(StockInsuficiente):
+            crear_pedido(self.cliente, [(a.idProducto, 2), (b.idProducto, 2)])
+
+        a.refresh_from_db()
+        self.assertEqual(a.stock, 5)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(DetallePedido.objects.exists())
+
+    def test_producto_eliminado_es_stock_insuficiente(self):
+        a = crear_producto(self.vendedor, stock=5)
+        b = crear_producto(self.vendedor, stock=5)
+        b_id = b.idProducto
+        b.delete()
+
+        with self.assertRaises(StockInsuficiente) as error:
+            crear_pedido(self.cliente, [(a.idProducto, 1), (b_id, 2)])
+
+        self.assertEqual((error.exception.producto_id, error.exception.disponible), (b_id, 0))
+        a.refresh_from_db()
+        self.assertEqual(a.stock, 5)
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_otro_pedido_entre_medio_informa_el_producto_que_falto(self):
+        a = crear_producto(self.vendedor, stock=5)
+        b = crear_producto(self.vendedor, stock=3)
+        Producto.objects.filter(pk=b.pk).update(stock=1)
+        validar = pedidos._validar_stock
+        llamadas = []
+
+        def leyo_antes(*args):
+            # La primera validación vio el stock de b antes de que otro
+            # pedido se lo llevara; el UPDATE condicional sí lo ve
+            llamadas.append(args)
+            if len(llamadas) > 1:
+                validar(*args)
+
+        with mock.patch.object(pedidos, "_validar_stock", side_effect=leyo_antes):
+            with self.assertRaises(StockInsuficiente) as error:
+                crear_pedido(self.cliente, [(a.idProducto, 2), (b.idProducto, 2)])
+
+        self.assertEqual(error.exception.producto.pk, b.pk)
+        self.assertEqual((error.exception.disponible, error.exception.solicitado), (1, 2))
+        a.refresh_from_db()
+        self.assertEqual(a.stock, 5)
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_si_se_libero_stock_entre_medio_informa_el_mas_justo(self):
+        a = crear_producto(self.vendedor, stock=5)
+        b = crear_producto(self.vendedor, stock=3)
+
+        # El UPDATE no alcanzó, pero al volver a leer ambos alcanzan
+        with mock.patch.object(
+            pedidos, "_crear_pedido",
+            side_effect=pedidos._StockCambio({a.idProducto: 2, b.idProducto: 2}, {}),
+        ):
+            with self.assertRaises(StockInsuficiente) as error:
+                crear_pedido(self.cliente, [(a.idProducto, 2), (b.idProducto, 2)])
+
+        self.assertEqual(error.exception.producto.pk, b.pk)
+
+
+class ResumenPedidoTests(TestCase):
+
+    def setUp(self):
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+        self.polera = crear_producto(vendedor, stock=5, nombre="Polera")
+        self.gorro = crear_producto(vendedor, stock=5, nombre="Gorro")
+        Producto.objects.filter(pk=self.gorro.pk).update(imagen="products/gorro.jpg")
+        self.gorro.refresh_from_db()
+
+    def test_se_llena_al_crear_el_pedido(self):
+        pedido = crear_pedido(
+            self.cliente, [(self.gorro.idProducto, 2), (self.polera.idProducto, 1)],
+            metodo_pago="Pago en línea",
+        )
+
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.cantidad_items, 3)
+        self.assertEqual(pedido.producto_principal, "Gorro")
+        self.assertEqual(pedido.miniatura, default_storage.url("products/gorro.jpg"))
+        self.assertEqual(pedido.estado_pago, "pagado")
+
+    def test_sin_pago_ni_imagen(self):
+        pedido = crear_pedido(self.cliente, [(self.polera.idProducto, 1)], estado="pendiente")
+
+        pedido.refresh_from_db()
+        self.assertEqual((pedido.producto_principal, pedido.miniatura), ("Polera", ""))
+        self.assertEqual(pedido.estado_pago, "")
+
+    def test_la_migracion_rellena_los_pedidos_existentes(self):
+        migracion = importlib.import_module("main.migrations.0014_pedido_resumen")
+        pedido = Pedido.objects.create(usuario=self.cliente, total=2500, estado="pagado")
+        DetallePedido.objects.bulk_create([
+            DetallePedido(pedido=pedido, producto=self.gorro, cantidad=2,
+                          precio_unitario=1000, subtotal=2000),
+            DetallePedido(pedido=pedido, producto=self.polera, cantidad=1,
+                          precio_unitario=500, subtotal=500),
+        ])
+        Pago.objects.create(pedido=pedido, monto=2500, metodo="x", estado="pendiente")
+        Pago.objects.create(pedido=pedido, monto=2500, metodo="x", estado="pagado")
+        vacio = Pedido.objects.create(usuario=self.cliente, total=0, estado="cancelado")
+
+        migracion.rellenar_resumenes(django_apps, None)
+
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.cantidad_items, 3)
+        self.assertEqual(pedido.producto_principal, "Gorro")
+        self.assertEqual(pedido.miniatura, default_storage.url("products/gorro.jpg"))
+        # El último pago
+        self.assertEqual(pedido.estado_pago, "pagado")
+        vacio.refresh_from_db()
+        self.assertEqual((vacio.cantidad_items, vacio.producto_principal), (0, ""))
+
+
+class ReservasTests(TestCase):
+
+    def setUp(self):
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.ana = crear_usuario("ana@lazzo.cl")
+        self.beto = crear_usuario("beto@lazzo.cl")
+        self.producto = crear_producto(vendedor, stock=5)
+
+    def refrescar(self):
+        self.producto.refresh_from_db()
+        return self.producto
+
+    def test_no_reserva_mas_de_lo_disponible(self):
+        self.assertEqual(reservas.reservar(self.ana.idUsuario, self.producto, 3), 3)
+        self.assertEqual(reservas.reservar(self.beto.idUsuario, self.producto, 4), 2)
+        self.assertEqual(self.refrescar().reservado, 5)
+        self.assertEqual(self.producto.disponible, 0)
+
+        # Bajar la cantidad devuelve unidades
+        self.assertEqual(reservas.reservar(self.ana.idUsuario, self.producto, 1), 1)
+        self.assertEqual(self.refrescar().disponible, 2)
+
+    def test_liberar_vencidas(self):
+        reservas.reservar(self.ana.idUsuario, self.producto, 2)
+        reservas.reservar(self.beto.idUsuario, self.producto, 1)
+        Reserva.objects.filter(usuario=self.ana).update(vence=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(reservas.liberar_vencidas(lote=1), 1)
+        self.assertEqual(self.refrescar().reservado, 1)
+        self.assertFalse(Reserva.objects.filter(usuario=self.ana).exists())
+
+    def test_el_pedido_convierte_la_reserva(self):
+        reservas.reservar(self.ana.idUsuario, self.producto, 3)
+        reservas.reservar(self.beto.idUsuario, self.producto, 2)
+
+        # Beto no puede comprar lo que Ana tiene apartado
+        with self.assertRaises(StockInsuficiente):
+            crear_pedido(self.beto, [(self.producto.idProducto, 3)])
+
+        crear_pedido(self.ana, [(self.producto.idProducto, 3)])
+        self.refrescar()
+        self.assertEqual((self.producto.stock, self.producto.reservado), (2, 2))
+        self.assertFalse(Reserva.objects.filter(usuario=self.ana).exists())
+
+
+llamadas = []
+
+
+@tareas.tarea("tests.falla_una_vez", max_intentos=2)
+def falla_una_vez(valor):
+    llamadas.append(valor)
+    if len(llamadas) == 1:
+        raise RuntimeError("primer intento")
+
+
+class TareasTests(TestCase):
+
+    def setUp(self):
+        llamadas.clear()
+
+    def test_clave_idempotente(self):
+        a = falla_una_vez.encolar(valor=1, clave="una")
+        b = falla_una_vez.encolar(valor=2, clave="una")
+        self.assertEqual(a.id, b.id)
+        self.assertEqual(Tarea.objects.count(), 1)
+
+    def test_reintenta_con_espera(self):
+        tarea = falla_una_vez.encolar(valor=1)
+
+        self.assertEqual(tareas.procesar(), (0, 1))
+        tarea.refresh_from_db()
+        self.assertEqual((tarea.estado, tarea.intentos), ("pendiente", 1))
+        self.assertGreater(tarea.disponible_desde, timezone.now())
+
+        # Todavía no le toca
+        self.assertEqual(tareas.procesar(), (0, 0))
+
+        Tarea.objects.update(disponible_desde=timezone.now())
+        self.assertEqual(tareas.procesar(), (1, 0))
+        tarea.refresh_from_db()
+        self.assertEqual(tarea.estado, "completada")
+        self.assertEqual(llamadas, [1, 1])
+
+    def test_el_pedido_encola_sus_notificaciones(self):
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        cliente = crear_usuario("cliente@lazzo.cl")
+        producto = crear_producto(vendedor, stock=5)
+
+        crear_pedido(cliente, [(producto.idProducto, 2)])
+        self.assertFalse(Notificacion.objects.exists())
+
+        self.assertEqual(tareas.procesar(), (5, 0))
+        self.assertEqual(
+            sorted(Notificacion.objects.values_list("usuario_id", "tipo")),
+            sorted([
+                (cliente.idUsuario, "Pedido confirmado"),
+                (vendedor.idUsuario, "Nueva venta"),
+                (vendedor.idUsuario, "Stock bajo"),
+            ]),
+        )
+
+    def test_tareas_del_pedido_retomadas_no_repiten(self):
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        cliente = crear_usuario("cliente@lazzo.cl")
+        # Queda con 3: también cruza el umbral de stock bajo
+        producto = crear_producto(vendedor, stock=5)
+        crear_pedido(cliente, [(producto.idProducto, 2)])
+        tareas.procesar()
+        producto.refresh_from_db()
+        popularidad = producto.popularidad
+
+        # Como si el arriendo hubiera vencido con las tareas ya hechas
+        Tarea.objects.update(estado="pendiente", disponible_desde=timezone.now())
+        tareas.procesar()
+
+        self.assertEqual(Notificacion.objects.filter(tipo="Pedido confirmado").count(), 1)
+        self.assertEqual(Notificacion.objects.filter(tipo="Nueva venta").count(), 1)
+        self.assertEqual(Notificacion.objects.filter(tipo="Stock bajo").count(), 1)
+        producto.refresh_from_db()
+        self.assertEqual(producto.popularidad, popularidad)
+
+
+class CheckoutIdempotenteTests(TestCase):
+
+    def setUp(self):
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+        self.producto = crear_producto(vendedor, stock=5)
+
+        self.client = Client()
+        sesion = self.client.session
+        sesion["usuario_id"] = self.cliente.idUsuario
+        sesion.save()
+        self.client.get(f"/cart/add/{self.producto.idProducto}/")
+
+    def datos(self, clave):
+        return {
+            "direccion_id": "nueva",
+            "direccion_nueva": "Calle 1",
+            "clave_idempotencia": clave,
+        }
+
+    def comprar(self, clave):
+        return self.client.post("/checkout/", self.datos(clave))
+
+    def clave_tomada(self, clave, vence):
+        # La fila que deja un request que sigue corriendo (o que se cayó)
+        cuerpo = encode_multipart(BOUNDARY, self.datos(clave))
+        return ClaveIdempotencia.objects.create(
+            usuario=self.cliente, clave=clave, ruta="/checkout/",
+            huella=hashlib.sha256(cuerpo).hexdigest(), vence=vence,
+        )
+
+    def test_producto_eliminado_antes_de_pagar_vuelve_al_carrito(self):
+        crear = views.crear_pedido_desde_lineas
+
+        def eliminado_entre_medio(*args, **kwargs):
+            # El vendedor lo borra después de armado el resumen del carrito
+            Producto.objects.filter(pk=self.producto.pk).delete()
+            return crear(*args, **kwargs)
+
+        with mock.patch.object(views, "crear_pedido_desde_lineas", side_effect=eliminado_entre_medio):
+            respuesta = self.comprar("abc")
+
+        self.assertRedirects(respuesta, "/cart/", fetch_redirect_response=False)
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_repetir_la_clave_no_duplica_el_pedido(self):
+        primera = self.comprar("abc")
+        segunda = self.comprar("abc")
+
+        self.assertEqual(primera.status_code, 302)
+        self.assertEqual(segunda.status_code, 302)
+        self.assertEqual(segunda["Location"], primera["Location"])
+        self.assertEqual(segunda["Idempotent-Replayed"], "true")
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.stock, 4)
+
+    def test_misma_clave_con_otros_datos(self):
+        self.comprar("abc")
+        respuesta = self.client.post("/checkout/", {
+            "direccion_id": "nueva",
+            "direccion_nueva": "Otra calle",
+            "clave_idempotencia": "abc",
+        })
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(ClaveIdempotencia.objects.count(), 1)
+
+    def test_clave_en_curso_responde_409_sin_esperar(self):
+        self.clave_tomada("abc", timezone.now() + timedelta(seconds=30))
+
+        respuesta = self.comprar("abc")
+
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta["Retry-After"], str(idempotencia.REINTENTAR_EN))
+        self.assertEqual(Pedido.objects.count(), 0)
+
+    def test_clave_abandonada_se_retoma(self):
+        registro = self.clave_tomada("abc", timezone.now() - timedelta(seconds=1))
+
+        respuesta = self.comprar("abc")
+
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(Pedido.objects.count(), 1)
+        registro.refresh_from_db()
+        self.assertTrue(registro.completada)
+        self.assertIsNone(registro.vence)
+        self.assertEqual(self.comprar("abc")["Idempotent-Replayed"], "true")
+
+    def test_clave_sin_vencimiento_se_retoma(self):
+        # Filas en curso anteriores al arriendo
+        self.clave_tomada("abc", None)
+        self.assertEqual(self.comprar("abc").status_code, 302)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_solo_un_reintento_retoma_la_clave(self):
+        registro = self.clave_tomada("abc", timezone.now() - timedelta(seconds=1))
+        vencido = ClaveIdempotencia.objects.get(pk=registro.pk)
+
+        self.assertIsNotNone(idempotencia._retomar(registro))
+        self.assertIsNone(idempotencia._retomar(vencido))
+
+
+class ArchivoPedidosTests(TestCase):
+
+    def setUp(self):
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+        self.producto = crear_producto(vendedor, stock=10, nombre="Polera")
+
+        hace_dos_anios = timezone.now() - timedelta(days=730)
+        self.viejos = [
+            crear_pedido(self.cliente, [(self.producto.idProducto, 1)], metodo_pago="Pago en línea")
+            for _ in range(3)
+        ]
+        Pedido.objects.filter(idPedido__in=[p.idPedido for p in self.viejos]).update(
+            fecha=hace_dos_anios
+        )
+        self.nuevo = crear_pedido(self.cliente, [(self.producto.idProducto, 2)])
+
+        self.client = Client()
+        sesion = self.client.session
+        sesion["usuario_id"] = self.cliente.idUsuario
+        sesion.save()
+
+    def test_mueve_solo_los_viejos_en_lotes(self):
+        lotes = []
+        movidos = archivo.archivar(
+            timezone.now() - timedelta(days=365), lote=2,
+            progreso=lambda *copiados: lotes.append(copiados),
+        )
+
+        self.assertEqual(movidos, 3)
+        self.assertEqual(lotes, [(2, 2, 2), (1, 1, 1)])
+        self.assertEqual(list(Pedido.objects.values_list("idPedido", flat=True)), [self.nuevo.idPedido])
+        self.assertEqual(PedidoArchivado.objects.count(), 3)
+        self.assertEqual(DetallePedidoArchivado.objects.get(pedido_id=self.viejos[0].idPedido).nombre_producto, "Polera")
+        self.assertEqual(PagoArchivado.objects.count(), 3)
+        self.assertEqual(DetallePedido.objects.count(), 1)
+
+    def test_se_reanuda_si_ya_habia_copias(self):
+        # Simula una corrida cortada después de copiar y antes de borrar
+        archivo._copiar([self.viejos[0].idPedido], "default")
+
+        self.assertEqual(archivo.archivar(timezone.now() - timedelta(days=365)), 3)
+        self.assertEqual(PedidoArchivado.objects.count(), 3)
+        self.assertEqual(DetallePedidoArchivado.objects.count(), 3)
+
+    def test_las_vistas_leen_del_archivo(self):
+        archivo.archivar(timezone.now() - timedelta(days=365))
+
+        recientes = self.client.get("/pedidos/")
+        self.assertEqual([p.idPedido for p in recientes.context["pedidos"]], [self.nuevo.idPedido])
+        self.assertTrue(recientes.context["ver_archivo"])
+
+        anteriores = self.client.get("/pedidos/", {"fuente": "archivo"})
+        self.assertEqual(
+            sorted(p.idPedido for p in anteriores.context["pedidos"]),
+            sorted(p.idPedido for p in self.viejos),
+        )
+
+        detalle = self.client.get(f"/pedido/{self.viejos[0].idPedido}/")
+        self.assertEqual(detalle.status_code, 200)
+        self.assertContains(detalle, "Polera")
+        self.assertEqual(detalle.context["pago"].metodo, "Pago en línea")
+
+        self.assertContains(self.client.get(f"/pedido/{self.nuevo.idPedido}/"), "Polera")
+
+
+class ExportarVentasTests(TestCase):
+
+    def setUp(self):
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        otro = crear_usuario("otro@lazzo.cl", rol="vendedor")
+        cliente = crear_usuario("cliente@lazzo.cl")
+        polera = crear_producto(self.vendedor, stock=10, precio=1000, nombre="Polera")
+        ajena = crear_producto(otro, stock=10, nombre="Ajena")
+
+        self.viejo = crear_pedido(cliente, [(polera.idProducto, 1)])
+        Pedido.objects.filter(idPedido=self.viejo.idPedido).update(
+            fecha=timezone.make_aware(datetime(2024, 1, 10))
+        )
+        archivo.archivar(timezone.now() - timedelta(days=365))
+        self.nuevo = crear_pedido(cliente, [(polera.idProducto, 2), (ajena.idProducto, 1)])
+
+        self.client = Client()
+        sesion = self.client.session
+        sesion["usuario_id"] = self.vendedor.idUsuario
+        sesion.save()
+
+    def descargar(self, **params):
+        respuesta = self.client.get("/vendedor/ventas/exportar/", params)
+        return respuesta, b"".join(respuesta.streaming_content)
+
+    def test_csv_con_ventas_recientes_y_archivadas(self):
+        respuesta, contenido = self.descargar()
+
+        lineas = contenido.decode().splitlines()
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(lineas[0], "pedido,fecha,estado,producto_id,producto,cantidad,precio_unitario,subtotal")
+        self.assertEqual([linea.split(",")[0] for linea in lineas[1:]], [str(self.viejo.idPedido), str(self.nuevo.idPedido)])
+        self.assertNotIn("Ajena", contenido.decode())
+
+    def test_ndjson_filtrado_por_fecha(self):
+        _, contenido = self.descargar(formato="ndjson", desde="2024-01-01", hasta="2024-01-10")
+
+        filas = [json.loads(linea) for linea in contenido.decode().splitlines()]
+        self.assertEqual([f["pedido"] for f in filas], [self.viejo.idPedido])
+        self.assertEqual(filas[0]["producto"], "Polera")
+
+    def test_gzip_al_vuelo(self):
+        respuesta = self.client.get("/vendedor/ventas/exportar/", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(respuesta["Content-Encoding"], "gzip")
+        contenido = gzip.decompress(b"".join(respuesta.streaming_content)).decode()
+        self.assertEqual(len(contenido.splitlines()), 3)
+
+    def test_solo_vendedores_y_fechas_validas(self):
+        respuesta = self.client.get("/vendedor/ventas/exportar/", {"desde": "10/01/2024"})
+        self.assertEqual(respuesta.status_code, 400)
+        sesion = self.client.session
+        sesion["usuario_id"] = crear_usuario("comprador@lazzo.cl").idUsuario
+        sesion.save()
+        self.assertEqual(self.client.get("/vendedor/ventas/exportar/").status_code, 403)
+
+
+class VentasDiariasTests(TestCase):
+
+    def setUp(self):
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+        self.polera = crear_producto(self.vendedor, stock=20, precio=1000, nombre="Polera")
+        self.gorro = crear_producto(self.vendedor, stock=20, precio=500, nombre="Gorro")
+
+    def comprar(self, *lineas):
+        pedido = crear_pedido(self.cliente, [(p.idProducto, n) for p, n in lineas])
+        tareas.procesar(lote=50)
+        return pedido
+
+    def test_acumula_al_procesar_el_pedido_una_sola_vez(self):
+        pedido = self.comprar((self.polera, 2), (self.gorro, 1))
+        self.comprar((self.polera, 1))
+        ventas.acumular_pedido(pedido.idPedido)  # repetida: no suma de nuevo
+
+        fila = VentaDiaria.objects.get(producto=self.polera)
+        self.assertEqual((fila.unidades, fila.ingresos, fila.pedidos), (3, 3000, 2))
+        self.assertEqual(fila.dia, timezone.localdate())
+        self.assertEqual(VentaDiaria.objects.get(producto=self.gorro).unidades, 1)
+
+    def test_reconstruir_incluye_archivados(self):
+        viejo = self.comprar((self.gorro, 4))
+        Pedido.objects.filter(idPedido=viejo.idPedido).update(fecha=timezone.now() - timedelta(days=400))
+        archivo.archivar(timezone.now() - timedelta(days=365))
+        self.comprar((self.polera, 2))
+        VentaDiaria.objects.all().delete()
+
+        hoy = timezone.localdate()
+        ventas.reconstruir(hoy - timedelta(days=500), hoy)
+
+        self.assertEqual(
+            set(VentaDiaria.objects.values_list("producto_id", "dia", "unidades")),
+            {
+                (self.gorro.idProducto, hoy - timedelta(days=400), 4),
+                (self.polera.idProducto, hoy, 2),
+            },
+        )
+
+    def test_borrar_el_producto_no_borra_sus_ventas(self):
+        pedido = crear_pedido(self.cliente, [(self.gorro.idProducto, 4), (self.polera.idProducto, 1)])
+        Pedido.objects.filter(idPedido=pedido.idPedido).update(fecha=timezone.now() - timedelta(days=400))
+        tareas.procesar(lote=50)
+        archivo.archivar(timezone.now() - timedelta(days=365))
+        self.gorro.delete()
+
+        fila = VentaDiaria.objects.get(nombre="Gorro")
+        self.assertIsNone(fila.producto_id)
+        self.assertEqual((fila.vendedor_id, fila.unidades, fila.ingresos), (self.vendedor.idUsuario, 4, 2000))
+
+        # Reconstruir no puede rehacerla, pero tampoco la pierde
+        hoy = timezone.localdate()
+        ventas.reconstruir(hoy - timedelta(days=500), hoy)
+        self.assertEqual(VentaDiaria.objects.get(nombre="Gorro").ingresos, 2000)
+        resumen = ventas.resumen(self.vendedor.idUsuario, "mes", hoy=hoy - timedelta(days=400))
+        self.assertEqual(resumen["totales"]["ingresos"], 3000)
+        self.assertIn((None, "Gorro"), [(fila["producto_id"], fila["nombre"]) for fila in resumen["top"]])
+
+    def test_panel_lee_los_acumulados(self):
+        self.comprar((self.polera, 2), (self.gorro, 1))
+        client = Client()
+        sesion = client.session
+        sesion["usuario_id"] = self.vendedor.idUsuario
+        sesion.save()
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = client.get("/vendedor/ventas/", {"periodo": "mes"})
+
+        self.assertFalse([c for c in consultas.captured_queries if "main_detallepedido" in c["sql"]])
+
+        self.assertEqual(respuesta.context["totales"], {"unidades": 3, "ingresos": 2500})
+        self.assertEqual([f["nombre"] for f in respuesta.context["top"]], ["Polera", "Gorro"])
+        self.assertEqual(len(respuesta.context["serie"]), 1)
+
+
+class IndiceBusquedaTests(TestCase):
+    """Cada ``IndiceBusqueda()`` hace de la copia de un worker distinto."""
+
+    def setUp(self):
+        cache.clear()
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto = crear_producto(self.vendedor, stock=3, nombre="Monster White")
+        self.otro = IndiceBusqueda()
+        self.otro.reconstruir()
+
+    def ids(self, consulta):
+        return [producto_id for producto_id, _ in self.otro.buscar(consulta)]
+
+    def test_ve_los_productos_creados_en_otro_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = crear_producto(self.vendedor, stock=1, nombre="Polera Y2K")
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.ids("polera"), [nuevo.idProducto])
+        # Solo se relee el producto que cambió
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(self.ids("monster"), [self.producto.idProducto])
+
+    def test_ve_cambios_y_borrados_de_otro_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.nombre = "Cadena Plateada"
+            self.producto.save()
+        self.assertEqual(self.ids("monster"), [])
+        self.assertEqual(self.ids("cadena"), [self.producto.idProducto])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.delete()
+        self.assertEqual(self.ids("cadena"), [])
+
+    def test_cambios_sin_confirmar_no_se_publican(self):
+        version = sincronizacion.estado()[0]
+        crear_producto(self.vendedor, stock=1, nombre="Polera")
+        self.assertEqual(sincronizacion.estado()[0], version)
+
+    def test_sin_cambios_no_consulta_la_bd(self):
+        self.otro.buscar("monster")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids("monster"), [self.producto.idProducto])
+
+    def test_si_se_perdieron_cambios_reconstruye(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = crear_producto(self.vendedor, stock=1, nombre="Polera")
+        version = sincronizacion.estado()[0]
+        cache.delete(f"productos:cambio:{version}")
+
+        self.assertEqual(self.ids("polera"), [nuevo.idProducto])
+        self.assertEqual(self.otro._estado, sincronizacion.estado())
+
+    def test_comando_reconstruir_recarga_todos_los_workers(self):
+        # update() no emite señales: solo se ve tras la reconstrucción
+        Producto.objects.filter(pk=self.producto.pk).update(nombre="Chaqueta")
+        self.assertEqual(self.ids("chaqueta"), [])
+
+        call_command("reconstruir_indice_busqueda", stdout=io.StringIO())
+
+        self.assertEqual(self.ids("chaqueta"), [self.producto.idProducto])
+        self.assertEqual(self.ids("monster"), [])
+
+
+class FacetasTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a = crear_producto(self.vendedor, stock=2, precio=1000)
+            self.b = crear_producto(self.vendedor, stock=1, precio=7000)
+        self.otro = IndiceFacetas()
+        self.otro.reconstruir()
+
+    def test_las_reservas_cambian_el_conteo_con_stock_en_otro_worker(self):
+        self.assertEqual(self.otro.contar(solo_stock=True), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservas.reservar(self.cliente.idUsuario, self.b, 1)
+        self.assertEqual(self.otro.contar(solo_stock=True), 1)
+        self.assertEqual(self.otro.contar(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservas.liberar(self.cliente.idUsuario)
+        self.assertEqual(self.otro.contar(solo_stock=True), 2)
+
+    def test_las_reservas_no_tocan_busqueda_ni_autocompletar(self):
+        otros = (IndiceBusqueda(), IndiceAutocompletar())
+        for indice in otros:
+            indice.reconstruir()
+        version = sincronizacion.estado()[0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservas.reservar(self.cliente.idUsuario, self.b, 1)
+
+        self.assertEqual(sincronizacion.estado()[0], version)
+        with self.assertNumQueries(0):
+            for indice in otros:
+                indice.sincronizar()
+        self.assertEqual(self.otro.contar(solo_stock=True), 1)
+
+    def test_recalcular_reservado_se_publica(self):
+        Producto.objects.filter(pk=self.a.pk).update(reservado=2)
+        self.otro.reconstruir()
+        self.assertEqual(self.otro.contar(solo_stock=True), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reservas.recalcular_reservado(), 1)
+        self.assertEqual(self.otro.contar(solo_stock=True), 2)
+
+    def test_ve_los_productos_nuevos_y_borrados(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_producto(self.vendedor, stock=1, precio=30000)
+        self.assertEqual(self.otro.contar(min_precio=20000), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.delete()
+        self.assertEqual(self.otro.contar(), 2)
+
+    def test_catalogo_en_stock_cuenta_lo_mismo_que_muestra(self):
+        indice_facetas.reconstruir()
+        with self.captureOnCommitCallbacks(execute=True):
+            reservas.reservar(self.cliente.idUsuario, self.b, 1)
+
+        respuesta = Client().get("/catalogo/", {"en_stock": "1"})
+
+        pagina = respuesta.context["page_obj"]
+        self.assertEqual([p.idProducto for p in pagina], [self.a.idProducto])
+        self.assertEqual(pagina.total_aproximado, 1)
+        ropa = next(
+            c for c in respuesta.context["facetas_categorias"]
+            if c["tipo"] == "producto" and c["slug"] == "ropa"
+        )
+        self.assertEqual(ropa["cantidad"], 1)
+        self.assertEqual(sum(t["cantidad"] for t in respuesta.context["histograma_precios"]), 1)
+
+
+class AutocompletarTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto = crear_producto(self.vendedor, stock=1, nombre="Monster White")
+        self.otro = IndiceAutocompletar()
+        self.otro.reconstruir()
+
+    def nombres(self, prefijo):
+        return [nombre for _, nombre in self.otro.sugerir(prefijo)[0]]
+
+    def test_prefijo_al_inicio_y_en_otra_palabra(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_producto(self.vendedor, stock=1, nombre="White Russian")
+        self.assertEqual(self.nombres("whi"), ["White Russian", "Monster White"])
+
+    def test_ve_cambios_de_otro_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.nombre = "Polera Negra"
+            self.producto.save()
+        self.assertEqual(self.nombres("mon"), [])
+        self.assertEqual(self.nombres("pol"), ["Polera Negra"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.delete()
+        self.assertEqual(self.nombres("pol"), [])
+
+    def test_comando_reconstruir_tambien_recarga_sugerencias(self):
+        Producto.objects.filter(pk=self.producto.pk).update(nombre="Chaqueta")
+        call_command("reconstruir_indice_busqueda", stdout=io.StringIO())
+        self.assertEqual(self.nombres("chaq"), ["Chaqueta"])
+
+    def test_categorias(self):
+        self.assertIn(("producto", "ropa", "Ropa"), self.otro.sugerir("rop")[1])
+
+
+class AlmacenCarritoBDTests(TestCase):
+
+    def setUp(self):
+        self.almacen = carrito.AlmacenCarritoBD()
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+        self.a = crear_producto(vendedor, stock=10, precio=1000)
+        self.b = crear_producto(vendedor, stock=10, precio=500)
+        # Varias líneas: ninguna operación debe releerlas todas
+        for _ in range(3):
+            self.almacen.agregar(self.cliente.idUsuario, crear_producto(vendedor, stock=5, precio=100))
+
+    def total(self):
+        return Carrito.objects.get(usuario=self.cliente).total
+
+    def linea(self, producto):
+        objeto = ObjetoCarrito.objects.get(carrito__usuario=self.cliente, producto=producto)
+        return self.almacen.obtener_linea(self.cliente.idUsuario, objeto.idObjeto)
+
+    def test_cada_operacion_solo_toca_su_linea(self):
+        usuario_id = self.cliente.idUsuario
+
+        # Carrito, línea, la reserva, el INSERT de la línea y de su fila
+        # intermedia, y el ajuste del total
+        with self.assertNumQueries(13):
+            self.almacen.agregar(usuario_id, self.a, 2)
+        self.assertEqual(self.total(), 300 + 2000)
+
+        with self.assertNumQueries(9):
+            self.almacen.agregar(usuario_id, self.a, 1)
+        self.assertEqual(self.total(), 300 + 3000)
+
+        linea = self.linea(self.a)
+        with self.assertNumQueries(7):
+            self.almacen.cambiar_cantidad(usuario_id, linea, 5)
+        self.assertEqual(self.total(), 300 + 5000)
+
+        linea = self.linea(self.a)
+        with self.assertNumQueries(8):
+            self.almacen.quitar(usuario_id, linea)
+        self.assertEqual(self.total(), 300)
+        self.assertFalse(ObjetoCarrito.objects.filter(producto=self.a).exists())
+
+    def test_el_resumen_corrige_precios_de_las_otras_lineas(self):
+        self.almacen.agregar(self.cliente.idUsuario, self.a, 1)
+        self.almacen.agregar(self.cliente.idUsuario, self.b, 2)
+        Producto.objects.filter(pk=self.a.pk).update(precio=1500)
+
+        resumen = self.almacen.resumen(self.cliente.idUsuario)
+
+        self.assertEqual(resumen.total, 300 + 1500 + 1000)
+        self.assertEqual(self.total(), resumen.total)
+
+    def test_cambiar_a_lo_que_se_pudo_reservar(self):
+        self.almacen.agregar(self.cliente.idUsuario, self.b, 1)
+
+        linea = self.almacen.cambiar_cantidad(self.cliente.idUsuario, self.linea(self.b), 50)
+
+        self.assertEqual(linea.cantidad, 10)
+        self.assertEqual(self.total(), 300 + 5000)
+
+
+class AlmacenCarritoCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.almacen = carrito.AlmacenCarritoCache()
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.a = crear_producto(vendedor, stock=10, precio=1000)
+        self.b = crear_producto(vendedor, stock=10, precio=500)
+        self.ana = crear_usuario("ana@lazzo.cl")
+        self.beto = crear_usuario("beto@lazzo.cl")
+
+    def en_bd(self, usuario):
+        return dict(
+            ObjetoCarrito.objects
+            .filter(carrito__usuario=usuario)
+            .values_list("producto_id", "cantidad")
+        )
+
+    def test_la_escritura_espera_a_la_otra_del_mismo_usuario(self):
+        clave = f"carrito:bloqueo:lineas:{self.ana.idUsuario}"
+        self.almacen.agregar(self.ana.idUsuario, self.a, 1)
+        cache.add(clave, "otro", 10)
+        suelta = threading.Timer(0.1, cache.delete, [clave])
+        suelta.start()
+        self.addCleanup(suelta.cancel)
+
+        self.almacen.agregar(self.ana.idUsuario, self.b, 1)
+
+        self.assertEqual(
+            {obj.producto_id: obj.cantidad for obj in self.almacen.resumen(self.ana.idUsuario).objetos},
+            {self.a.idProducto: 1, self.b.idProducto: 1},
+        )
+
+    def test_sin_bloqueo_no_escribe_ni_reserva(self):
+        cache.add(f"carrito:bloqueo:lineas:{self.ana.idUsuario}", "otro", 10)
+
+        with mock.patch.object(carrito, "ESPERA_ESCRITURA", 0):
+            with self.assertRaises(carrito.CarritoOcupado):
+                self.almacen.agregar(self.ana.idUsuario, self.a, 1)
+
+        self.assertFalse(Reserva.objects.exists())
+        self.assertIsNone(cache.get(f"carrito:{self.ana.idUsuario}"))
+
+    def test_bloqueo_vencido_no_suelta_el_de_otro(self):
+        with carrito.bloqueo("x", timeout=1) as obtenido:
+            self.assertTrue(obtenido)
+            # Venció y lo tomó otro worker
+            cache.set("carrito:bloqueo:x", "ficha-de-otro")
+        self.assertEqual(cache.get("carrito:bloqueo:x"), "ficha-de-otro")
+
+    def test_persiste_a_todos_los_que_cambiaron(self):
+        self.almacen.agregar(self.ana.idUsuario, self.a, 2)
+        self.almacen.agregar(self.beto.idUsuario, self.b, 1)
+        self.almacen.agregar(self.ana.idUsuario, self.b, 1)
+
+        self.assertEqual(self.almacen.persistir(), 2)
+        self.assertEqual(self.en_bd(self.ana), {self.a.idProducto: 2, self.b.idProducto: 1})
+        self.assertEqual(self.en_bd(self.beto), {self.b.idProducto: 1})
+        # Las entradas ya escritas se borran
+        self.assertEqual(self.almacen.persistir(), 0)
+        self.assertIsNone(cache.get("carrito:cambio:1"))
+
+    def test_cambio_durante_la_pasada_queda_para_la_siguiente(self):
+        self.almacen.agregar(self.ana.idUsuario, self.a, 1)
+        volcar = carrito._volcar_a_bd
+
+        def volcar_y_cambiar(usuario_id, lineas):
+            volcar(usuario_id, lineas)
+            if usuario_id == self.ana.idUsuario and self.b.idProducto not in lineas:
+                self.almacen.agregar(self.ana.idUsuario, self.b, 3)
+
+        with mock.patch.object(carrito, "_volcar_a_bd", volcar_y_cambiar):
+            self.assertEqual(self.almacen.persistir(), 1)
+        self.assertEqual(self.en_bd(self.ana), {self.a.idProducto: 1})
+
+        self.assertEqual(self.almacen.persistir(), 1)
+        self.assertEqual(self.en_bd(self.ana), {self.a.idProducto: 1, self.b.idProducto: 3})
+
+    def test_entrada_a_medio_escribir_se_revisa_en_la_pasada_siguiente(self):
+        # Un _escribir que sacó su número pero aún no guardó la entrada
+        cache.set(self.almacen.CLAVE_ULTIMO, 1, None)
+        self.almacen.agregar(self.beto.idUsuario, self.b, 1)
+
+        self.assertEqual(self.almacen.persistir(), 1)
+        self.assertEqual(cache.get(self.almacen.CLAVE_HECHO), 0)
+
+        cache.set("carrito:cambio:1", self.ana.idUsuario)
+        self.almacen.agregar(self.ana.idUsuario, self.a, 1)
+        self.assertEqual(self.almacen.persistir(), 2)
+        self.assertEqual(self.en_bd(self.ana), {self.a.idProducto: 1})
+        self.assertEqual(cache.get(self.almacen.CLAVE_HECHO), 3)
+
+    def test_entrada_perdida_no_traba_las_siguientes(self):
+        self.almacen.agregar(self.ana.idUsuario, self.a, 1)
+        self.almacen.agregar(self.beto.idUsuario, self.b, 1)
+        cache.delete("carrito:cambio:1")
+
+        self.assertEqual(self.almacen.persistir(), 1)
+        self.assertEqual(self.almacen.persistir(), 1)
+        self.assertEqual(cache.get(self.almacen.CLAVE_HECHO), 2)
+        self.assertEqual(self.almacen.persistir(), 0)
+
+    def test_persistir_un_usuario(self):
+        self.almacen.agregar(self.ana.idUsuario, self.a, 1)
+        self.almacen.agregar(self.beto.idUsuario, self.b, 1)
+
+        self.assertEqual(self.almacen.persistir(self.ana.idUsuario), 1)
+        self.assertEqual(self.en_bd(self.ana), {self.a.idProducto: 1})
+        self.assertEqual(self.en_bd(self.beto), {})
+
+    def test_no_corre_dos_pasadas_a_la_vez(self):
+        self.almacen.agregar(self.ana.idUsuario, self.a, 1)
+        with carrito.bloqueo("persistir"):
+            self.assertEqual(self.almacen.persistir(), 0)
+        self.assertEqual(self.almacen.persistir(), 1)
+
+
+class PaginacionCursorTests(TestCase):
+
+    def setUp(self):
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        # Precios y popularidades repetidos: el desempate es por id
+        self.productos = [
+            crear_producto(vendedor, stock=1, precio=precio)
+            for precio in (1000, 500, 1000, 2000, 1000)
+        ]
+        for producto, puntos in zip(self.productos, (5, 5, 1, 5, 9)):
+            Producto.objects.filter(pk=producto.pk).update(popularidad=puntos)
+        self.fabrica = RequestFactory()
+
+    def pagina(self, orden, cursor=None, **kwargs):
+        datos = {"cursor": cursor} if cursor else {}
+        return paginacion.paginar(
+            self.fabrica.get("/", datos), Producto.objects.all(), orden, por_pagina=2, **kwargs
+        )
+
+    def esperado(self, orden):
+        return list(Producto.objects.order_by(*orden).values_list("idProducto", flat=True))
+
+    def ids(self, pagina):
+        return [producto.idProducto for producto in pagina]
+
+    def test_recorre_cada_orden_hacia_adelante_y_atras(self):
+        for nombre, orden in paginacion.ORDENES_CATALOGO.items():
+            with self.subTest(orden=nombre):
+                paginas = [self.pagina(orden)]
+                while paginas[-1].has_next:
+                    paginas.append(self.pagina(orden, paginas[-1].cursor_siguiente))
+
+                vistos = [i for pagina in paginas for i in self.ids(pagina)]
+                self.assertEqual(vistos, self.esperado(orden))
+                self.assertEqual([p.number for p in paginas], [1, 2, 3])
+                self.assertFalse(paginas[0].has_previous)
+
+                atras = [paginas[-1]]
+                while atras[-1].has_previous:
+                    atras.append(self.pagina(orden, atras[-1].cursor_anterior))
+                self.assertEqual(
+                    [self.ids(p) for p in reversed(atras)], [self.ids(p) for p in paginas]
+                )
+                self.assertEqual(atras[-1].number, 1)
+                self.assertTrue(atras[-1].has_next)
+
+    def test_cursor_manipulado_vuelve_a_la_primera_pagina(self):
+        orden = paginacion.ORDENES_CATALOGO["precio_asc"]
+        cursor = self.pagina(orden).cursor_siguiente
+        manipulado = cursor[:-1] + ("A" if cursor[-1] != "A" else "B")
+
+        pagina = self.pagina(orden, manipulado)
+
+        self.assertEqual(pagina.number, 1)
+        self.assertEqual(self.ids(pagina), self.esperado(orden)[:2])
+        self.assertIsNone(paginacion.leer_cursor("basura", orden))
+
+    def test_cursor_de_otro_orden_no_se_acepta(self):
+        cursor = self.pagina(paginacion.ORDENES_CATALOGO["precio_asc"]).cursor_siguiente
+        orden = paginacion.ORDENES_CATALOGO["recientes"]
+
+        pagina = self.pagina(orden, cursor)
+
+        self.assertEqual(pagina.number, 1)
+        self.assertEqual(self.ids(pagina), self.esperado(orden)[:2])
+
+    def test_cursor_firmado_lleva_los_valores_de_la_ultima_fila(self):
+        orden = paginacion.ORDENES_CATALOGO["precio_desc"]
+        pagina = self.pagina(orden)
+        ultima = pagina.object_list[-1]
+
+        valores, direccion, numero = paginacion.leer_cursor(pagina.cursor_siguiente, orden)
+
+        self.assertEqual(valores, [ultima.precio, ultima.idProducto])
+        self.assertEqual((direccion, numero), ("sig", 2))
+
+    def test_total_aproximado(self):
+        orden = paginacion.ORDENES_CATALOGO["recientes"]
+        self.assertIsNone(self.pagina(orden).total_aproximado)
+
+        pagina = self.pagina(orden, contar=True)
+        self.assertEqual((pagina.total_aproximado, pagina.total_exacto), (5, True))
+
+        with mock.patch.object(paginacion, "LIMITE_CONTEO", 3):
+            pagina = self.pagina(orden, contar=True)
+        self.assertEqual((pagina.total_aproximado, pagina.total_exacto), (3, False))
+
+        # Un total ya conocido (facetas) no se vuelve a contar
+        with self.assertNumQueries(1):
+            self.assertEqual(self.pagina(orden, contar=True, total=42).total_aproximado, 42)
+
+    def test_paginar_lista_con_empates(self):
+        pares = [(9, 3.0), (7, 3.0), (8, 2.0), (4, 2.0), (2, 1.0)]
+        fabrica = self.fabrica
+
+        primera = paginacion.paginar_lista(fabrica.get("/"), pares, por_pagina=2)
+        segunda = paginacion.paginar_lista(
+            fabrica.get("/", {"cursor": primera.cursor_siguiente}), pares, por_pagina=2
+        )
+        tercera = paginacion.paginar_lista(
+            fabrica.get("/", {"cursor": segunda.cursor_siguiente}), pares, por_pagina=2
+        )
+        volver = paginacion.paginar_lista(
+            fabrica.get("/", {"cursor": tercera.cursor_anterior}), pares, por_pagina=2
+        )
+
+        self.assertEqual(
+            [primera.object_list, segunda.object_list, tercera.object_list],
+            [pares[:2], pares[2:4], pares[4:]],
+        )
+        self.assertFalse(tercera.has_next)
+        self.assertEqual(volver.object_list, pares[2:4])
+        self.assertEqual(primera.total_aproximado, 5)
+
+
+class BusquedaDifusaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.monster = crear_producto(vendedor, stock=1, nombre="Monster White")
+        self.tecnologia = crear_producto(vendedor, stock=1, nombre="Cable Tecnología")
+        self.mochila = crear_producto(vendedor, stock=1, nombre="Mochila Negra")
+        self.indice = IndiceBusqueda()
+        self.indice.reconstruir()
+
+    def ids(self, consulta):
+        return [producto_id for producto_id, _ in self.indice.buscar_difuso(consulta)]
+
+    def test_tolera_errores_de_tipeo(self):
+        self.assertEqual(self.ids("tecnolgia"), [self.tecnologia.idProducto])
+        self.assertEqual(self.ids("monstr"), [self.monster.idProducto])
+        self.assertEqual(self.ids("mochla negra"), [self.mochila.idProducto])
+        # Sin tildes ni mayúsculas
+        self.assertEqual(self.ids("TECNOLOJIA"), [self.tecnologia.idProducto])
+
+    def test_umbral_de_similitud(self):
+        parecidos = dict(self.indice._terminos_parecidos("monstr"))
+        self.assertAlmostEqual(parecidos["monster"], 0.5)
+        self.assertTrue(all(
+            similitud >= busqueda.UMBRAL_SIMILITUD for similitud in parecidos.values()
+        ))
+
+        with mock.patch.object(busqueda, "UMBRAL_SIMILITUD", 0.6):
+            self.assertEqual(self.ids("monstr"), [])
+        # Comparte dos trigramas con "monster": Jaccard 2 / 12
+        self.assertEqual(self.ids("mostr"), [])
+
+    def test_la_palabra_exacta_puntua_mas_que_la_parecida(self):
+        vendedor = self.monster.vendedor
+        otro = crear_producto(vendedor, stock=1, nombre="Monstera")
+        self.indice.actualizar(otro)
+
+        self.assertEqual(self.ids("monster"), [self.monster.idProducto, otro.idProducto])
+
+    def test_limita_las_palabras_parecidas(self):
+        vendedor = self.monster.vendedor
+        for i in range(busqueda.MAX_TERMINOS_DIFUSOS + 3):
+            self.indice.actualizar(crear_producto(vendedor, stock=1, nombre=f"Polera{i}"))
+
+        self.assertEqual(
+            len(self.indice._terminos_parecidos("polera")), busqueda.MAX_TERMINOS_DIFUSOS
+        )
+
+    def test_la_vista_avisa_que_son_resultados_parecidos(self):
+        busqueda.indice.reconstruir()
+        cliente = Client()
+
+        exacta = cliente.get("/buscar/", {"q": "monster"})
+        self.assertFalse(exacta.context["aproximados"])
+        self.assertEqual(exacta.context["resultados"], [self.monster])
+
+        parecida = cliente.get("/buscar/", {"q": "monstr whte"})
+        self.assertTrue(parecida.context["aproximados"])
+        self.assertEqual(parecida.context["resultados"], [self.monster])
+        self.assertContains(parecida, "Mostrando resultados parecidos")
+
+        nada = cliente.get("/buscar/", {"q": "zzqq"})
+        self.assertFalse(nada.context["aproximados"])
+        self.assertEqual(nada.context["resultados"], [])
+
+
+class PopularidadTests(TestCase):
+
+    def setUp(self):
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+
+    def puntaje(self, producto):
+        producto.refresh_from_db(fields=["popularidad"])
+        return producto.popularidad
+
+    def test_los_eventos_suman_en_escala_logaritmica(self):
+        producto = crear_producto(self.vendedor, stock=5)
+        inicial = self.puntaje(producto)
+        self.assertAlmostEqual(inicial, popularidad.puntaje_publicacion(producto.fecha_publicacion))
+
+        favorito = Favorito.objects.create(usuario=self.cliente, producto=producto)
+        con_favorito = popularidad.sumar_puntajes(
+            inicial, popularidad.puntaje(popularidad.PESO_FAVORITO, favorito.fecha)
+        )
+        self.assertAlmostEqual(self.puntaje(producto), con_favorito)
+
+        favorito.delete()
+        self.assertAlmostEqual(self.puntaje(producto), inicial)
+
+    def test_no_se_desborda_con_el_tiempo(self):
+        producto = crear_producto(self.vendedor, stock=5)
+        dentro_de_un_siglo = popularidad.EPOCA + timedelta(days=365 * 100)
+
+        popularidad.registrar_ventas([(producto.idProducto, 3)], momento=dentro_de_un_siglo)
+
+        esperado = popularidad.puntaje(popularidad.PESO_UNIDAD_VENDIDA * 3, dentro_de_un_siglo)
+        self.assertAlmostEqual(self.puntaje(producto), esperado)
+        self.assertLess(esperado, 3000)
+
+    def test_lo_reciente_pesa_mas(self):
+        viejo = crear_producto(self.vendedor, stock=5)
+        nuevo = crear_producto(self.vendedor, stock=5)
+        hace_dos_meses = timezone.now() - timedelta(days=60)
+        Producto.objects.filter(pk=viejo.pk).update(fecha_publicacion=hace_dos_meses)
+        for _ in range(4):
+            pedido = crear_pedido(self.cliente, [(viejo.idProducto, 1)])
+            Pedido.objects.filter(pk=pedido.pk).update(fecha=hace_dos_meses)
+        crear_pedido(self.cliente, [(nuevo.idProducto, 1)])
+
+        popularidad.recalcular()
+
+        self.assertGreater(self.puntaje(nuevo), self.puntaje(viejo))
+
+    def test_recalcular_coincide_con_los_eventos_y_no_consulta_por_producto(self):
+        productos = [crear_producto(self.vendedor, stock=20) for _ in range(6)]
+        for producto in productos[:4]:
+            Favorito.objects.create(usuario=self.cliente, producto=producto)
+        crear_pedido(self.cliente, [(productos[0].idProducto, 2), (productos[1].idProducto, 1)])
+        crear_pedido(self.cliente, [(productos[0].idProducto, 1)])
+        tareas.procesar()
+        incrementales = [self.puntaje(producto) for producto in productos]
+
+        Producto.objects.update(popularidad=0)
+        # Productos, favoritos, ventas y un UPDATE por lote
+        with self.assertNumQueries(4):
+            self.assertEqual(popularidad.recalcular(), 6)
+
+        for producto, esperado in zip(productos, incrementales):
+            self.assertAlmostEqual(self.puntaje(producto), esperado)
+
+    def test_migracion_estima_la_publicacion_y_recalcula(self):
+        migracion = importlib.import_module("main.migrations.0022_popularidad_historica")
+        sin_historial = crear_producto(self.vendedor, stock=5)
+        vendido = crear_producto(self.vendedor, stock=5)
+        posterior = crear_producto(self.vendedor, stock=5)
+        pedido = crear_pedido(self.cliente, [(vendido.idProducto, 1)])
+        venta = timezone.now() - timedelta(days=30)
+        Pedido.objects.filter(pk=pedido.pk).update(fecha=venta)
+        publicado = posterior.fecha_publicacion
+
+        migracion.fechas_publicacion(django_apps, None)
+        migracion.recalcular_popularidad(django_apps, None)
+
+        for producto in (sin_historial, vendido, posterior):
+            producto.refresh_from_db()
+        self.assertEqual(vendido.fecha_publicacion, venta)
+        # Publicado antes que el vendido (id menor)
+        self.assertEqual(sin_historial.fecha_publicacion, venta)
+        self.assertEqual(posterior.fecha_publicacion, publicado)
+        self.assertAlmostEqual(
+            vendido.popularidad,
+            popularidad.sumar_puntajes(
+                popularidad.puntaje_publicacion(venta),
+                popularidad.puntaje(popularidad.PESO_UNIDAD_VENDIDA, venta),
+            ),
+        )
+        self.assertTrue(Pedido.objects.get(pk=pedido.pk).popularidad_sumada)
+
+
+class MiniCarritoTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+        self.producto = crear_producto(vendedor, stock=5, precio=1000, nombre="Polera")
+        carrito.almacen().agregar(self.cliente.idUsuario, self.producto, 2)
+
+        self.client = Client()
+        sesion = self.client.session
+        sesion["usuario_id"] = self.cliente.idUsuario
+        sesion.save()
+
+    def test_con_la_version_en_cache_no_consulta(self):
+        usuario_id = self.cliente.idUsuario
+        primera = carrito.vista_previa(usuario_id)
+        self.assertEqual(primera["carrito_cantidad"], 2)
+        self.assertEqual(primera["carrito_total_preview"], 2000)
+        self.assertIsNotNone(
+            cache.get(f"carrito:vista_previa:{usuario_id}:{carrito.version(usuario_id)}")
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(carrito.vista_previa(usuario_id), primera)
+
+    def test_cambiar_el_carrito_la_invalida(self):
+        usuario_id = self.cliente.idUsuario
+        carrito.vista_previa(usuario_id)
+        version = carrito.version(usuario_id)
+
+        carrito.almacen().agregar(usuario_id, self.producto, 1)
+
+        self.assertNotEqual(carrito.version(usuario_id), version)
+        datos = carrito.vista_previa(usuario_id)
+        self.assertEqual(datos["carrito_cantidad"], 3)
+        self.assertEqual(datos["carrito_items_preview"][0]["nombre"], "Polera")
+
+    def test_pagina_estatica_sin_consultas(self):
+        self.client.get("/acerca/")
+
+        with self.assertNumQueries(0):
+            respuesta = self.client.get("/acerca/")
+        self.assertEqual(respuesta.context["carrito_cantidad"], 2)
+
+    def test_sin_sesion(self):
+        cliente = Client()
+        # La primera carga los índices de este worker
+        cliente.get("/acerca/")
+        with self.assertNumQueries(0):
+            respuesta = cliente.get("/acerca/")
+        self.assertEqual(respuesta.context["carrito_cantidad"], 0)
+
+
+class CarritoApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.cliente = crear_usuario("cliente@lazzo.cl")
+        self.polera = crear_producto(vendedor, stock=3, precio=1000, nombre="Polera")
+        self.gorro = crear_producto(vendedor, stock=5, precio=500, nombre="Gorro")
+        self.client = self.cliente_con_sesion(Client())
+
+    def cliente_con_sesion(self, cliente):
+        sesion = cliente.session
+        sesion["usuario_id"] = self.cliente.idUsuario
+        sesion.save()
+        return cliente
+
+    def enviar(self, cuerpo, cliente=None, **extra):
+        return (cliente or self.client).post(
+            "/cart/api/", json.dumps(cuerpo), content_type="application/json", **extra
+        )
+
+    def agregar(self, producto, cantidad):
+        return self.enviar(
+            {"accion": "agregar", "producto": producto.idProducto, "cantidad": cantidad}
+        ).json()
+
+    def version(self):
+        return self.client.get("/cart/api/").json()["version"]
+
+    def test_agregar_actualizar_y_eliminar(self):
+        datos = self.agregar(self.polera, 2)
+        self.assertEqual(
+            [(linea["nombre"], linea["cantidad"]) for linea in datos["lineas"]], [("Polera", 2)]
+        )
+        self.assertEqual(
+            datos["totales"], {"cantidad": 2, "subtotal": 2000, "envio": 2990, "total": 4990}
+        )
+        objeto = datos["lineas"][0]["objeto"]
+
+        datos = self.enviar({"accion": "actualizar", "objeto": objeto, "cantidad": 1}).json()
+        self.assertEqual(datos["lineas"][0]["subtotal"], 1000)
+
+        datos = self.enviar({"accion": "eliminar", "objeto": objeto}).json()
+        self.assertEqual((datos["lineas"], datos["eliminadas"]), ([], [objeto]))
+        self.assertEqual(datos["totales"]["total"], 0)
+
+    def test_varias_operaciones_en_un_request(self):
+        self.agregar(self.polera, 1)
+
+        datos = self.enviar({"version": self.version(), "operaciones": [
+            {"accion": "agregar", "producto": self.gorro.idProducto, "cantidad": 2},
+            {"accion": "agregar", "producto": self.polera.idProducto, "cantidad": 1},
+        ]}).json()
+
+        self.assertEqual(
+            sorted((linea["nombre"], linea["cantidad"]) for linea in datos["lineas"]),
+            [("Gorro", 2), ("Polera", 2)],
+        )
+        self.assertEqual(datos["totales"]["subtotal"], 3000)
+        self.assertEqual(datos["version"], self.version())
+
+    def test_ajusta_la_cantidad_al_stock(self):
+        objeto = self.agregar(self.polera, 1)["lineas"][0]["objeto"]
+
+        datos = self.enviar({"accion": "actualizar", "objeto": objeto, "cantidad": 10}).json()
+
+        self.assertEqual(datos["lineas"][0]["cantidad"], 3)
+        self.assertEqual(datos["mensajes"][0]["nivel"], "warning")
+
+        datos = self.agregar(self.polera, 1)
+        self.assertEqual(datos["lineas"], [])
+        self.assertIn("máximo disponible", datos["mensajes"][0]["texto"])
+
+    def test_version_vieja_responde_409_sin_aplicar_nada(self):
+        vieja = self.version()
+        self.agregar(self.gorro, 1)
+
+        respuesta = self.enviar({"version": vieja, "operaciones": [
+            {"accion": "agregar", "producto": self.polera.idProducto, "cantidad": 1},
+        ]})
+
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()["version"], self.version())
+        self.assertFalse(ObjetoCarrito.objects.filter(producto=self.polera).exists())
+
+    def test_exige_csrf(self):
+        cliente = self.cliente_con_sesion(Client(enforce_csrf_checks=True))
+        operacion = {"accion": "agregar", "producto": self.gorro.idProducto, "cantidad": 1}
+
+        self.assertEqual(self.enviar(operacion, cliente).status_code, 403)
+
+        cliente.get("/cart/")
+        token = cliente.cookies["csrftoken"].value
+        respuesta = self.enviar(operacion, cliente, HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_errores(self):
+        self.assertEqual(Client().get("/cart/api/").status_code, 401)
+        respuesta = self.client.post("/cart/api/", "{", content_type="application/json")
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(self.enviar({"accion": "vender", "objeto": 1}).status_code, 400)
+
+
+class UsuarioActualTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario("cliente@lazzo.cl")
+        self.client = Client()
+        sesion = self.client.session
+        sesion["usuario_id"] = self.usuario.idUsuario
+        sesion.save()
+
+    def consultas_a_usuario(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url)
+        return sum('FROM "main_usuario"' in c["sql"] for c in consultas.captured_queries)
+
+    def test_se_carga_una_vez_y_despues_sale_de_la_cache(self):
+        self.assertEqual(self.consultas_a_usuario("/account/"), 1)
+        self.assertEqual(self.consultas_a_usuario("/account/"), 0)
+        self.assertEqual(self.consultas_a_usuario("/favoritos/"), 0)
+
+    def test_guardar_el_perfil_invalida_la_cache(self):
+        self.client.get("/account/")
+        with self.captureOnCommitCallbacks(execute=True):
+            Usuario.objects.get(idUsuario=self.usuario.idUsuario).save()
+
+        self.assertEqual(self.consultas_a_usuario("/account/"), 1)
+
+    def test_sin_sesion(self):
+        cliente = Client()
+        self.assertRedirects(cliente.get("/account/"), "/login/", fetch_redirect_response=False)
+
+
+class SesionesTests(TestCase):
+
+    def setUp(self):
+        inicial = SessionStore()
+        inicial["usuario_id"] = 7
+        inicial.create()
+        self.clave = inicial.session_key
+
+    def test_no_escribe_si_los_datos_no_cambian(self):
+        sesion = SessionStore(self.clave)
+        sesion["usuario_id"] = 7
+        self.assertTrue(sesion.modified)
+        with CaptureQueriesContext(connection) as consultas:
+            sesion.save()
+        self.assertFalse([c for c in consultas.captured_queries if "django_session" in c["sql"]])
+
+    def test_escribe_cuando_cambian(self):
+        sesion = SessionStore(self.clave)
+        sesion["usuario_rol"] = "vendedor"
+        sesion.save()
+
+        self.assertEqual(SessionStore(self.clave)["usuario_rol"], "vendedor")
+        self.assertEqual(DBSessionStore(self.clave)["usuario_rol"], "vendedor")
+
+
+def imagen_de_prueba(ancho, alto, nombre="foto.jpg"):
+    contenido = io.BytesIO()
+    Image.new("RGB", (ancho, alto), (200, 30, 30)).save(contenido, "JPEG")
+    return SimpleUploadedFile(nombre, contenido.getvalue(), content_type="image/jpeg")
+
+
+@override_settings(IMAGENES_PROCESOS=0)
+class VariantesImagenTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        self.producto = crear_producto(self.vendedor, stock=1)
+        self.producto.imagen = imagen_de_prueba(1200, 600)
+        self.producto.save()
+
+    def test_genera_los_anchos_en_webp_y_jpeg(self):
+        self.assertEqual(tareas.procesar(), (1, 0))
+
+        self.producto.refresh_from_db()
+        variantes = self.producto.variantes
+        self.assertEqual(variantes["origen"], self.producto.imagen.name)
+        self.assertEqual(sorted(k for k in variantes if k != "origen"), ["200", "400", "800"])
+        with default_storage.open(variantes["400"]["webp"]) as archivo, Image.open(archivo) as imagen:
+            self.assertEqual((imagen.format, imagen.size), ("WEBP", (400, 200)))
+
+        html = Template(
+            "{% load imagenes %}{% imagen_responsive p.imagen p.variantes alt='x' %}"
+        ).render(Context({"p": self.producto}))
+        self.assertIn("200w", html)
+        self.assertIn('type="image/webp"', html)
+
+    def test_imagen_chica_no_se_agranda_y_al_cambiarla_se_borran_las_viejas(self):
+        tareas.procesar()
+        self.producto.refresh_from_db()
+        viejas = self.producto.variantes
+
+        self.producto.imagen = imagen_de_prueba(150, 150, "chica.jpg")
+        self.producto.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            tareas.procesar()
+
+        self.producto.refresh_from_db()
+        self.assertEqual(sorted(k for k in self.producto.variantes if k != "origen"), ["150"])
+        self.assertFalse(default_storage.exists(viejas["200"]["jpeg"]))
+
+    def test_volver_a_una_imagen_anterior_regenera_sus_variantes(self):
+        tareas.procesar()
+        self.producto.refresh_from_db()
+        primera = self.producto.imagen.name
+
+        self.producto.imagen = imagen_de_prueba(300, 300, "otra.jpg")
+        self.producto.save()
+        tareas.procesar()
+        self.producto.refresh_from_db()
+        self.producto.imagen = imagen_de_prueba(1200, 600)
+        self.producto.save()
+        self.assertEqual(self.producto.imagen.name, primera)
+
+        self.assertEqual(tareas.procesar(), (1, 0))
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.variantes["origen"], primera)
+        self.assertEqual(sorted(k for k in self.producto.variantes if k != "origen"), ["200", "400", "800"])
+
+    def test_detalle_edicion_y_pedido_usan_las_variantes(self):
+        tareas.procesar()
+        self.producto.refresh_from_db()
+        webp = default_storage.url(self.producto.variantes["200"]["webp"])
+        cliente = crear_usuario("cliente@lazzo.cl")
+        pedido = crear_pedido(cliente, [(self.producto.idProducto, 1)])
+
+        def pagina(usuario, ruta):
+            sesion = self.client.session
+            sesion["usuario_id"] = usuario.idUsuario
+            sesion.save()
+            return self.client.get(ruta).content.decode()
+
+        for usuario, ruta in (
+            (cliente, f"/producto/{self.producto.idProducto}/"),
+            (self.vendedor, f"/producto/{self.producto.idProducto}/editar/"),
+            (cliente, f"/pedido/{pedido.idPedido}/"),
+        ):
+            with self.subTest(ruta=ruta):
+                html = pagina(usuario, ruta)
+                self.assertIn(webp, html)
+                self.assertIn('width="1200" height="600"', html)
+                self.assertNotIn(f'src="{self.producto.imagen.url}"', html)
+
+        self.assertIn('loading="lazy"', pagina(cliente, f"/pedido/{pedido.idPedido}/"))
+        self.assertIn('loading="eager"', pagina(cliente, f"/producto/{self.producto.idProducto}/"))
+
+    def test_sin_variantes_muestra_el_original(self):
+        html = Template(
+            "{% load imagenes %}{% imagen_responsive p.imagen p.variantes %}"
+        ).render(Context({"p": self.producto}))
+        self.assertIn(self.producto.imagen.url, html)
+        self.assertNotIn("srcset", html)
+
+    def test_medidas_y_previa_al_subir(self):
+        self.assertEqual((self.producto.imagen_ancho, self.producto.imagen_alto), (1200, 600))
+        self.assertTrue(self.producto.imagen_previa.startswith("data:image/webp;base64,"))
+        self.assertLess(len(self.producto.imagen_previa), 500)
+
+        html = Template("{% load imagenes %}{% imagen_producto p %}").render(Context({"p": self.producto}))
+        self.assertIn('width="1200" height="600"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn(self.producto.imagen_previa, html)
+
+        self.producto.imagen = None
+        self.producto.save()
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.imagen_ancho, self.producto.imagen_previa), (None, ""))
+
+    def test_generar_variantes_mide_los_productos_anteriores(self):
+        Producto.objects.filter(pk=self.producto.pk).update(
+            imagen_ancho=None, imagen_alto=None, imagen_previa=""
+        )
+        call_command("generar_variantes", stdout=io.StringIO())
+
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.imagen_ancho, self.producto.imagen_alto), (1200, 600))
+        self.assertTrue(self.producto.imagen_previa)
+
+
+class AlmacenamientoContenidoTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+
+    def test_la_misma_imagen_se_guarda_una_vez(self):
+        uno = crear_producto(self.vendedor, stock=1, nombre="Uno")
+        dos = crear_producto(self.vendedor, stock=1, nombre="Dos")
+        uno.imagen = imagen_de_prueba(50, 50, "a.JPG")
+        uno.save()
+        dos.imagen = imagen_de_prueba(50, 50, "b.jpg")
+        dos.save()
+
+        self.assertEqual(uno.imagen.name, dos.imagen.name)
+        self.assertTrue(almacenamiento.es_por_contenido(uno.imagen.name))
+        self.assertTrue(uno.imagen.name.startswith("products/") and uno.imagen.name.endswith(".jpg"))
+        self.assertEqual(ArchivoMedia.objects.get(nombre=uno.imagen.name).referencias, 2)
+
+        nombre = uno.imagen.name
+        default_storage.delete(nombre)
+        self.assertTrue(default_storage.exists(nombre))
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(nombre)
+            # Se borra del disco recién al confirmar
+            self.assertTrue(default_storage.exists(nombre))
+        self.assertFalse(default_storage.exists(nombre))
+        self.assertFalse(ArchivoMedia.objects.filter(nombre=nombre).exists())
+
+    def test_si_se_vuelve_a_subir_antes_de_confirmar_no_se_borra(self):
+        nombre = default_storage.save("products/a.jpg", imagen_de_prueba(50, 50))
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(nombre)
+            self.assertEqual(default_storage.save("products/b.jpg", imagen_de_prueba(50, 50)), nombre)
+
+        self.assertTrue(default_storage.exists(nombre))
+        self.assertEqual(ArchivoMedia.objects.get(nombre=nombre).referencias, 1)
+
+    def test_al_reemplazar_la_imagen_se_suelta_la_anterior(self):
+        uno = crear_producto(self.vendedor, stock=1, nombre="Uno")
+        dos = crear_producto(self.vendedor, stock=1, nombre="Dos")
+        uno.imagen = imagen_de_prueba(50, 50, "a.jpg")
+        uno.save()
+        dos.imagen = imagen_de_prueba(50, 50, "a.jpg")
+        dos.save()
+        anterior = uno.imagen.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            uno.imagen = imagen_de_prueba(60, 60, "b.jpg")
+            uno.save()
+        # Dos la sigue usando
+        self.assertEqual(ArchivoMedia.objects.get(nombre=anterior).referencias, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            # Cargado de la BD: el nombre anterior sale de post_init
+            dos = Producto.objects.get(pk=dos.pk)
+            dos.imagen = None
+            dos.save()
+        self.assertFalse(default_storage.exists(anterior))
+        self.assertFalse(ArchivoMedia.objects.filter(nombre=anterior).exists())
+
+    def test_la_imagen_que_muestra_un_pedido_no_se_suelta(self):
+        producto = crear_producto(self.vendedor, stock=1)
+        producto.imagen = imagen_de_prueba(50, 50, "a.jpg")
+        producto.save()
+        anterior = producto.imagen.name
+        Pedido.objects.create(
+            usuario=self.vendedor, estado="pendiente", total=1000, miniatura=producto.imagen.url,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.imagen = imagen_de_prueba(60, 60, "b.jpg")
+            producto.save()
+
+        self.assertTrue(default_storage.exists(anterior))
+        self.assertEqual(ArchivoMedia.objects.get(nombre=anterior).referencias, 1)
+
+    def test_quitar_la_foto_de_perfil_la_suelta_una_vez(self):
+        cliente = crear_usuario("cliente@lazzo.cl")
+        for usuario in (self.vendedor, cliente):
+            usuario.foto = imagen_de_prueba(50, 50, "foto.jpg")
+            usuario.save()
+        nombre = cliente.foto.name
+        sesion = self.client.session
+        sesion["usuario_id"] = cliente.idUsuario
+        sesion.save()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/account/", {"eliminar_foto": "1"})
+
+        cliente.refresh_from_db()
+        self.assertFalse(cliente.foto)
+        self.assertEqual(ArchivoMedia.objects.get(nombre=nombre).referencias, 1)
+        self.assertTrue(default_storage.exists(nombre))
+
+    def test_deduplicar_media_migra_los_archivos_anteriores(self):
+        contenido = imagen_de_prueba(50, 50).read()
+        os.makedirs(os.path.join(self.media, "products"))
+        for nombre in ("polera-1.jpeg", "polera-2.jpeg"):
+            with open(os.path.join(self.media, "products", nombre), "wb") as archivo:
+                archivo.write(contenido)
+        uno = crear_producto(self.vendedor, stock=1, nombre="Uno")
+        dos = crear_producto(self.vendedor, stock=1, nombre="Dos")
+        Producto.objects.filter(pk=uno.pk).update(imagen="products/polera-1.jpeg")
+        Producto.objects.filter(pk=dos.pk).update(imagen="products/polera-2.jpeg")
+        comprador = crear_usuario("comprador@lazzo.cl")
+        pedido = Pedido.objects.create(
+            usuario=comprador, estado="pendiente", total=1000,
+            miniatura=default_storage.url("products/polera-2.jpeg"),
+        )
+
+        call_command("deduplicar_media", stdout=io.StringIO())
+
+        uno.refresh_from_db()
+        dos.refresh_from_db()
+        self.assertEqual(uno.imagen.name, dos.imagen.name)
+        self.assertEqual(os.listdir(os.path.join(self.media, "products")), [uno.imagen.name.split("/")[1]])
+        self.assertEqual(ArchivoMedia.objects.get(nombre=uno.imagen.name).referencias, 2)
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.miniatura, uno.imagen.url)
+
+        # Volver a correrlo no cambia nada
+        salida = io.StringIO()
+        call_command("deduplicar_media", stdout=salida)
+        self.assertIn("0 archivos migrados", salida.getvalue())
+
+    def test_deduplicar_media_borra_los_archivos_que_nada_usa(self):
+        contenido = imagen_de_prueba(50, 50).read()
+        os.makedirs(os.path.join(self.media, "products"))
+        for nombre in ("huerfana.jpeg", "en-pedido.jpeg"):
+            with open(os.path.join(self.media, "products", nombre), "wb") as archivo:
+                archivo.write(contenido if nombre == "huerfana.jpeg" else contenido + b"\0")
+        comprador = crear_usuario("comprador@lazzo.cl")
+        pedido = Pedido.objects.create(
+            usuario=comprador, estado="pendiente", total=1000,
+            miniatura=default_storage.url("products/en-pedido.jpeg"),
+        )
+
+        salida = io.StringIO()
+        call_command("deduplicar_media", stdout=salida)
+
+        self.assertIn("1 sin uso borrados", salida.getvalue())
+        # Solo queda el que muestra el pedido
+        pedido.refresh_from_db()
+        restante = pedido.miniatura.removeprefix(default_storage.url(""))
+        archivos = [
+            os.path.relpath(os.path.join(carpeta, archivo), self.media).replace(os.sep, "/")
+            for carpeta, _, nombres in os.walk(self.media) for archivo in nombres
+        ]
+        self.assertEqual(archivos, [restante])
+        self.assertEqual(list(ArchivoMedia.objects.values_list("nombre", flat=True)), [restante])
+
+    def test_borrar_un_producto_o_usuario_suelta_su_imagen(self):
+        uno = crear_producto(self.vendedor, stock=1, nombre="Uno")
+        dos = crear_producto(self.vendedor, stock=1, nombre="Dos")
+        for producto in (uno, dos):
+            producto.imagen = imagen_de_prueba(50, 50, "a.jpg")
+            producto.save()
+        nombre = uno.imagen.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            uno.delete()
+        # Dos la sigue usando
+        self.assertEqual(ArchivoMedia.objects.get(nombre=nombre).referencias, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.filter(pk=dos.pk).delete()
+        self.assertFalse(default_storage.exists(nombre))
+        self.assertFalse(ArchivoMedia.objects.filter(nombre=nombre).exists())
+
+        cliente = crear_usuario("cliente@lazzo.cl")
+        cliente.foto = imagen_de_prueba(40, 40, "foto.jpg")
+        cliente.save()
+        foto = cliente.foto.name
+        with self.captureOnCommitCallbacks(execute=True):
+            cliente.delete()
+        self.assertFalse(default_storage.exists(foto))
+
+    def test_borrar_un_producto_no_suelta_la_imagen_de_un_pedido(self):
+        producto = crear_producto(self.vendedor, stock=1)
+        producto.imagen = imagen_de_prueba(50, 50, "a.jpg")
+        producto.save()
+        nombre = producto.imagen.name
+        Pedido.objects.create(
+            usuario=self.vendedor, estado="pendiente", total=1000, miniatura=producto.imagen.url,
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.delete()
+
+        self.assertTrue(default_storage.exists(nombre))
+        self.assertEqual(ArchivoMedia.objects.get(nombre=nombre).referencias, 1)
+
+
+def gif_animado(ancho, alto, cuadros=6):
+    imagenes_gif = [
+        Image.new("RGB", (ancho, alto), (40 * i % 256, 90, 200)) for i in range(cuadros)
+    ]
+    contenido = io.BytesIO()
+    imagenes_gif[0].save(
+        contenido, "GIF", save_all=True, append_images=imagenes_gif[1:], duration=80, loop=0,
+    )
+    return SimpleUploadedFile("avatar.gif", contenido.getvalue(), content_type="image/gif")
+
+
+@override_settings(IMAGENES_PROCESOS=0)
+class AvatarTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+        self.usuario = crear_usuario("cliente@lazzo.cl")
+        self.client = Client()
+        sesion = self.client.session
+        sesion["usuario_id"] = self.usuario.idUsuario
+        sesion.save()
+
+    def test_gif_animado_pasa_a_webp_animada_con_respaldo_estatico(self):
+        respuesta = self.client.post("/account/", {
+            "nombre_completo": "Cliente", "descripcion": "", "foto": gif_animado(300, 200),
+        })
+        self.assertEqual(respuesta.status_code, 302)
+        # Se procesa en el worker, no durante el request
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.variantes, {})
+        self.assertEqual(Tarea.objects.filter(nombre="imagenes.variantes").count(), 1)
+
+        self.assertEqual(tareas.procesar(), (1, 0))
+        self.usuario.refresh_from_db()
+        variantes = self.usuario.variantes
+        self.assertEqual(variantes["tipo"], "avatar")
+        self.assertEqual(sorted(k for k in variantes if k.isdigit()), ["192", "96"])
+        with default_storage.open(variantes["96"]["webp"]) as archivo, Image.open(archivo) as webp:
+            self.assertEqual((webp.format, webp.size, webp.n_frames), ("WEBP", (96, 96), 6))
+        with default_storage.open(variantes["192"]["jpeg"]) as archivo, Image.open(archivo) as jpeg:
+            self.assertEqual((jpeg.format, jpeg.size), ("JPEG", (192, 192)))
+
+        html = Template("{% load imagenes %}{% avatar u %}").render(Context({"u": self.usuario}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(" 2x", html)
+
+    def test_mi_cuenta_muestra_el_avatar_y_no_la_foto_original(self):
+        self.usuario.foto = imagen_de_prueba(400, 300)
+        self.usuario.save()
+        tareas.procesar()
+        self.usuario.refresh_from_db()
+
+        html = self.client.get("/account/").content.decode()
+
+        self.assertNotIn(self.usuario.foto.url, html)
+        self.assertEqual(html.count(default_storage.url(self.usuario.variantes["96"]["webp"])), 2)
+        self.assertIn('class="js-profile-preview-img"', html)
+
+    def test_variantes_anteriores_de_la_foto_se_rehacen_como_avatar(self):
+        self.usuario.foto = imagen_de_prueba(400, 300)
+        self.usuario.save()
+        tareas.procesar()
+        self.usuario.refresh_from_db()
+        Usuario.objects.filter(pk=self.usuario.pk).update(
+            variantes={"origen": self.usuario.foto.name, "200": self.usuario.variantes["96"]}
+        )
+        self.usuario.refresh_from_db()
+
+        html = Template("{% load imagenes %}{% avatar u %}").render(Context({"u": self.usuario}))
+        self.assertIn(self.usuario.foto.url, html)
+        self.assertTrue(imagenes.programar(self.usuario, "usuario"))
+
+
+class MediaTests(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+
+        self.contenido = imagen_de_prueba(80, 80).read()
+        self.nombre = default_storage.save("products/foto.jpg", SimpleUploadedFile("foto.jpg", self.contenido))
+        self.url = default_storage.url(self.nombre)
+
+    def test_entrega_con_etag_y_cache_inmutable(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(b"".join(respuesta.streaming_content), self.contenido)
+        self.assertEqual(respuesta["Content-Type"], "image/jpeg")
+        self.assertEqual(respuesta["Content-Length"], str(len(self.contenido)))
+        self.assertIn("immutable", respuesta["Cache-Control"])
+        self.assertIn(self.nombre.rsplit("/", 1)[1].split(".")[0], respuesta["ETag"])
+
+        no_modificado = self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta["ETag"])
+        self.assertEqual(no_modificado.status_code, 304)
+        self.assertEqual(no_modificado.content, b"")
+        self.assertEqual(no_modificado["ETag"], respuesta["ETag"])
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=respuesta["Last-Modified"]).status_code, 304
+        )
+
+    def test_nombres_anteriores_se_cachean_poco(self):
+        with open(os.path.join(self.media, "products", "vieja.jpg"), "wb") as archivo:
+            archivo.write(self.contenido)
+        respuesta = self.client.get("/media/products/vieja.jpg")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn("immutable", respuesta["Cache-Control"])
+
+    def test_range(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(b"".join(respuesta.streaming_content), self.contenido[10:20])
+        self.assertEqual(respuesta["Content-Range"], f"bytes 10-19/{len(self.contenido)}")
+
+        ultimos = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(ultimos.streaming_content), self.contenido[-5:])
+
+        fuera = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.contenido)}-")
+        self.assertEqual(fuera.status_code, 416)
+        self.assertEqual(fuera["Content-Range"], f"bytes */{len(self.contenido)}")
+
+        # If-Range de otra versión: el archivo entero
+        otra = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"otra"')
+        self.assertEqual(otra.status_code, 200)
+
+    def test_fuera_de_media_o_inexistente(self):
+        self.assertEqual(self.client.get("/media/%2Fetc%2Fpasswd").status_code, 404)
+        self.assertEqual(self.client.get("/media/..%2F..%2Fetc%2Fpasswd").status_code, 404)
+        self.assertEqual(self.client.get("/media/products/no-existe.jpg").status_code, 404)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    @override_settings(MEDIA_ENVIO="x-accel-redirect", MEDIA_ACCEL_PREFIJO="/interno/")
+    def test_x_accel_redirect(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta["X-Accel-Redirect"], "/interno/" + self.nombre)
+        self.assertEqual(respuesta.content, b"")
+        self.assertIn("immutable", respuesta["Cache-Control"])
+
+    @override_settings(MEDIA_ENVIO="x-sendfile")
+    def test_x_sendfile(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta["X-Sendfile"], os.path.join(self.media, self.nombre))
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class CrearPedidoConcurrenteTests(TransactionTestCase):
+    """Muchos compradores a la vez por pocas unidades: nunca se sobrevende."""
+
+    COMPRADORES = 20
+    STOCK = 7
+
+    def test_no_sobrevende(self):
+        vendedor = crear_usuario("vendedor@lazzo.cl", rol="vendedor")
+        escaso = crear_producto(vendedor, stock=self.STOCK, nombre="Escaso")
+        abundante = crear_producto(vendedor, stock=1000, nombre="Abundante")
+        clientes = [crear_usuario(f"cliente{i}@lazzo.cl") for i in range(self.COMPRADORES)]
+
+        barrera = threading.Barrier(self.COMPRADORES)
+        resultados = []
+
+        def comprar(cliente, invertir):
+            lineas = [(escaso.idProducto, 1), (abundante.idProducto, 1)]
+            if invertir:
+                # El orden de las líneas no debe provocar deadlocks
+                lineas.reverse()
+            try:
+                barrera.wait()
+                crear_pedido(cliente, lineas)
+                resultados.append("ok")
+            except StockInsuficiente:
+                resultados.append("sin_stock")
+            finally:
+                connection.close()
+
+        hilos = [
+            threading.Thread(target=comprar, args=(cliente, i % 2))
+            for i, cliente in enumerate(clientes)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        escaso.refresh_from_db()
+        abundante.refresh_from_db()
+        self.assertEqual(resultados.count("ok"), self.STOCK)
+        self.assertEqual(resultados.count("sin_stock"), self.COMPRADORES - self.STOCK)
+        self.assertEqual(escaso.stock, 0)
+        self.assertEqual(abundante.stock, 1000 - self.STOCK)
+        self.assertEqual(Pedido.objects.count(), self.STOCK)
+        self.assertEqual(
+            DetallePedido.objects.filter(producto=escaso).count(), self.STOCK
+        )
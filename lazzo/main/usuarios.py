@@ -0,0 +1,49 @@
+# main/usuarios.py
+"""
+Caché del ``Usuario`` logueado (lo usa ``middleware.UsuarioActualMiddleware``).
+
+La fila se guarda bajo una clave que incluye la versión del usuario; guardar
+o borrar el usuario sube la versión (ver signals.py), así que nunca se lee
+un perfil viejo aunque la copia anterior siga en la caché hasta vencer.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Usuario
+
+
+def _clave_version(usuario_id):
+    return f"usuario:version:{usuario_id}"
+
+
+def _version_inicial():
+    # Igual que en carrito.py: si la clave se desaloja no se vuelve a 1
+    return time.time_ns() // 1000
+
+
+def version(usuario_id):
+    return cache.get_or_set(_clave_version(usuario_id), _version_inicial, None)
+
+
+def invalidar(usuario_id):
+    """Descarta la copia en caché del usuario."""
+    try:
+        cache.incr(_clave_version(usuario_id))
+    except ValueError:
+        cache.set(_clave_version(usuario_id), _version_inicial(), None)
+
+
+def obtener(usuario_id):
+    """El ``Usuario`` con ese id (desde la caché si se puede), o ``None``."""
+    if not usuario_id:
+        return None
+    clave = f"usuario:{usuario_id}:{version(usuario_id)}"
+    usuario = cache.get(clave)
+    if usuario is None:
+        usuario = Usuario.objects.filter(idUsuario=usuario_id).first()
+        if usuario is None:
+            return None
+        cache.set(clave, usuario, getattr(settings, "USUARIO_CACHE_TIMEOUT", 60))
+    return usuario
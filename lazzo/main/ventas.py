@@ -0,0 +1,233 @@
+# main/ventas.py
+"""
+Ventas diarias por producto (``VentaDiaria``) para el panel del vendedor.
+
+Cada pedido confirmado encola ``acumular_pedido``, que suma sus líneas a la
+fila (producto, día) correspondiente. Así el panel solo lee unas pocas filas
+por día y producto, sin agregar ``DetallePedido`` en cada request.
+``reconstruir`` (comando ``reconstruir_ventas``) rehace las filas desde los
+pedidos, incluidos los archivados.
+
+Cada fila guarda el vendedor y el nombre del producto: si el producto se
+borra, la fila queda con ``producto`` en NULL y sigue contando en el panel.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import (
+    DetallePedido, DetallePedidoArchivado, Pedido, PedidoArchivado, Producto,
+    VentaDiaria,
+)
+from .tareas import tarea
+
+# Períodos del panel: (función que trunca el día, cantidad que se muestran)
+PERIODOS = {
+    "dia": (None, 30),
+    "semana": (TruncWeek, 12),
+    "mes": (TruncMonth, 12),
+}
+
+# Pedidos archivados que se leen por consulta al reconstruir
+TAMANO_BLOQUE = 2000
+
+
+def _sumar(dia, por_producto):
+    """
+    Suma a las filas de ``dia`` los totales de ``por_producto``
+    ({producto_id: [vendedor_id, nombre, unidades, ingresos, pedidos]}).
+    """
+    # Orden fijo para que dos pedidos simultáneos no se bloqueen entre sí
+    for producto_id in sorted(por_producto):
+        vendedor_id, nombre, unidades, ingresos, pedidos = por_producto[producto_id]
+        incremento = {
+            "nombre": nombre,
+            "unidades": F("unidades") + unidades,
+            "ingresos": F("ingresos") + ingresos,
+            "pedidos": F("pedidos") + pedidos,
+        }
+        if VentaDiaria.objects.filter(producto_id=producto_id, dia=dia).update(**incremento):
+            continue
+        try:
+            with transaction.atomic():
+                VentaDiaria.objects.create(
+                    vendedor_id=vendedor_id, producto_id=producto_id, nombre=nombre, dia=dia,
+                    unidades=unidades, ingresos=ingresos, pedidos=pedidos,
+                )
+        except IntegrityError:
+            # Otro pedido del mismo día la creó entremedio
+            VentaDiaria.objects.filter(producto_id=producto_id, dia=dia).update(**incremento)
+
+
+def _por_producto(lineas):
+    """``lineas``: (pedido_id, producto_id, vendedor_id, nombre, cantidad, subtotal)."""
+    totales = {}
+    pedidos = defaultdict(set)
+    for pedido_id, producto_id, vendedor_id, nombre, cantidad, subtotal in lineas:
+        fila = totales.setdefault(producto_id, [vendedor_id, nombre, 0, 0, 0])
+        fila[2] += cantidad
+        fila[3] += subtotal
+        pedidos[producto_id].add(pedido_id)
+    for producto_id, fila in totales.items():
+        fila[4] = len(pedidos[producto_id])
+    return totales
+
+
+@tarea("ventas.acumular")
+def acumular_pedido(pedido_id):
+    """Suma un pedido a ``VentaDiaria`` (corre dentro de la transacción de la tarea)."""
+    # Marca y suma en la misma transacción: si la tarea se repite, no suma dos veces
+    if not Pedido.objects.filter(idPedido=pedido_id, acumulado=False).update(acumulado=True):
+        return
+    fecha = Pedido.objects.values_list("fecha", flat=True).get(idPedido=pedido_id)
+    _sumar(
+        timezone.localdate(fecha),
+        _por_producto(
+            DetallePedido.objects
+            .filter(pedido_id=pedido_id)
+            .values_list(
+                "pedido_id", "producto_id", "producto__vendedor_id", "producto__nombre",
+                "cantidad", "subtotal",
+            )
+        ),
+    )
+
+
+def _inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def _lineas_archivadas(inicio, fin):
+    """Líneas archivadas de pedidos con ``inicio <= fecha < fin``, como ``_por_producto``."""
+    vendedores = {}
+    ultimo = None
+    while True:
+        # El archivo no tiene claves foráneas (puede estar en otra base)
+        pedidos = PedidoArchivado.objects.filter(fecha__gte=inicio, fecha__lt=fin).order_by("idPedido")
+        if ultimo is not None:
+            pedidos = pedidos.filter(idPedido__gt=ultimo)
+        fechas = dict(pedidos.values_list("idPedido", "fecha")[:TAMANO_BLOQUE])
+        if not fechas:
+            return
+        ultimo = max(fechas)
+
+        lineas = list(
+            DetallePedidoArchivado.objects
+            .filter(pedido_id__in=list(fechas))
+            .values_list("pedido_id", "producto_id", "nombre_producto", "cantidad", "subtotal")
+        )
+        faltan = {producto_id for _, producto_id, _, _, _ in lineas} - set(vendedores)
+        vendedores.update(
+            Producto.objects.filter(idProducto__in=faltan).values_list("idProducto", "vendedor_id")
+        )
+        for pedido_id, producto_id, nombre, cantidad, subtotal in lineas:
+            # Las ventas de productos ya borrados no tienen a quién atribuirse
+            # (sus filas se conservan, ver reconstruir)
+            if producto_id in vendedores:
+                yield (
+                    timezone.localdate(fechas[pedido_id]),
+                    (pedido_id, producto_id, vendedores[producto_id], nombre, cantidad, subtotal),
+                )
+        if len(fechas) < TAMANO_BLOQUE:
+            return
+
+
+@transaction.atomic
+def reconstruir(desde, hasta):
+    """
+    Rehace las filas de los días ``desde``..``hasta`` (inclusive) a partir de
+    los pedidos. Las de productos ya borrados no se pueden rehacer (el
+    archivo no sabe de qué vendedor eran) y se dejan como están. Devuelve
+    cuántas filas se rehicieron.
+    """
+    inicio, fin = _inicio_del_dia(desde), _inicio_del_dia(hasta + timedelta(days=1))
+
+    # Marcar primero bloquea los pedidos del rango: una tarea que corra en
+    # paralelo espera y después ve que ya están sumados
+    Pedido.objects.filter(fecha__gte=inicio, fecha__lt=fin).update(acumulado=True)
+    VentaDiaria.objects.filter(dia__gte=desde, dia__lte=hasta, producto__isnull=False).delete()
+
+    por_dia = defaultdict(list)
+    for dia, linea in _lineas_archivadas(inicio, fin):
+        por_dia[dia].append(linea)
+    lineas = (
+        DetallePedido.objects
+        .filter(pedido__fecha__gte=inicio, pedido__fecha__lt=fin)
+        .values_list(
+            "pedido__fecha", "pedido_id", "producto_id", "producto__vendedor_id",
+            "producto__nombre", "cantidad", "subtotal",
+        )
+    )
+    for fecha, *linea in lineas.iterator(chunk_size=TAMANO_BLOQUE):
+        por_dia[timezone.localdate(fecha)].append(linea)
+
+    filas = [
+        VentaDiaria(
+            vendedor_id=vendedor_id, producto_id=producto_id, nombre=nombre, dia=dia,
+            unidades=unidades, ingresos=ingresos, pedidos=pedidos,
+        )
+        for dia, lineas_dia in por_dia.items()
+        for producto_id, (vendedor_id, nombre, unidades, ingresos, pedidos)
+        in _por_producto(lineas_dia).items()
+    ]
+    VentaDiaria.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
+
+
+def primer_dia():
+    """Día del pedido más antiguo (caliente o archivado), o ``None``."""
+    fechas = [
+        Pedido.objects.order_by("fecha").values_list("fecha", flat=True).first(),
+        PedidoArchivado.objects.order_by("fecha").values_list("fecha", flat=True).first(),
+    ]
+    fechas = [fecha for fecha in fechas if fecha is not None]
+    return timezone.localdate(min(fechas)) if fechas else None
+
+
+def _primer_dia(periodo, cantidad, hoy):
+    if periodo == "semana":
+        return hoy - timedelta(days=hoy.weekday() + 7 * (cantidad - 1))
+    if periodo == "mes":
+        meses = hoy.year * 12 + hoy.month - 1 - (cantidad - 1)
+        return date(meses // 12, meses % 12 + 1, 1)
+    return hoy - timedelta(days=cantidad - 1)
+
+
+def resumen(vendedor_id, periodo="dia", hoy=None):
+    """
+    Datos del panel: serie de ``periodo`` ("dia", "semana" o "mes"),
+    totales y productos más vendidos del rango que muestra el panel. Lee
+    solo ``VentaDiaria``.
+    """
+    truncar, cantidad = PERIODOS[periodo]
+    hoy = hoy or timezone.localdate()
+    desde = _primer_dia(periodo, cantidad, hoy)
+
+    filas = VentaDiaria.objects.filter(vendedor_id=vendedor_id, dia__gte=desde, dia__lte=hoy)
+    sumas = {"unidades": Sum("unidades"), "ingresos": Sum("ingresos")}
+
+    serie = list(
+        filas.annotate(periodo=F("dia") if truncar is None else truncar("dia"))
+        .values("periodo")
+        .annotate(**sumas)
+        .order_by("-periodo")
+    )
+    # "pedidos" se suma solo por producto: un pedido con dos productos del
+    # vendedor cuenta en ambos
+    top = list(
+        filas.values("producto_id", "nombre")
+        .annotate(pedidos=Sum("pedidos"), **sumas)
+        .order_by("-ingresos", "producto_id")[:10]
+    )
+    totales = filas.aggregate(**sumas)
+    return {
+        "desde": desde,
+        "hasta": hoy,
+        "serie": serie,
+        "top": top,
+        "totales": {clave: valor or 0 for clave, valor in totales.items()},
+    }
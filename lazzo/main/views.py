@@ -1,15 +1,34 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse
-from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_sequence
+from django.views.decorators.http import require_safe
 from django.contrib.auth import logout as django_logout
 from .models import (
-    Usuario, Producto, ObjetoCarrito, Carrito, Pedido, 
-    Pago, Mensaje, Notificacion, Direccion, DetallePedido, 
-    Servicio, Favorito, TIPOS_PRODUCTO, CATEGORIAS_PRODUCTO, CATEGORIAS_SERVICIO)
+    Usuario, Producto, Pedido,
+    Pago, Mensaje, Notificacion, Direccion,
+    Servicio, Favorito, PedidoArchivado, TIPOS_PRODUCTO, CATEGORIAS_PRODUCTO,
+    CATEGORIAS_SERVICIO)
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import F
+import json
 import random
 from .forms import RegistroForm, LoginForm, ProductoForm, MensajeForm, PerfilForm, ServicioForm
+from .autocompletar import indice as indice_autocompletar
+from .busqueda import indice as indice_busqueda
+from .facetas import indice as indice_facetas
+from .idempotencia import idempotente, nueva_clave as nueva_clave_idempotencia
+from .paginacion import ORDEN_PEDIDOS, ORDENES_CATALOGO, paginar, paginar_lista
+from .pedidos import StockInsuficiente, crear_pedido as crear_pedido_desde_lineas
+from . import archivo as motor_archivo
+from . import exportacion, media, usuarios, ventas
+from . import carrito as motor_carrito
+
+# Operaciones por request en la API JSON del carrito
+MAX_OPERACIONES_CARRITO = 50
+
+CARRITO_OCUPADO = "Tu carrito se está actualizando en otra pestaña, inténtalo de nuevo."
 
 # Create your views here.
  
@@ -116,17 +135,16 @@ def logout(request):
 
 
 def mi_cuenta(request):
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect("login")
 
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
     pedidos_recientes = Pedido.objects.filter(usuario=usuario).order_by("-fecha")[:5]
 
     if request.method == "POST":
         if "eliminar_foto" in request.POST:
             if usuario.foto:
-                usuario.foto.delete(save=False)
+                # Al guardar se suelta el archivo (signals.archivo_reemplazado)
                 usuario.foto = None
                 usuario.save()
                 messages.success(request, "Tu foto de perfil se eliminó correctamente.")
@@ -156,17 +174,21 @@ def mi_cuenta(request):
     )
 
 def mi_perfil(request):
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect("login")
 
-    usuario = get_object_or_404(Usuario, idUsuario=usuario_id)
-
     if usuario.rol == "vendedor":
-        productos = Producto.objects.filter(vendedor=usuario).order_by("-idProducto")
+        productos = paginar(
+            request,
+            Producto.objects.filter(vendedor=usuario),
+            ORDENES_CATALOGO["recientes"],
+            contar=True,
+        )
         return render(request, "vendedor_perfil.html", {
             "vendedor": usuario,
             "productos": productos,
+            "page_obj": productos,
         })
 
     return render(request, "cliente_perfil.html", {
@@ -174,8 +196,15 @@ def mi_perfil(request):
     })
     
 def vendedor_perfil(request, vendedor_id):
-    vendedor = get_object_or_404(Usuario, idUsuario=vendedor_id)
-    productos = Producto.objects.filter(vendedor=vendedor).order_by("-idProducto")
+    vendedor = usuarios.obtener(vendedor_id)
+    if vendedor is None:
+        raise Http404("Vendedor no encontrado")
+    productos = paginar(
+        request,
+        Producto.objects.filter(vendedor=vendedor),
+        ORDENES_CATALOGO["recientes"],
+        contar=True,
+    )
 
     es_propietario = request.session.get("usuario_id") == vendedor_id
 
@@ -185,17 +214,16 @@ def vendedor_perfil(request, vendedor_id):
         {
             "vendedor": vendedor,
             "productos": productos,
+            "page_obj": productos,
             "es_propietario": es_propietario,
         },
     )
 
 
 def editar_perfil(request):
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect("login")
-    
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
 
     if request.method == "POST":
         form = PerfilForm(request.POST, request.FILES, instance=usuario)
@@ -215,12 +243,20 @@ def editar_perfil(request):
 
 
 def vendedor_perfil(request, vendedor_id):
-    vendedor = Usuario.objects.get(idUsuario=vendedor_id)
-    productos = Producto.objects.filter(vendedor=vendedor).order_by('-idProducto')
+    vendedor = usuarios.obtener(vendedor_id)
+    if vendedor is None:
+        raise Http404("Vendedor no encontrado")
+    productos = paginar(
+        request,
+        Producto.objects.filter(vendedor=vendedor),
+        ORDENES_CATALOGO["recientes"],
+        contar=True,
+    )
 
     return render(request, "vendedor_perfil.html", {
         "vendedor": vendedor,
         "productos": productos,
+        "page_obj": productos,
     })
 
 
@@ -228,12 +264,11 @@ def favorito_toggle(request, producto_id):
     """
     Añade o quita un producto de los favoritos del usuario logueado.
     """
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         messages.error(request, "Debes iniciar sesión para usar favoritos.")
         return redirect("login")
 
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
     producto = get_object_or_404(Producto, idProducto=producto_id)
 
     favorito, creado = Favorito.objects.get_or_create(
@@ -254,16 +289,16 @@ def favoritos(request):
     """
     Lista de productos favoritos del usuario logueado.
     """
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect("login")
 
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
     favoritos_qs = Favorito.objects.filter(usuario=usuario).select_related("producto")
 
-    productos = [f.producto for f in favoritos_qs]
+    page_obj = paginar(request, favoritos_qs, ("-idFavorito",))
+    productos = [f.producto for f in page_obj]
 
-    return render(request, "favoritos.html", {"productos": productos})
+    return render(request, "favoritos.html", {"productos": productos, "page_obj": page_obj})
 
 
 #-----------CATEGORIAS----------------
@@ -280,7 +315,11 @@ def categoria_filtrar(request, categoria):
     )
 
 def categoria_listado(request, tipo, categoria_slug):
-    productos = Producto.objects.filter(tipo=tipo, categoria=categoria_slug)
+    productos = paginar(
+        request,
+        Producto.objects.filter(tipo=tipo, categoria=categoria_slug),
+        ORDENES_CATALOGO["recientes"],
+    )
 
     # diccionario {value: label} para mostrar nombre bonito
     mapa_categorias = dict(CATEGORIAS_PRODUCTO + CATEGORIAS_SERVICIO)
@@ -288,6 +327,7 @@ def categoria_listado(request, tipo, categoria_slug):
 
     context = {
         "productos": productos,
+        "page_obj": productos,
         "tipo": tipo,
         "categoria_slug": categoria_slug,
         "categoria_nombre": categoria_nombre,
@@ -300,31 +340,57 @@ def catalogo(request):
     min_precio = request.GET.get("min_precio", "").strip()
     max_precio = request.GET.get("max_precio", "").strip()
     orden = request.GET.get("orden", "relevancia")  # relevancia / precio_asc / precio_desc / recientes
+    categoria = request.GET.get("categoria", "").strip()  # "tipo:slug", p. ej. "producto:ropa"
+    en_stock = request.GET.get("en_stock") == "1"
 
     # Base: todos los productos
     productos = Producto.objects.all()
 
     # Filtro por rango de precios
-    if min_precio.isdigit():
-        productos = productos.filter(precio__gte=int(min_precio))
-    if max_precio.isdigit():
-        productos = productos.filter(precio__lte=int(max_precio))
-
-    # Ordenamiento
-    if orden == "precio_asc":
-        productos = productos.order_by("precio")
-    elif orden == "precio_desc":
-        productos = productos.order_by("-precio")
-    elif orden == "recientes":
-        productos = productos.order_by("-idProducto")
+    precio_desde = int(min_precio) if min_precio.isdigit() else None
+    precio_hasta = int(max_precio) if max_precio.isdigit() else None
+    if precio_desde is not None:
+        productos = productos.filter(precio__gte=precio_desde)
+    if precio_hasta is not None:
+        productos = productos.filter(precio__lte=precio_hasta)
+
+    # Filtro por categoría
+    tipo_filtro, _, categoria_filtro = categoria.partition(":")
+    if tipo_filtro not in ("producto", "servicio") or not categoria_filtro:
+        tipo_filtro, categoria_filtro, categoria = None, None, ""
     else:
-        # "relevancia": por ahora usamos también más recientes
-        productos = productos.order_by("-idProducto")
+        productos = productos.filter(tipo=tipo_filtro, categoria=categoria_filtro)
+
+    # Solo con stock
+    if en_stock:
+        productos = productos.filter(stock__gt=F("reservado"))
+
+    # Ordenamiento (ver ORDENES_CATALOGO)
+    if orden not in ORDENES_CATALOGO:
+        orden = "relevancia"
+
+    # ---------- FACETAS (precalculadas, sin GROUP BY) ----------
+    total_filtrado = indice_facetas.contar(
+        tipo=tipo_filtro,
+        categoria=categoria_filtro,
+        min_precio=precio_desde,
+        max_precio=precio_hasta,
+        solo_stock=en_stock,
+    )
+    facetas_categorias = [
+        c for c in indice_facetas.conteos_por_categoria(
+            min_precio=precio_desde, max_precio=precio_hasta, solo_stock=en_stock,
+        )
+        if c["cantidad"]
+    ]
+    histograma_precios = indice_facetas.histograma(
+        tipo=tipo_filtro, categoria=categoria_filtro, solo_stock=en_stock,
+    )
 
-    # ---------- PAGINACIÓN ----------
-    paginator = Paginator(productos, 12)  # 12 productos por página
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # ---------- PAGINACIÓN (por cursor) ----------
+    page_obj = paginar(
+        request, productos, ORDENES_CATALOGO[orden], por_pagina=12, total=total_filtrado
+    )
 
     # ---------- AGRUPAR POR CATEGORÍA (solo los de la página actual) ----------
     mapa_categorias = dict(CATEGORIAS_PRODUCTO + CATEGORIAS_SERVICIO)
@@ -349,6 +415,10 @@ def catalogo(request):
         "min_precio": min_precio,
         "max_precio": max_precio,
         "orden": orden,
+        "categoria": categoria,
+        "en_stock": en_stock,
+        "facetas_categorias": facetas_categorias,
+        "histograma_precios": histograma_precios,
     }
     return render(request, "catalogo.html", context)
 
@@ -361,12 +431,10 @@ def servicio_detalle(request, id):
 
 def servicio_crear(request):
     # solo usuarios logueados pueden crear servicios
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    vendedor = request.usuario
+    if not vendedor:
         return redirect("login")
 
-    vendedor = Usuario.objects.get(idUsuario=usuario_id)
-
     if request.method == "POST":
         form = ServicioForm(request.POST, request.FILES)
         if form.is_valid():
@@ -385,17 +453,62 @@ def servicio_crear(request):
 def buscar(request):
     query = request.GET.get("q", "").strip()
     resultados = []
+    page_obj = None
+    aproximados = False
 
     if query:
-        resultados = Producto.objects.filter(
-            Q(nombre__icontains=query) |
-            Q(descripcion__icontains=query) |
-            Q(categoria__icontains=query)
-        ).order_by("-idProducto")
+        # Ranking desde el índice en memoria; a la BD solo vamos por PK
+        # y solo por los productos de la página actual
+        encontrados = indice_busqueda.buscar(query)
+        if not encontrados:
+            # Sin coincidencias exactas: probamos tolerando errores de tipeo
+            encontrados = indice_busqueda.buscar_difuso(query)
+            aproximados = bool(encontrados)
+
+        page_obj = paginar_lista(request, encontrados, por_pagina=12)
+        ids = [producto_id for producto_id, _ in page_obj]
+        productos = Producto.objects.in_bulk(ids)
+        resultados = [productos[i] for i in ids if i in productos]
 
     return render(request, "busqueda.html", {
         "query": query,
         "resultados": resultados,
+        "page_obj": page_obj,
+        "aproximados": aproximados,
+    })
+
+def buscar_sugerencias(request):
+    """
+    Sugerencias para el buscador (JSON). Se responde desde el índice en
+    memoria, sin consultar la base de datos.
+    """
+    query = request.GET.get("q", "").strip()
+    try:
+        k = min(max(int(request.GET.get("k", 8)), 1), 20)
+    except ValueError:
+        k = 8
+
+    productos, categorias = indice_autocompletar.sugerir(query, k=k)
+
+    return JsonResponse({
+        "query": query,
+        "productos": [
+            {
+                "id": producto_id,
+                "nombre": nombre,
+                "url": reverse("producto_detalle", args=[producto_id]),
+            }
+            for producto_id, nombre in productos
+        ],
+        "categorias": [
+            {
+                "tipo": tipo,
+                "slug": slug,
+                "nombre": label,
+                "url": reverse("categoria_list", args=[tipo, slug]),
+            }
+            for tipo, slug, label in categorias
+        ],
     })
 
 def producto_detalle(request, id):
@@ -404,12 +517,10 @@ def producto_detalle(request, id):
 
 def producto_crear(request):
     # solo usuarios logueados pueden crear productos
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    vendedor = request.usuario
+    if not vendedor:
         return redirect("login")
 
-    vendedor = Usuario.objects.get(idUsuario=usuario_id)
-
     if request.method == "POST":
         form = ProductoForm(request.POST, request.FILES)
         if form.is_valid():
@@ -451,16 +562,18 @@ def productos_por_categoria(request, tipo, categoria_slug):
     categorias_map = dict(CATEGORIAS_PRODUCTO + CATEGORIAS_SERVICIO)
     categoria_nombre = categorias_map.get(categoria_slug, categoria_slug)
 
-    productos = Producto.objects.filter(
-        tipo=tipo,
-        categoria=categoria_slug
-    ).order_by('-idProducto')
+    productos = paginar(
+        request,
+        Producto.objects.filter(tipo=tipo, categoria=categoria_slug),
+        ORDENES_CATALOGO["recientes"],
+    )
 
     contexto = {
         "tipo": tipo,
         "categoria_slug": categoria_slug,
         "categoria_nombre": categoria_nombre,
         "productos": productos,
+        "page_obj": productos,
     }
     return render(request, "categoria_list.html", contexto)
 
@@ -520,29 +633,19 @@ def carrito_ver(request):
     usuario_id = request.session.get("usuario_id")
     if not usuario_id:
         return redirect("login")
-    
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
-    carrito, creado = Carrito.objects.get_or_create(usuario=usuario)
 
     # subtotales y total actualizado
-    for obj in carrito.objetos.all():
-        obj.calcular_subtotal()
-    carrito.calcular_total()
-
-    objetos = carrito.objetos.select_related("producto")
-
-    # costo de envío
-    shipping_cost = 2990 if carrito.total > 0 else 0
-    total_con_envio = carrito.total + shipping_cost
+    resumen = motor_carrito.almacen().resumen(usuario_id)
 
     return render(
         request,
         "carrito.html",
         {
-            "carrito": carrito,
-            "objetos": objetos,
-            "shipping_cost": shipping_cost,
-            "total_con_envio": total_con_envio,
+            "carrito": resumen,
+            "carrito_version": motor_carrito.version(usuario_id),
+            "objetos": resumen.objetos,
+            "shipping_cost": resumen.envio,
+            "total_con_envio": resumen.total_con_envio,
         },
     )
 
@@ -550,9 +653,6 @@ def carrito_agregar(request, producto_id):
     usuario_id = request.session.get("usuario_id")
     if not usuario_id:
         return redirect("login")
-    
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
-    carrito, creado = Carrito.objects.get_or_create(usuario=usuario)
 
     producto = Producto.objects.get(idProducto=producto_id)
 
@@ -561,24 +661,12 @@ def carrito_agregar(request, producto_id):
         messages.error(request, "Este producto no tiene stock disponible.")
         return redirect("producto_detalle", id=producto_id)
 
-    objeto = carrito.objetos.filter(producto=producto).first()
-
-    if objeto:
-        # No dejar que la cantidad supere el stock
-        if objeto.cantidad >= producto.stock:
+    # No dejar que la cantidad supere el stock
+    try:
+        if motor_carrito.almacen().agregar(usuario_id, producto) is None:
             messages.warning(request, "Has alcanzado el máximo disponible de este producto.")
-        else:
-            objeto.cantidad += 1
-            objeto.calcular_subtotal()
-    else:
-        nuevo = ObjetoCarrito.objects.create(
-            producto=producto,
-            cantidad=1
-        )
-        nuevo.calcular_subtotal()
-        carrito.objetos.add(nuevo)
-    
-    carrito.calcular_total()
+    except motor_carrito.CarritoOcupado:
+        messages.error(request, CARRITO_OCUPADO)
 
     return redirect("cart")
 
@@ -587,20 +675,17 @@ def carrito_eliminar(request, objeto_id):
     usuario_id = request.session.get("usuario_id")
     if not usuario_id:
         return redirect("login")
-    
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
-    carrito = Carrito.objects.filter(usuario=usuario).first()
-    if not carrito:
-        return redirect("cart")
 
-    objeto = carrito.objetos.get(idObjeto=objeto_id)
+    almacen = motor_carrito.almacen()
+    objeto = almacen.obtener_linea(usuario_id, objeto_id)
+    if not objeto:
+        return redirect("cart")
 
-    # lo quita del carrito
-    carrito.objetos.remove(objeto)  
-    # y lo elimina
-    objeto.delete()                 
-    # actualiza total
-    carrito.calcular_total()        
+    # lo quita del carrito y actualiza el total
+    try:
+        almacen.quitar(usuario_id, objeto)
+    except motor_carrito.CarritoOcupado:
+        messages.error(request, CARRITO_OCUPADO)
 
     return redirect("cart")
 
@@ -618,47 +703,214 @@ def carrito_actualizar(request, objeto_id):
         if cantidad < 1:
             cantidad = 1
 
-        usuario = Usuario.objects.get(idUsuario=usuario_id)
-        carrito = Carrito.objects.get(usuario=usuario)
-
-        objeto = carrito.objetos.get(idObjeto=objeto_id)
+        almacen = motor_carrito.almacen()
+        objeto = almacen.obtener_linea(usuario_id, objeto_id)
+        if not objeto:
+            return redirect("cart")
         producto = objeto.producto
 
-        # Límite superior = stock disponible
-        if producto.stock <= 0:
-            # si ya no hay stock, eliminamos el ítem del carrito
-            carrito.objetos.remove(objeto)
-            objeto.delete()
-            carrito.calcular_total()
-            messages.error(request, f"El producto '{producto.nombre}' ya no tiene stock disponible.")
+        # Límite superior = lo que se pudo reservar
+        try:
+            objeto = almacen.cambiar_cantidad(usuario_id, objeto, cantidad)
+        except motor_carrito.CarritoOcupado:
+            messages.error(request, CARRITO_OCUPADO)
             return redirect("cart")
-
-        if cantidad > producto.stock:
-            cantidad = producto.stock
+        if objeto is None:
+            # si ya no hay stock, el ítem se quitó del carrito
+            messages.error(request, f"El producto '{producto.nombre}' ya no tiene stock disponible.")
+        elif objeto.cantidad < cantidad:
             messages.warning(
                 request,
-                f"La cantidad se ajustó al stock disponible ({producto.stock}) para '{producto.nombre}'."
+                f"La cantidad se ajustó al stock disponible ({objeto.cantidad}) para '{producto.nombre}'."
             )
 
-        objeto.cantidad = cantidad
-        objeto.calcular_subtotal()
+    return redirect("cart")
 
-        carrito.calcular_total()
 
-    return redirect("cart")
 
+def _linea_carrito_json(obj):
+    return {
+        "objeto": obj.idObjeto,
+        "producto": obj.producto_id,
+        "nombre": obj.producto.nombre,
+        "precio": obj.producto.precio,
+        "cantidad": obj.cantidad,
+        "subtotal": obj.subtotal,
+    }
 
 
-def checkout(request):
+def _totales_carrito_json(resumen):
+    return {
+        "cantidad": resumen.cantidad,
+        "subtotal": resumen.total,
+        "envio": resumen.envio,
+        "total": resumen.total_con_envio,
+    }
+
+
+def _leer_operaciones_carrito(cuerpo):
+    """
+    Valida las operaciones del cuerpo antes de aplicar ninguna. Devuelve
+    (operaciones, error).
+    """
+    operaciones = cuerpo.get("operaciones")
+    if operaciones is None:
+        operaciones = [cuerpo]
+    if not isinstance(operaciones, list) or not operaciones:
+        return None, "Debes enviar al menos una operación."
+    if len(operaciones) > MAX_OPERACIONES_CARRITO:
+        return None, f"Máximo {MAX_OPERACIONES_CARRITO} operaciones por request."
+
+    validas = []
+    for op in operaciones:
+        if not isinstance(op, dict):
+            return None, "Operación inválida."
+        accion = op.get("accion")
+        clave = "producto" if accion == "agregar" else "objeto"
+        if accion not in ("agregar", "actualizar", "eliminar"):
+            return None, f"Acción desconocida: {accion!r}."
+        try:
+            identificador = int(op.get(clave))
+            cantidad = int(op.get("cantidad", 1))
+        except (TypeError, ValueError):
+            return None, f"'{clave}' y 'cantidad' deben ser números."
+        validas.append((accion, identificador, max(cantidad, 1)))
+
+    return validas, None
+
+
+def carrito_api(request):
+    """
+    Carrito en JSON para actualizar la página sin recargarla.
+
+    GET devuelve todas las líneas. POST recibe una operación o varias:
+
+        {"version": 17, "operaciones": [
+            {"accion": "agregar", "producto": 5, "cantidad": 1},
+            {"accion": "actualizar", "objeto": 8, "cantidad": 3},
+            {"accion": "eliminar", "objeto": 9}
+        ]}
+
+    y responde solo con las líneas que cambiaron, los ids de las que ya no
+    están, los totales y la nueva versión. Si ``version`` no es la actual
+    (el carrito cambió en otra pestaña) responde 409 sin aplicar nada.
+    """
     usuario_id = request.session.get("usuario_id")
     if not usuario_id:
+        return JsonResponse({"error": "Debes iniciar sesión."}, status=401)
+
+    almacen = motor_carrito.almacen()
+
+    if request.method == "GET":
+        resumen = almacen.resumen(usuario_id)
+        return JsonResponse({
+            "version": motor_carrito.version(usuario_id),
+            "lineas": [_linea_carrito_json(obj) for obj in resumen.objetos],
+            "eliminadas": [],
+            "totales": _totales_carrito_json(resumen),
+            "mensajes": [],
+        })
+
+    if request.method != "POST":
+        return JsonResponse({"error": "Método no permitido."}, status=405)
+
+    try:
+        cuerpo = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "JSON inválido."}, status=400)
+    if not isinstance(cuerpo, dict):
+        return JsonResponse({"error": "JSON inválido."}, status=400)
+
+    operaciones, error = _leer_operaciones_carrito(cuerpo)
+    if error:
+        return JsonResponse({"error": error}, status=400)
+
+    productos = Producto.objects.in_bulk(
+        [ident for accion, ident, _ in operaciones if accion == "agregar"]
+    )
+
+    with motor_carrito.bloqueo(usuario_id) as obtenido:
+        version_actual = motor_carrito.version(usuario_id)
+        esperada = cuerpo.get("version")
+        if not obtenido or (esperada is not None and esperada != version_actual):
+            return JsonResponse(
+                {"error": "El carrito cambió, vuelve a cargarlo.", "version": version_actual},
+                status=409,
+            )
+
+        tocadas = []
+        mensajes = []
+        try:
+            for accion, ident, cantidad in operaciones:
+                if accion == "agregar":
+                    producto = productos.get(ident)
+                    if producto is None or producto.stock <= 0:
+                        mensajes.append({"nivel": "error", "texto": "Este producto no tiene stock disponible."})
+                        continue
+                    objeto = almacen.agregar(usuario_id, producto, cantidad)
+                    if objeto is None:
+                        mensajes.append({
+                            "nivel": "warning",
+                            "texto": "Has alcanzado el máximo disponible de este producto.",
+                        })
+                        continue
+                    tocadas.append(objeto.idObjeto)
+                    continue
+
+                tocadas.append(ident)
+                objeto = almacen.obtener_linea(usuario_id, ident)
+                if not objeto:
+                    continue
+                producto = objeto.producto
+
+                if accion == "eliminar":
+                    almacen.quitar(usuario_id, objeto)
+                    continue
+
+                objeto = almacen.cambiar_cantidad(usuario_id, objeto, cantidad)
+                if objeto is None:
+                    mensajes.append({
+                        "nivel": "error",
+                        "texto": f"El producto '{producto.nombre}' ya no tiene stock disponible.",
+                    })
+                elif objeto.cantidad < cantidad:
+                    mensajes.append({
+                        "nivel": "warning",
+                        "texto": f"La cantidad se ajustó al stock disponible ({objeto.cantidad}) para '{producto.nombre}'.",
+                    })
+        except motor_carrito.CarritoOcupado:
+            # Una vista HTML del mismo usuario tiene las líneas tomadas
+            return JsonResponse(
+                {"error": CARRITO_OCUPADO, "version": motor_carrito.version(usuario_id)},
+                status=409,
+            )
+
+        resumen = almacen.resumen(usuario_id)
+        version_nueva = motor_carrito.version(usuario_id)
+
+    lineas = {obj.idObjeto: obj for obj in resumen.objetos}
+    tocadas = list(dict.fromkeys(tocadas))
+    return JsonResponse({
+        "version": version_nueva,
+        "lineas": [_linea_carrito_json(lineas[i]) for i in tocadas if i in lineas],
+        "eliminadas": [i for i in tocadas if i not in lineas],
+        "totales": _totales_carrito_json(resumen),
+        "mensajes": mensajes,
+    })
+
+
+@idempotente
+def checkout(request):
+    usuario = request.usuario
+    if not usuario:
         return redirect("login")
+    usuario_id = usuario.idUsuario
 
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
-    carrito, _ = Carrito.objects.get_or_create(usuario=usuario)
+    almacen = motor_carrito.almacen()
+    resumen = almacen.resumen(usuario_id)
 
     # Carrito vacío no se puede continuar
-    if carrito.total == 0 or carrito.objetos.count() == 0:
+    if resumen.total == 0 or not resumen:
         messages.error(request, "Tu carrito está vacío.")
         return redirect("cart")
 
@@ -690,17 +942,16 @@ def checkout(request):
                     request,
                     "Debes ingresar una nueva dirección para continuar."
                 )
-                shipping_cost = 2990 if carrito.total > 0 else 0
-                total_con_envio = carrito.total + shipping_cost
                 return render(
                     request,
                     "checkout.html",
                     {
-                        "carrito": carrito,
-                        "objetos": carrito.objetos.select_related("producto"),
-                        "shipping_cost": shipping_cost,
-                        "total_con_envio": total_con_envio,
+                        "carrito": resumen,
+                        "objetos": resumen.objetos,
+                        "shipping_cost": resumen.envio,
+                        "total_con_envio": resumen.total_con_envio,
                         "direcciones": direcciones,
+                        "clave_idempotencia": nueva_clave_idempotencia(),
                     },
                 )
 
@@ -717,74 +968,35 @@ def checkout(request):
                 request,
                 "Debes seleccionar una dirección guardada o agregar una nueva."
             )
-            shipping_cost = 2990 if carrito.total > 0 else 0
-            total_con_envio = carrito.total + shipping_cost
             return render(
                 request,
                 "checkout.html",
                 {
-                    "carrito": carrito,
-                    "objetos": carrito.objetos.select_related("producto"),
-                    "shipping_cost": shipping_cost,
-                    "total_con_envio": total_con_envio,
+                    "carrito": resumen,
+                    "objetos": resumen.objetos,
+                    "shipping_cost": resumen.envio,
+                    "total_con_envio": resumen.total_con_envio,
                     "direcciones": direcciones,
+                    "clave_idempotencia": nueva_clave_idempotencia(),
                 },
             )
 
-        # 4) Crear pedido, detalles e inmediato "pago"
-        shipping_cost = 2990 if carrito.total > 0 else 0
-
-        pedido = Pedido.objects.create(
-            usuario=usuario,
-            total=carrito.total + shipping_cost,
-            estado="pagado",  # o "pendiente" si luego quieres otro flujo
-            direccion=direccion_texto,
-            envio=shipping_cost,
-        )
-
-        # Detalles del pedido + DESCUENTO DE STOCK
-        for obj in carrito.objetos.select_related("producto"):
-            producto = obj.producto
-
-            # Seguridad extra: si por alguna razón la cantidad supera stock aquí,
-            # cortamos el flujo y avisamos.
-            if obj.cantidad > producto.stock:
-                messages.error(
-                    request,
-                    f"No hay stock suficiente para '{producto.nombre}'. "
-                    f"Stock actual: {producto.stock}, en carrito: {obj.cantidad}."
-                )
-                # revertir pedido recién creado
-                pedido.delete()
-                return redirect("cart")
-
-            # Crear detalle
-            DetallePedido.objects.create(
-                pedido=pedido,
-                producto=producto,
-                cantidad=obj.cantidad,
-                precio_unitario=producto.precio,
-                subtotal=obj.subtotal,
+        # 4) Crear pedido, detalles, descuento de stock y "pago" (una transacción)
+        try:
+            pedido = crear_pedido_desde_lineas(
+                usuario,
+                [(obj.producto_id, obj.cantidad) for obj in resumen.objetos],
+                direccion=direccion_texto,
+                envio=resumen.envio,
+                estado="pagado",  # o "pendiente" si luego quieres otro flujo
+                metodo_pago="Pago en línea",
             )
-
-            # Descontar stock
-            producto.stock -= obj.cantidad
-            if producto.stock < 0:
-                producto.stock = 0
-            producto.save()
-
-        # Pago asociado
-        Pago.objects.create(
-            pedido=pedido,
-            monto=pedido.total,
-            metodo="Pago en línea",
-            estado="pagado",
-        )
+        except StockInsuficiente as e:
+            messages.error(request, str(e))
+            return redirect("cart")
 
         # Vaciar carrito
-        carrito.objetos.clear()
-        carrito.total = 0
-        carrito.save()
+        almacen.vaciar(usuario_id)
 
         messages.success(
             request,
@@ -793,82 +1005,47 @@ def checkout(request):
         return redirect("pedidos")
 
     # GET mostrar formulario de checkout
-    shipping_cost = 2990 if carrito.total > 0 else 0
-    total_con_envio = carrito.total + shipping_cost
-
     return render(
         request,
         "checkout.html",
         {
-            "carrito": carrito,
-            "objetos": carrito.objetos.select_related("producto"),
-            "shipping_cost": shipping_cost,
-            "total_con_envio": total_con_envio,
+            "carrito": resumen,
+            "objetos": resumen.objetos,
+            "shipping_cost": resumen.envio,
+            "total_con_envio": resumen.total_con_envio,
             "direcciones": direcciones,
+            "clave_idempotencia": nueva_clave_idempotencia(),
         },
     )
 
 #-----------PEDIDOS----------------
 
+@idempotente
 def crear_pedido(request):
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect("login")
-    
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
-    carrito = Carrito.objects.get(usuario=usuario)
-
-    if carrito.total == 0 or carrito.objetos.count() == 0:
-        return HttpResponse("Tu carrito está vacío")
-
-    direccion = request.POST.get("direccion", "").strip()
-    envio = 2990 if carrito.total > 0 else 0
+    usuario_id = usuario.idUsuario
 
-    # Crear pedido preliminar
-    pedido = Pedido.objects.create(
-        usuario=usuario,
-        total=carrito.total + envio,
-        estado="pagado",      # puedes cambiarlo a "pendiente"
-        # direccion=direccion,
-        # envio=envio,
-    )
-
-    # Validar stock antes de finalizar pedido
-    for obj in carrito.objetos.select_related("producto"):
-        producto = obj.producto
-
-        if obj.cantidad > producto.stock:
-            # Revertir pedido porque no hay stock suficiente
-            pedido.delete()
-            messages.error(
-                request,
-                f"No hay stock suficiente para '{producto.nombre}'. "
-                f"Disponible: {producto.stock}, solicitado: {obj.cantidad}."
-            )
-            return redirect("cart")
+    almacen = motor_carrito.almacen()
+    resumen = almacen.resumen(usuario_id)
 
-    # Crear detalles y descontar stock
-    for obj in carrito.objetos.select_related("producto"):
-        producto = obj.producto
+    if resumen.total == 0 or not resumen:
+        return HttpResponse("Tu carrito está vacío")
 
-        DetallePedido.objects.create(
-            pedido=pedido,
-            producto=producto,
-            cantidad=obj.cantidad,
-            precio_unitario=producto.precio,
-            subtotal=obj.subtotal,
+    try:
+        pedido = crear_pedido_desde_lineas(
+            usuario,
+            [(obj.producto_id, obj.cantidad) for obj in resumen.objetos],
+            envio=resumen.envio,
+            estado="pagado",      # puedes cambiarlo a "pendiente"
         )
-
-        # Descontar stock de forma segura
-        producto.stock -= obj.cantidad
-        if producto.stock < 0:
-            producto.stock = 0
-        producto.save()
+    except StockInsuficiente as e:
+        messages.error(request, str(e))
+        return redirect("cart")
 
     # Vaciar carrito
-    carrito.objetos.clear()
-    carrito.total = 0
-    carrito.save()
+    almacen.vaciar(usuario_id)
 
     messages.success(request, f"Tu pedido #{pedido.idPedido} se ha creado correctamente.")
     return redirect("pedidos")
@@ -878,23 +1055,50 @@ def pedidos_ver(request):
     if not usuario_id:
         return redirect("login")
     
-    pedidos = Pedido.objects.filter(usuario_id=usuario_id)
-    return render(request, "pedidos.html",{"pedidos": pedidos})
+    # Primero los pedidos recientes; al terminar se sigue con el archivo
+    # (todo lo archivado es más viejo que lo que queda en Pedido)
+    archivo = request.GET.get("fuente") == "archivo"
+    modelo = PedidoArchivado if archivo else Pedido
+
+    # Una consulta por página: el resumen de cada pedido está en la fila
+    page_obj = paginar(
+        request,
+        modelo.objects.filter(usuario_id=usuario_id),
+        ORDEN_PEDIDOS,
+        por_pagina=20,
+    )
+    ver_archivo = (
+        not archivo
+        and not page_obj.has_next
+        and motor_archivo.tiene_archivados(usuario_id)
+    )
+    return render(
+        request,
+        "pedidos.html",
+        {
+            "pedidos": page_obj,
+            "page_obj": page_obj,
+            "archivo": archivo,
+            "ver_archivo": ver_archivo,
+        },
+    )
 
 def pedido_detalle(request, pedido_id):
     usuario_id = request.session.get("usuario_id")
     if not usuario_id:
         return redirect("login")
 
-    pedido = Pedido.objects.get(idPedido=pedido_id)
-
     # seguridad: solo el dueño del pedido lo puede ver
-    if pedido.usuario.idUsuario != usuario_id:
-        return redirect("pedidos")
-
-    items = pedido.detalles.select_related("producto")
+    pedido = Pedido.objects.filter(idPedido=pedido_id, usuario_id=usuario_id).first()
+    if pedido is not None:
+        items = list(pedido.detalles.select_related("producto"))
+        pago = Pago.objects.filter(pedido=pedido).first()
+    else:
+        archivado = motor_archivo.pedido_archivado(pedido_id, usuario_id)
+        if archivado is None:
+            return redirect("pedidos")
+        pedido, items, pago = archivado
     subtotal = sum(item.subtotal for item in items)
-    pago = Pago.objects.filter(pedido=pedido).first()
 
     return render(
         request,
@@ -908,6 +1112,66 @@ def pedido_detalle(request, pedido_id):
     )
 
 
+def panel_ventas(request):
+    """Ventas del vendedor logueado por día, semana o mes (lee solo VentaDiaria)."""
+    vendedor = request.usuario
+    if not vendedor:
+        return redirect("login")
+    usuario_id = vendedor.idUsuario
+
+    if vendedor.rol != "vendedor":
+        return redirect("mi_perfil")
+
+    periodo = request.GET.get("periodo", "dia")
+    if periodo not in ventas.PERIODOS:
+        periodo = "dia"
+
+    contexto = ventas.resumen(usuario_id, periodo)
+    contexto.update({"vendedor": vendedor, "periodo": periodo})
+    return render(request, "panel_ventas.html", contexto)
+
+
+def exportar_ventas(request):
+    """
+    Descarga las ventas del vendedor logueado. Parámetros GET: ``formato``
+    ("csv" o "ndjson"), ``desde`` y ``hasta`` (AAAA-MM-DD, inclusive).
+    """
+    usuario = request.usuario
+    if not usuario:
+        return redirect("login")
+    usuario_id = usuario.idUsuario
+
+    if usuario.rol != "vendedor":
+        return HttpResponse("Solo los vendedores pueden exportar ventas.", status=403)
+
+    formato = request.GET.get("formato", "csv")
+    if formato not in exportacion.FORMATOS:
+        return HttpResponse("Formato no soportado.", status=400)
+    try:
+        desde, hasta = exportacion.rango_fechas(request.GET.get("desde"), request.GET.get("hasta"))
+    except ValueError:
+        return HttpResponse("Las fechas deben tener el formato AAAA-MM-DD.", status=400)
+
+    # Se genera mientras se envía: nunca está completa en memoria
+    contenido = exportacion.serializar(exportacion.filas(usuario_id, desde, hasta), formato)
+    comprimir = "gzip" in request.headers.get("Accept-Encoding", "")
+    if comprimir:
+        contenido = compress_sequence(contenido)
+
+    respuesta = StreamingHttpResponse(contenido, content_type=exportacion.FORMATOS[formato])
+    if comprimir:
+        respuesta["Content-Encoding"] = "gzip"
+    patch_vary_headers(respuesta, ("Accept-Encoding",))
+    respuesta["Content-Disposition"] = f'attachment; filename="ventas-{usuario_id}.{formato}"'
+    return respuesta
+
+
+@require_safe
+def media_servir(request, ruta):
+    """Archivos subidos (MEDIA_URL). Ver main/media.py."""
+    return media.respuesta(request, ruta)
+
+
 #-----------PAGOS----------------
 
 def pagar(request, pedido_id):
@@ -932,12 +1196,10 @@ def pagar(request, pedido_id):
 #-----------MENSAJES----------------
 
 def mensajes_ver(request):
-    usuario_id = request.session.get("usuario_id")
-    if not usuario_id:
+    usuario = request.usuario
+    if not usuario:
         return redirect("login")
 
-    usuario = Usuario.objects.get(idUsuario=usuario_id)
-
     recibidos = usuario.mensajes_recibidos.all()
     enviados = usuario.mensajes_enviados.all()
 
@@ -948,14 +1210,13 @@ def mensajes_ver(request):
 
 def mensaje_enviar(request):
     if request.method == "POST":
-        usuario_id = request.session.get("usuario_id")
-        if not usuario_id:
+        if not request.usuario:
             return redirect("login")
 
         form = MensajeForm(request.POST)
         if form.is_valid():
             nuevo = form.save(commit=False)
-            nuevo.emisor = Usuario.objects.get(idUsuario=usuario_id)
+            nuevo.emisor = request.usuario
             nuevo.save()
             return redirect("mensajes")
 